@@ -33,11 +33,13 @@ Usage:
            [--excl-non-isolcpus=<list>] [--namespace=<name>]
   cmk discover [--namespace=<name>] [--no-taint]
   cmk describe
-  cmk reconcile [--publish] [--interval=<seconds>] [--namespace=<name>]
-  cmk isolate [--socket-id=<num>] --pool=<pool> <command>
-              [-- <args>...][--no-affinity] [--namespace=<name>]
+  cmk reconcile [--publish] [--interval=<seconds>] [--heartbeat=<seconds>]
+                [--verify-start-time] [--namespace=<name>]
+  cmk isolate [--socket-id=<num>] [--numa-node=<num>] --pool=<pool>
+              <command> [-- <args>...][--no-affinity] [--namespace=<name>]
   cmk install [--install-dir=<dir>]
-  cmk node-report [--publish] [--interval=<seconds>] [--namespace=<name>]
+  cmk node-report [--publish] [--interval=<seconds>]
+                  [--heartbeat=<seconds>] [--namespace=<name>]
   cmk uninstall [--install-dir=<dir>] [--conf-dir=<dir>] [--namespace=<name>]
   cmk webhook [--conf-file=<file>] [--cafile=<file>] [--insecure=<bool>]
   cmk reconfigure [--node-name=<name>] [--num-exclusive-cores=<num>]
@@ -52,6 +54,8 @@ Usage:
                         [--install-dir=<dir>] [--saname=<name>]
                         [--namespace=<name>]
   cmk reaffinitize [--node-name=<name>] [--namespace=<name>]
+  cmk agent [--socket-path=<path>] [--socket-group=<group>]
+            [--flush-interval=<seconds>] [--namespace=<name>]
 
 Options:
   -h --help                    Show this screen.
@@ -69,6 +73,12 @@ Options:
   --install-dir=<dir>          CMK install directory [default: /opt/bin].
   --interval=<seconds>         Number of seconds to wait between rerunning.
                                If set to 0, will only run once. [default: 0]
+  --heartbeat=<seconds>        Number of seconds after which an unchanged
+                               report is published again. If set to 0,
+                               unchanged reports are never published again
+                               [default: 3600].
+  --verify-start-time          Also reclaim the cpu lists of processes whose
+                               pid has been reused by a new process.
   --num-exclusive-cores=<num>  Number of cores in exclusive pool. [default: 4].
   --num-shared-cores=<num>     Number of cores in shared pool. [default: 1].
   --pool=<pool>                Pool name: either infra, shared or exclusive.
@@ -85,6 +95,9 @@ Options:
   --socket-id=<num>            ID of socket where allocated core should come
                                from. If it's set to -1 then child command will
                                be assigned to any socket [default: -1].
+  --numa-node=<num>            ID of NUMA node where allocated core should
+                               come from. If it's set to -1 then child command
+                               will be assigned to any NUMA node [default: -1].
   --no-affinity                Do not set cpu affinity before forking the child
                                command. In this mode the user program is
                                responsible for reading the `CMK_CPUS_ASSIGNED`
@@ -105,9 +118,16 @@ Options:
                                authenticate using mutual TLS or not.
                                [default: False]
   --no-taint                   Don't taint Kubernetes nodes.
+  --socket-path=<path>         Path of the Unix domain socket the CMK agent
+                               listens on [default: /var/run/cmk/agent.sock].
+  --socket-group=<group>       Group, by name or ID, allowed to use the CMK
+                               agent socket besides the agent's user.
+  --flush-interval=<seconds>   Number of seconds between writes of the CMK
+                               agent's state to the Kubernetes API server
+                               [default: 1].
 """  # noqa: E501
 from intel import (
-    clusterinit, describe, discover, init, install,
+    agent, clusterinit, describe, discover, init, install,
     isolate, nodereport, reconcile, uninstall, webhook,
     reconfigure, reconfigure_setup, reaffinitize)
 from docopt import docopt
@@ -153,12 +173,15 @@ def main():
                         args["<command>"],
                         args["<args>"],
                         args["--namespace"],
-                        args["--socket-id"])
+                        args["--socket-id"],
+                        args["--numa-node"])
         return
     if args["reconcile"]:
         reconcile.reconcile(int(args["--interval"]),
                             args["--publish"],
-                            args["--namespace"])
+                            args["--namespace"],
+                            int(args["--heartbeat"]),
+                            args["--verify-start-time"])
         return
     if args["install"]:
         install.install(args["--install-dir"])
@@ -171,7 +194,8 @@ def main():
     if args["node-report"]:
         nodereport.nodereport(int(args["--interval"]),
                               args["--publish"],
-                              args["--namespace"])
+                              args["--namespace"],
+                              int(args["--heartbeat"]))
         return
     if args["webhook"]:
         webhook.webhook(args["--conf-file"], args["--cafile"],
@@ -205,6 +229,11 @@ def main():
         reaffinitize.reaffinitize(args["--node-name"], args["--namespace"])
         return
 
+    if args["agent"]:
+        agent.agent(args["--namespace"], args["--socket-path"],
+                    args["--flush-interval"], args["--socket-group"])
+        return
+
 
 def setup_logging():
     level = os.getenv("CMK_LOG_LEVEL", logging.INFO)
@@ -0,0 +1,369 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import grp
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+
+from . import allocator, config, k8s
+
+# The agent is a long running, per node process that owns the CMK
+# configuration of its node in memory. `cmk isolate` asks it for cpu lists
+# over a Unix domain socket and is answered from memory, instead of locking
+# and rewriting the configmap itself. Changes are written back to the
+# configmap in batches, every flush interval. When the agent socket is not
+# available, isolate falls back to updating the configmap directly, with
+# the same allocator.
+
+ENV_AGENT_SOCKET = "CMK_AGENT_SOCKET"
+DEFAULT_SOCKET_PATH = "/var/run/cmk/agent.sock"
+
+# Seconds a client waits for the agent to answer a request.
+CLIENT_TIMEOUT = 10
+
+# Seconds between re-reads of the configmap when there is nothing to
+# flush, so that changes made by other writers (e.g. reconcile) are picked
+# up.
+REFRESH_INTERVAL = 30
+
+# Exception types that the agent reports back to clients by name, so that
+# isolate fails the same way whether or not the agent is used.
+ERRORS = {
+    "KeyError": KeyError,
+    "ValueError": ValueError,
+    "SystemError": SystemError
+}
+
+ADD = "add"
+REMOVE = "remove"
+
+
+class AgentError(RuntimeError):
+    pass
+
+
+def agent(namespace, socket_path, flush_interval, socket_group=None):
+    pod_name = os.environ["HOSTNAME"]
+    node_name = k8s.get_node_from_pod(None, pod_name)
+    configmap_name = "cmk-config-{}".format(node_name)
+    c = config.Config(configmap_name, "{}-agent".format(pod_name), namespace,
+                      cache=True)
+
+    state = AgentState(c)
+    state.refresh()
+
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = AgentServer(socket_path, state, socket_group)
+    flusher = threading.Thread(target=state.run,
+                               args=(float(flush_interval),), daemon=True)
+    flusher.start()
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+
+    logging.info("CMK agent for configmap {} listening on {}"
+                 .format(configmap_name, socket_path))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        state.stop()
+        flusher.join()
+        # Persist whatever is still pending before exiting.
+        state.flush()
+        os.unlink(socket_path)
+
+
+class AgentState:
+    def __init__(self, c):
+        self.config = c
+        # The node's configuration as served to isolate, an
+        # intel.config.Conf, and the allocators of its pools, which keep
+        # their free lists across requests.
+        self.conf = None
+        self.allocators = {}
+        # Mutations applied to self.conf that are not written yet.
+        self.pending = []
+        self.mutex = threading.Lock()
+        self.flush_mutex = threading.Lock()
+        self.stopped = threading.Event()
+        self.last_refresh = 0
+
+    # Allocations are answered from memory and written with the next
+    # flush.
+    def allocate(self, pool_name, pid, n_cpus, socket_id, policy=None,
+                 numa_node=None, local_cpus=None, start_time=None):
+        with self.mutex:
+            result = allocator.allocate(self.conf, pool_name, pid, n_cpus,
+                                        socket_id, policy, numa_node,
+                                        local_cpus, start_time,
+                                        self.allocators)
+            self.pending.append(Mutation(ADD, pool_name, result["cpuLists"],
+                                         pid, start_time))
+            return result
+
+    def release(self, pool_name, clists, pid):
+        with self.mutex:
+            allocator.release(self.conf, pool_name, clists, pid,
+                              self.allocators)
+            self.pending.append(Mutation(REMOVE, pool_name, clists, pid))
+
+    def run(self, flush_interval):
+        while not self.stopped.wait(flush_interval):
+            if self.pending:
+                self.flush()
+            elif time.monotonic() - self.last_refresh > REFRESH_INTERVAL:
+                try:
+                    self.refresh()
+                except (Exception, SystemExit) as err:
+                    logging.error("Error while reading the CMK "
+                                  "configuration: {}".format(err))
+                    k8s.reset_clients()
+
+    def stop(self):
+        self.stopped.set()
+
+    def refresh(self):
+        # Re-reads the configmap, keeping the mutations that are not
+        # written yet.
+        with self.flush_mutex:
+            self._refresh()
+
+    def _refresh(self):
+        conf = config.get_config(self.config.cm_name,
+                                 self.config.cm_namespace, cache=True)
+        self._replace(conf, 0)
+
+    def flush(self):
+        # Writes all pending mutations to the configmap in one locked
+        # update. The mutations are replayed on the configmap as read under
+        # the lock, so changes made by other writers since the last flush
+        # are kept, and the result becomes the agent's configuration. If
+        # the write fails, the configmap is re-read and the mutations are
+        # kept for the next flush.
+        with self.flush_mutex:
+            with self.mutex:
+                batch = list(self.pending)
+            if not batch:
+                return
+
+            try:
+                self.config.lock()
+                conf = self.config.c_data
+                try:
+                    for mutation in batch:
+                        mutation.apply(conf)
+                finally:
+                    self.config.unlock(merged=len(batch))
+            except (Exception, SystemExit) as err:
+                logging.error("Error while persisting agent state: {}"
+                              .format(err))
+                k8s.reset_clients()
+                try:
+                    self._refresh()
+                except (Exception, SystemExit) as err:
+                    logging.error("Error while reading the CMK "
+                                  "configuration: {}".format(err))
+                return
+
+            logging.debug("Persisted {} agent mutations".format(len(batch)))
+            self._replace(conf, len(batch))
+
+    def _replace(self, conf, n_flushed):
+        # Swaps in freshly read state, replaying the mutations that were
+        # not part of it.
+        with self.mutex:
+            self.pending = self.pending[n_flushed:]
+            for mutation in self.pending:
+                mutation.apply(conf)
+            self.conf = conf
+            self.allocators = {}
+            self.last_refresh = time.monotonic()
+
+
+class Mutation:
+    def __init__(self, op, pool_name, clists, pid, start_time=None):
+        self.op = op
+        self.pool_name = pool_name
+        self.clists = clists
+        self.pid = pid
+        self.start_time = start_time
+
+    def apply(self, conf):
+        # Replays the mutation on conf, as read from the configmap.
+        if self.pool_name not in conf.get_pools():
+            logging.error("Pool {} of task {} does not exist anymore"
+                          .format(self.pool_name, self.pid))
+            return
+        pool = conf.get_pool(self.pool_name)
+        if self.op == REMOVE:
+            for cl in self.clists:
+                pool.remove_task(cl, self.pid)
+            return
+
+        if self.start_time is not None:
+            conf.release_stale_task(self.pid, self.start_time)
+        for cl in self.clists:
+            core_list = pool.get_core_list(cl)
+            if core_list is None:
+                logging.error("Cpu list {} of task {} does not exist anymore"
+                              .format(cl, self.pid))
+                continue
+            if pool.is_exclusive() and not core_list.is_free() and \
+                    not core_list.has_task(self.pid):
+                logging.warning("Exclusive cpu list {} of task {} is also "
+                                "assigned to {}".format(cl, self.pid,
+                                                        core_list.tasks))
+            core_list.add_task(self.pid)
+        if self.start_time is not None:
+            conf.set_task_start_time(self.pid, self.start_time)
+
+
+class AgentServer(socketserver.ThreadingMixIn,
+                  socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, state, group=None):
+        self.state = state
+        socketserver.UnixStreamServer.__init__(self, socket_path,
+                                               AgentRequestHandler)
+        # Only the agent's user, and the members of group if one is given,
+        # may allocate and release cpu lists.
+        if group is None:
+            os.chmod(socket_path, 0o600)
+        else:
+            os.chown(socket_path, -1, get_gid(group))
+            os.chmod(socket_path, 0o660)
+
+
+# Returns the id of the group, given by name or id.
+def get_gid(group):
+    if str(group).isdigit():
+        return int(group)
+    try:
+        return grp.getgrnam(group).gr_gid
+    except KeyError:
+        raise ValueError("Unknown group {}".format(group))
+
+
+class AgentRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        try:
+            request = json.loads(line.decode("utf-8"))
+            response = self.dispatch(request)
+        except (KeyError, ValueError, SystemError) as err:
+            response = {
+                "ok": False,
+                "errorType": type(err).__name__,
+                "error": err.args[0] if err.args else str(err)
+            }
+        except Exception as err:
+            logging.error("Error handling agent request: {}".format(err))
+            response = {"ok": False, "error": str(err)}
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+    def dispatch(self, request):
+        state = self.server.state
+        op = request["op"]
+        if op == "allocate":
+            response = state.allocate(request["pool"], request["pid"],
+                                      int(request["numCores"]),
+                                      request["socketId"],
+                                      request.get("policy"),
+                                      request.get("numaNode"),
+                                      request.get("localCpus"),
+                                      request.get("startTime"))
+        elif op == "release":
+            state.release(request["pool"], request["cpuLists"],
+                          request["pid"])
+            response = {}
+        else:
+            raise ValueError("Unknown agent operation {}".format(op))
+        response["ok"] = True
+        return response
+
+
+def get_socket_path():
+    return os.environ.get(ENV_AGENT_SOCKET, DEFAULT_SOCKET_PATH)
+
+
+# Sends request to the agent and returns its response, or None if no agent
+# is listening on this node.
+def request(req):
+    path = get_socket_path()
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CLIENT_TIMEOUT)
+    try:
+        try:
+            sock.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError,
+                PermissionError) as err:
+            logging.info("CMK agent not available on {}: {}"
+                         .format(path, err))
+            return None
+        sock.sendall(json.dumps(req).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    finally:
+        sock.close()
+
+    if not line:
+        raise AgentError("CMK agent closed the connection")
+    response = json.loads(line.decode("utf-8"))
+    if not response["ok"]:
+        error = ERRORS.get(response.get("errorType"), AgentError)
+        raise error(response["error"])
+    return response
+
+
+# Asks the agent for cpu lists from the pool. Returns None if there is no
+# agent, otherwise the allocation as described by allocator.allocation().
+def allocate(pool_name, pid, n_cpus, socket_id, policy=None,
+             numa_node=None, local_cpus=None, start_time=None):
+    return request({
+        "op": "allocate",
+        "pool": pool_name,
+        "pid": pid,
+        "numCores": n_cpus,
+        "socketId": socket_id,
+        "policy": policy,
+        "numaNode": numa_node,
+        "localCpus": local_cpus,
+        "startTime": start_time
+    })
+
+
+# Returns cpu lists to the agent. Returns False if there is no agent.
+def release(pool_name, clists, pid):
+    return request({
+        "op": "release",
+        "pool": pool_name,
+        "cpuLists": clists,
+        "pid": pid
+    }) is not None
@@ -0,0 +1,472 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import logging
+import random
+import subprocess
+
+from . import topology
+from .cpuset import CpuSet
+
+
+SOCKET_AWARE_POOLS = ["exclusive", "shared", "exclusive-non-isolcpus"]
+
+DEFAULT_POLICY = "first-fit"
+
+# Placement policy of each pool, if not DEFAULT_POLICY.
+POOL_POLICIES = {
+    "shared": "random",
+    "infra": "random"
+}
+
+
+# Assigns cpu lists of the pool 'pool_name' in conf (an intel.config.Conf)
+# to the task pid. start_time is the start time of the task's process, if
+# known: cpu lists still held by an earlier process with the same pid are
+# released first. allocators maps pool names to the Allocator of the pool,
+# for callers that keep conf across requests (the agent); allocators are
+# added to it as needed. Returns the allocation, see allocation().
+def allocate(conf, pool_name, pid, n_cpus=1, socket_id=None, policy=None,
+             numa_node=None, local_cpus=None, start_time=None,
+             allocators=None):
+    check_pool(conf, pool_name)
+    if allocators is None:
+        allocators = {}
+    if start_time is not None:
+        for pool, clist in conf.release_stale_task(pid, start_time):
+            logging.info("Released cpu list {} of pool {} held by an earlier "
+                         "task with pid {}".format(clist, pool, pid))
+            if pool in allocators:
+                allocators[pool].relist([clist])
+    a = get_allocator(conf, pool_name, allocators)
+    clists = a.allocate(pid, n_cpus, requested_socket(pool_name, socket_id),
+                        policy, requested_numa_node(pool_name, numa_node),
+                        local_cpus)
+    if start_time is not None:
+        conf.set_task_start_time(pid, start_time)
+    return allocation(conf, a, clists)
+
+
+# Returns the cpu lists of the pool assigned to the task pid.
+def release(conf, pool_name, clists, pid, allocators=None):
+    check_pool(conf, pool_name)
+    a = (allocators or {}).get(pool_name)
+    if a is not None:
+        a.release(pid, clists)
+        return
+    pool = conf.get_pool(pool_name)
+    for clist in clists:
+        pool.remove_task(clist, pid)
+
+
+def get_allocator(conf, pool_name, allocators):
+    if pool_name not in allocators:
+        allocators[pool_name] = Allocator(conf.get_pool(pool_name))
+    return allocators[pool_name]
+
+
+# Describes the cpu lists just assigned by the allocator a: their names,
+# the placement reported by the policy, their locality to the requested
+# cpus (if any) with the cpu lists that are not local, and the advertised
+# shared and infra cpu lists.
+def allocation(conf, a, clists):
+    return {
+        "cpuLists": clists,
+        "placement": a.placement,
+        "locality": a.locality,
+        "remoteCpuLists": a.remote,
+        "advertised": advertised_cpu_lists(conf)
+    }
+
+
+def check_pool(conf, pool_name):
+    if pool_name not in conf.get_pools():
+        raise KeyError("Requested pool {} does not exist"
+                       .format(pool_name))
+
+
+# Returns the socket to allocate from, or None for any socket.
+def requested_socket(pool_name, socket_id):
+    if socket_id == "-1" or pool_name not in SOCKET_AWARE_POOLS:
+        return None
+    return socket_id
+
+
+# Returns the NUMA node to allocate from, or None for any NUMA node.
+def requested_numa_node(pool_name, numa_node):
+    if numa_node is None or str(numa_node) == "-1" or \
+            pool_name not in SOCKET_AWARE_POOLS:
+        return None
+    return int(numa_node)
+
+
+# Returns the cpu lists of the shared and infra pools, which isolate
+# advertises to every task regardless of its own pool.
+def advertised_cpu_lists(conf):
+    result = {}
+    for pool_name in ["shared", "infra"]:
+        if pool_name in conf.get_pools():
+            pool = conf.get_pool(pool_name)
+            result[pool_name] = [cl.core_id for cl in pool.get_core_lists()]
+    return result
+
+
+def get_policy(name):
+    try:
+        return POLICIES[name]
+    except KeyError:
+        raise ValueError("Unknown allocation policy {}".format(name))
+
+
+def core_list_key(core_id):
+    # Orders cpu lists by their lowest cpu id.
+    return CpuSet.parse(core_id).min()
+
+
+class Allocator:
+    # Allocates the cpu lists of a single intel.config.Pool. The free cpu
+    # lists of each socket are kept sorted by core_list_key, so the
+    # policies can take the lowest free cpu lists without scanning or
+    # sorting the whole pool. Tasks are recorded in the pool itself, so
+    # its indexes stay consistent.
+
+    def __init__(self, pool, policy=None):
+        self.pool = pool
+        if policy is None:
+            policy = POOL_POLICIES.get(pool.name, DEFAULT_POLICY)
+        self.policy = self._get_policy(policy)
+        # How the last allocation was placed, as reported by the policy.
+        self.placement = None
+        # cpu id -> intel.topology.CPU, loaded on first use.
+        self.cpus = None
+        # NUMA node the current allocation is restricted to.
+        self.numa_node = None
+        # Ids of the cpus the current allocation prefers, e.g. the cpus
+        # local to a PCI device.
+        self.local_cpus = None
+        # Whether the last allocation is "local", "partial" or "remote" to
+        # the preferred cpus, and its cpu lists that are not local to them.
+        self.locality = None
+        self.remote = []
+        # cpu list -> set of its cpu ids
+        self.cpu_ids = {}
+        # socket id -> all cpu lists of the socket, sorted by
+        # core_list_key.
+        self.ordered = {}
+        # socket id -> sorted list of (key, cpu list). Entries of cpu lists
+        # that were allocated since are dropped lazily.
+        self.free = {}
+        # socket id -> cpu lists with an entry in self.free[socket id]
+        self.listed = {}
+        for socket_id in pool.get_sockets():
+            free = pool.get_socket(socket_id).free_core_lists
+            self.free[socket_id] = sorted(
+                (core_list_key(cl), cl) for cl in free)
+            self.listed[socket_id] = set(free)
+
+    def _get_policy(self, policy):
+        return get_policy(policy) if isinstance(policy, str) else policy
+
+    def get_sockets(self, socket_id=None):
+        if socket_id is None:
+            return list(self.free)
+        # Socket ids given on the command line are strings, while the
+        # configuration may hold integers.
+        for s in self.free:
+            if str(s) == str(socket_id):
+                return [s]
+        raise KeyError(socket_id)
+
+    def count_free(self, sockets):
+        if self.numa_node is not None or self.local_cpus is not None:
+            return sum(1 for s in sockets for _ in self.free_core_lists(s))
+        return sum(self.pool.count_free_core_lists(s) for s in sockets)
+
+    def is_candidate(self, cl):
+        # Whether the cpu list is on the requested NUMA node and local to
+        # the preferred cpus, if any.
+        if self.numa_node is not None and \
+                self.get_numa_node(cl) != self.numa_node:
+            return False
+        return self.local_cpus is None or self.is_local(cl, self.local_cpus)
+
+    def is_local(self, cl, local_cpus):
+        if cl not in self.cpu_ids:
+            self.cpu_ids[cl] = CpuSet.parse(cl)
+        return self.cpu_ids[cl] <= local_cpus
+
+    def free_core_lists(self, socket_id):
+        # Yields the free cpu lists of the socket, lowest first.
+        free = self.free[socket_id]
+        available = self.pool.get_socket(socket_id).free_core_lists
+        stale = 0
+        while stale < len(free) and free[stale][1] not in available:
+            self.listed[socket_id].discard(free[stale][1])
+            stale += 1
+        del free[:stale]
+        return (cl for _, cl in free
+                if cl in available and self.is_candidate(cl))
+
+    def ordered_core_lists(self, socket_id):
+        if socket_id not in self.ordered:
+            self.ordered[socket_id] = sorted(
+                self.pool.get_socket(socket_id).get_core_lists(),
+                key=core_list_key)
+        return self.ordered[socket_id]
+
+    def get_cpus(self):
+        # Returns the cpus of the node by id, or an empty dict if the
+        # topology cannot be read.
+        if self.cpus is None:
+            try:
+                self.cpus = topology.parse(topology.lscpu()).get_cpus()
+            except (OSError, ValueError,
+                    subprocess.CalledProcessError) as err:
+                logging.warning("CPU topology not available, placing "
+                                "cpu lists without it: {}".format(err))
+                self.cpus = {}
+        return self.cpus
+
+    def get_cache_domain(self, cl):
+        # Returns the (L2, L3) cache ids of the cpu list.
+        cpu = self.get_cpus().get(core_list_key(cl))
+        if cpu is None:
+            return (None, None)
+        return (cpu.l2, cpu.l3)
+
+    def get_numa_node(self, cl):
+        cpu = self.get_cpus().get(core_list_key(cl))
+        return None if cpu is None else cpu.numa_node
+
+    def allocate(self, pid, n_cpus=1, socket_id=None, policy=None,
+                 numa_node=None, local_cpus=None):
+        # 'policy' overrides the allocator's policy for this request. Only
+        # exclusive pools can be placed by request; tasks in the other
+        # pools share their cpu lists anyway.
+        # Cpu lists local to 'local_cpus' are taken first, others only once
+        # the local ones are exhausted.
+        if policy is None or not self.pool.is_exclusive():
+            policy = self.policy
+        else:
+            policy = self._get_policy(policy)
+        sockets = self.get_sockets(socket_id)
+        if numa_node is not None and \
+                not any(c.numa_node is not None
+                        for c in self.get_cpus().values()):
+            raise SystemError("NUMA topology is not available")
+
+        self.numa_node = numa_node
+        try:
+            if self.pool.is_exclusive():
+                if n_cpus < 1:
+                    raise ValueError("Requested numbers of cores "
+                                     "must be positive integer")
+                if self.count_free(sockets) < n_cpus:
+                    raise SystemError("Not enough free cpu lists in pool {}"
+                                      .format(self.pool.name))
+
+            self.placement = None
+            self.locality = None
+            self.remote = []
+            clists = []
+            if local_cpus is not None:
+                local_cpus = CpuSet(local_cpus)
+                clists = self.allocate_local(pid, n_cpus, sockets, policy,
+                                             local_cpus)
+            if not clists or \
+                    (self.pool.is_exclusive() and len(clists) < n_cpus):
+                placement = self.placement
+                try:
+                    clists += self.assign(
+                        pid, policy(self, n_cpus - len(clists), sockets))
+                except Exception:
+                    self.release(pid, clists)
+                    raise
+                # The placement of the local cpu lists, if there are any.
+                self.placement = placement or self.placement
+        finally:
+            self.numa_node = None
+            self.local_cpus = None
+        if local_cpus is not None:
+            self.remote = [cl for cl in clists
+                           if not self.is_local(cl, local_cpus)]
+            if not self.remote:
+                self.locality = "local"
+            elif len(self.remote) < len(clists):
+                self.locality = "partial"
+            else:
+                self.locality = "remote"
+        return clists
+
+    def allocate_local(self, pid, n_cpus, sockets, policy, local_cpus):
+        # Assigns as many of the requested cpu lists as are free and local
+        # to local_cpus.
+        self.local_cpus = local_cpus
+        try:
+            if self.pool.is_exclusive():
+                n_cpus = min(n_cpus, self.count_free(sockets))
+                if n_cpus == 0:
+                    return []
+            try:
+                return self.assign(pid, policy(self, n_cpus, sockets))
+            except SystemError:
+                # No local cpu list in a shared pool.
+                return []
+        finally:
+            self.local_cpus = None
+
+    def assign(self, pid, clists):
+        if not clists:
+            raise SystemError("No free cpu lists in pool {}"
+                              .format(self.pool.name))
+        for cl in clists:
+            self.pool.update_clist(cl, pid)
+        return clists
+
+    def release(self, pid, clists):
+        for cl in clists:
+            self.pool.remove_task(cl, pid)
+        self.relist(clists)
+
+    def relist(self, clists):
+        # Puts the cpu lists that became free back on the free lists.
+        for cl in clists:
+            socket_id = self.pool.core_list_sockets.get(cl)
+            if socket_id is None:
+                continue
+            if cl in self.pool.get_socket(socket_id).free_core_lists and \
+                    cl not in self.listed[socket_id]:
+                bisect.insort(self.free[socket_id], (core_list_key(cl), cl))
+                self.listed[socket_id].add(cl)
+
+
+# Placement policies. A policy is called with the allocator, the number of
+# cpu lists requested and the sockets to choose from, and returns the names
+# of the cpu lists to assign. Policies only choose, the allocator records
+# the assignment.
+
+def first_fit(allocator, n_cpus, sockets):
+    # The free cpu lists with the lowest cpu ids, filling one socket after
+    # the other.
+    clists = []
+    for socket_id in sockets:
+        for cl in allocator.free_core_lists(socket_id):
+            clists.append(cl)
+            if len(clists) == n_cpus:
+                return clists
+    return clists
+
+
+def spread(allocator, n_cpus, sockets):
+    # Distributes the cpu lists over the sockets, starting with the socket
+    # that has the most free cpu lists.
+    sockets = sorted(sockets, key=lambda s: -allocator.count_free([s]))
+    free = [allocator.free_core_lists(s) for s in sockets]
+    clists = []
+    while free and len(clists) < n_cpus:
+        for it in list(free):
+            cl = next(it, None)
+            if cl is None:
+                free.remove(it)
+                continue
+            clists.append(cl)
+            if len(clists) == n_cpus:
+                break
+    return clists
+
+
+def random_choice(allocator, n_cpus, sockets):
+    # NOTE(CD): This allocation algorithm is probably an
+    # oversimplification, however for known use cases the non-exclusive
+    # pools should never have more than one cpu list anyhow.
+    # If that ceases to hold in the future, we could explore population
+    # or load-based spreading. Keeping it simple for now.
+    pool = allocator.pool
+    core_lists = [cl for s in sockets
+                  for cl in pool.get_socket(s).get_core_lists()
+                  if allocator.is_candidate(cl)]
+    if not core_lists:
+        raise SystemError("No cpu lists in pool {}".format(pool.name))
+    return [random.choice(core_lists)]
+
+
+def topology_aware(allocator, n_cpus, sockets):
+    # Prefers, in this order:
+    # - "contiguous": adjacent cpu lists of one socket and NUMA node
+    #   sharing a L3 cache, with as few L2 caches as possible,
+    # - "cache": cpu lists of one NUMA node sharing a L3 cache,
+    # - "numa": cpu lists of a single NUMA node,
+    # - "socket": cpu lists of a single socket,
+    # and falls back to first fit ("any") if none of these is available.
+    known = bool(allocator.get_cpus())
+    domain = allocator.get_cache_domain
+    node = allocator.get_numa_node
+
+    best = None
+    for socket_id in sockets:
+        ordered = allocator.ordered_core_lists(socket_id)
+        free = allocator.pool.get_socket(socket_id).free_core_lists
+        run = 0
+        for i, cl in enumerate(ordered):
+            run = run + 1 if cl in free and allocator.is_candidate(cl) else 0
+            if run < n_cpus:
+                continue
+            window = ordered[i - n_cpus + 1:i + 1]
+            caches = [domain(c) for c in window]
+            if len({l3 for _, l3 in caches}) > 1 or \
+                    len({node(c) for c in window}) > 1:
+                continue
+            n_l2 = len({l2 for l2, _ in caches})
+            if best is None or n_l2 < best[0]:
+                best = (n_l2, window)
+    if best is not None:
+        allocator.placement = "contiguous"
+        return best[1]
+
+    if known:
+        caches = {}
+        nodes = {}
+        for socket_id in sockets:
+            for cl in allocator.free_core_lists(socket_id):
+                key = (socket_id, node(cl))
+                caches.setdefault(key + (domain(cl)[1],), []).append(cl)
+                nodes.setdefault(key, []).append(cl)
+        for placement, groups in [("cache", caches), ("numa", nodes)]:
+            fits = [g for g in groups.values() if len(g) >= n_cpus]
+            if fits:
+                # The smallest group that fits, to keep larger ones
+                # available. Cpu lists sharing a L2 cache are kept together.
+                group = min(fits, key=len)
+                group.sort(key=lambda cl: (domain(cl)[0] or 0,
+                                           core_list_key(cl)))
+                allocator.placement = placement
+                return group[:n_cpus]
+
+    fits = [s for s in sockets if allocator.count_free([s]) >= n_cpus]
+    if fits:
+        socket_id = min(fits, key=lambda s: allocator.count_free([s]))
+        allocator.placement = "socket"
+        return first_fit(allocator, n_cpus, [socket_id])
+
+    allocator.placement = "any"
+    return first_fit(allocator, n_cpus, sockets)
+
+
+POLICIES = {
+    "first-fit": first_fit,
+    "spread": spread,
+    "random": random_choice,
+    "topology": topology_aware
+}
@@ -40,7 +40,8 @@ def cluster_init(host_list, all_hosts, cmd_list, cmk_img, cmk_img_pol,
 
     # Check if all the flag values passed are valid.
     # Check if cmk_cmd_list is valid.
-    valid_cmd_list = ["init", "discover", "install", "reconcile", "nodereport"]
+    valid_cmd_list = ["init", "discover", "install", "reconcile", "nodereport",
+                      "agent"]
     for cmk_cmd in cmk_cmd_list:
         if cmk_cmd not in valid_cmd_list:
             raise RuntimeError("CMK command should be one of {}"
@@ -151,6 +152,8 @@ def run_cmd_pods(cmd_list, cmd_init_list, cmk_img, cmk_img_pol,
                 args = ("/cmk/cmk.py isolate --pool=infra --namespace={} /cmk/cmk.py -- reconcile --interval=5 --publish --namespace={}").format(namespace, namespace)  # noqa: E501
             elif cmd == "nodereport":
                 args = ("/cmk/cmk.py isolate --pool=infra --namespace={} /cmk/cmk.py -- node-report --interval=5 --publish --namespace={}").format(namespace, namespace)  # noqa: E501
+            elif cmd == "agent":
+                args = ("/cmk/cmk.py agent --namespace={}").format(namespace)
 
             update_pod_with_container(pod, cmd, cmk_img, cmk_img_pol, args)
     elif cmd_init_list:
@@ -521,6 +524,13 @@ def get_default_webhook_mutations_config():
                                 "path": "/proc"
                             }
                         },
+                        {
+                            "name": "cmk-agent-dir",
+                            "hostPath": {
+                                "path": "/var/run/cmk",
+                                "type": "DirectoryOrCreate"
+                            }
+                        },
                         {
                             "name": "cmk-install-dir",
                             "hostPath": {
@@ -535,6 +545,22 @@ def get_default_webhook_mutations_config():
                     {
                         "name": "CMK_PROC_FS",
                         "value": "/host/proc"
+                    },
+                    {
+                        "name": "NODE_NAME",
+                        "valueFrom": {
+                            "fieldRef": {
+                                "fieldPath": "spec.nodeName"
+                            }
+                        }
+                    },
+                    {
+                        "name": "POD_NAMESPACE",
+                        "valueFrom": {
+                            "fieldRef": {
+                                "fieldPath": "metadata.namespace"
+                            }
+                        }
                     }
                 ],
                 "volumeMounts": [
@@ -543,6 +569,11 @@ def get_default_webhook_mutations_config():
                         "mountPath": "/host/proc",
                         "readOnly": True
                     },
+                    {
+                        "name": "cmk-agent-dir",
+                        "mountPath": "/var/run/cmk",
+                        "readOnly": True
+                    },
                     {
                         "name": "cmk-install-dir",
                         "mountPath": "/opt/bin",
@@ -1,11 +1,16 @@
-from . import clusterinit, k8s
-from kubernetes import client as k8sclient
-from kubernetes.client.rest import ApiException as K8sApiException
+import json
 import logging
+import random
 import sys
-import yaml
 import time
-import random
+from http import client
+
+import yaml
+from kubernetes import client as k8sclient
+from kubernetes.client.rest import ApiException as K8sApiException
+
+from intel.cpuset import CpuSet
+from . import clusterinit, k8s
 
 
 exclusivity = {
@@ -15,15 +20,49 @@ exclusivity = {
     "infra": False
 }
 
+# Bounds (in seconds) of the randomized exponential backoff used after
+# losing a lock race, and the server side timeout of the watch used while
+# waiting for the current owner to release the lock.
+LOCK_BACKOFF_BASE = 0.01
+LOCK_BACKOFF_CAP = 1.0
+LOCK_WATCH_TIMEOUT = 5
+
+# Parsed configmap data, keyed by configmap name. Each entry is a
+# (resourceVersion, data) pair; the data is only reused while the
+# resourceVersion matches, i.e. while the configmap is unchanged.
+_parsed_configs = {}
+
+# Version of the encoding written by encode_config(). Configmaps written by
+# older releases hold YAML, which is still read.
+CONFIG_VERSION = 2
+
+# The libyaml based loader is much faster than the pure Python one, but is
+# only available if PyYAML was built against libyaml.
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Configmap writes made by this process: the number of patches sent, the
+# number of writes avoided by skipping unchanged data or by merging several
+# mutations into one patch, and the size of the patch bodies.
+write_stats = {
+    "writes": 0,
+    "writesSaved": 0,
+    "bytesSent": 0
+}
+
 
 class Config:
 
-    def __init__(self, cm_name, owner, cm_namespace):
+    def __init__(self, cm_name, owner, cm_namespace, cache=False):
         self.c = None
         self.c_data = None
         self.cm_name = cm_name
         self.owner = owner
         self.cm_namespace = cm_namespace
+        self.cache = cache
+        self.lock_wait_time = None
+        self.lock_hold_time = None
+        self._locked_at = None
+        self._read_data = None
 
     def lock(self):
         # The lock function is used to avoid two isolate
@@ -33,55 +72,138 @@ class Config:
         # the configmap's 'owner' annotation with the name of the
         # pod updating it. If the the 'owner' annotation is not
         # an empty string then the configmap is considered
-        # 'locked'
-
-        # The sleep is added in case multiple pods are created at
-        # the same time so they don't try and claim the configmap at
-        # the same time
-        time.sleep(random.random())
+        # 'locked'.
+        #
+        # Ownership is taken with a patch that carries the resourceVersion
+        # that was read, so the API server rejects it with 409 Conflict if
+        # anybody else changed the configmap in the meantime. While the
+        # configmap is owned by someone else we wait on a watch of the
+        # configmap instead of polling it.
+        start = time.monotonic()
+        attempt = 0
         while True:
-            try:
-                c = k8s.get_config_map(None, self.cm_name, self.cm_namespace)
-                owner = c.metadata.annotations["Owner"]
-                if owner != "":
-                    time.sleep(1)
-                    continue
-                else:
-                    c.metadata.annotations["Owner"] = self.owner
-                    try:
-                        k8s.patch_config_map(None, self.cm_name,
-                                             c, self.cm_namespace)
-                    except K8sApiException as err:
-                        logging.error("Error while retreiving configmap {}"
-                                      .format(self.cm_name))
-                        logging.error(err.reason)
-                        sys.exit(1)
-
-                self.c = c
-                self.c_data = build_config(yaml.safe_load(c.data["config"]))
-                break
-            except K8sApiException as err:
-                logging.error("Error while retreiving configmap {}"
-                              .format(self.cm_name))
-                logging.error(err.reason)
-                sys.exit(1)
+            c = self._read()
+            if get_owner(c) == "":
+                locked = self._try_acquire(c)
+                if locked is not None:
+                    break
+                # Lost the race to another owner, back off before retrying.
+                time.sleep(lock_backoff(attempt))
+                attempt += 1
+            else:
+                self._wait_for_release(c)
+
+        self._locked_at = time.monotonic()
+        self.lock_wait_time = self._locked_at - start
+        logging.debug("Acquired lock on configmap {} after {:.3f}s ({} "
+                      "conflicts)".format(self.cm_name, self.lock_wait_time,
+                                          attempt))
+        # Taking ownership only changed the annotation, so the data of the
+        # configmap as read before the patch is still current.
+        self.c = locked
+        self._read_data = parse_configmap(c, self.cache)
+        self.c_data = build_config(self._read_data)
+
+    def _read(self):
+        try:
+            c = k8s.get_config_map(None, self.cm_name, self.cm_namespace)
+        except K8sApiException as err:
+            logging.error("Error while retreiving configmap {}"
+                          .format(self.cm_name))
+            logging.error(err.reason)
+            sys.exit(1)
+        if c is None:
+            logging.error("Configmap {} does not exist".format(self.cm_name))
+            sys.exit(1)
+        return c
+
+    def _try_acquire(self, c):
+        # Returns the updated configmap or None if the resourceVersion
+        # precondition failed.
+        body = {
+            "metadata": {
+                "annotations": {"Owner": self.owner},
+                "resourceVersion": c.metadata.resource_version
+            }
+        }
+        try:
+            return k8s.patch_config_map(None, self.cm_name, body,
+                                        self.cm_namespace)
+        except K8sApiException as err:
+            if err.status == client.CONFLICT:
+                return None
+            logging.error("Error while patching configmap {}"
+                          .format(self.cm_name))
+            logging.error(err.reason)
+            sys.exit(1)
 
-    def unlock(self):
-        self.c.metadata.annotations["Owner"] = ""
+    def _wait_for_release(self, c):
+        # Blocks until the configmap is seen with an empty 'Owner'
+        # annotation or the watch times out. The caller re-reads the
+        # configmap in both cases.
+        events = k8s.watch_config_map(None, self.cm_name, self.cm_namespace,
+                                      c.metadata.resource_version,
+                                      LOCK_WATCH_TIMEOUT)
+        try:
+            for event in events:
+                if event["type"] == "ERROR":
+                    # Most likely the resourceVersion is too old.
+                    return
+                if get_owner(event["object"]) == "":
+                    return
+        except K8sApiException as err:
+            logging.warning("Watch on configmap {} failed: {}"
+                            .format(self.cm_name, err.reason))
+            time.sleep(LOCK_BACKOFF_CAP)
+        finally:
+            events.close()
+
+    def unlock(self, merged=1):
+        # Releases the lock with a single merge patch. The configuration is
+        # only sent if it differs from what was read when the lock was
+        # taken; otherwise only the 'Owner' annotation is cleared. merged is
+        # the number of allocations and releases the patch carries.
         config = build_configmap(self.c_data)
-        configmap = k8sclient.V1ConfigMap()
-        data = {
-            "config": yaml.dump(config)
+        changed = changed_cpu_lists(self._read_data, config)
+        started = get_start_times(self._read_data) != config.start_times
+        body = {
+            "metadata": {
+                "annotations": {"Owner": ""},
+                # Only release the lock if nobody modified the configmap
+                # behind our back.
+                "resourceVersion": self.c.metadata.resource_version
+            }
         }
-        clusterinit.update_configmap(configmap, self.cm_name, data)
+        if changed or started:
+            body["data"] = {"config": encode_config(config)}
         try:
-            k8s.patch_config_map(None, self.cm_name,
-                                 configmap, self.cm_namespace)
+            result = k8s.patch_config_map(None, self.cm_name,
+                                          body, self.cm_namespace)
         except K8sApiException as err:
-            logging.error("Error while retreiving configmap {}"
-                          .format(self.cm_name))
+            if err.status == client.CONFLICT:
+                logging.error("Configmap {} was modified while locked by {}"
+                              .format(self.cm_name, self.owner))
+            else:
+                logging.error("Error while retreiving configmap {}"
+                              .format(self.cm_name))
             logging.error(err.reason)
             sys.exit(1)
+        # Each unlock sends one patch; the other mutations it carries were
+        # coalesced away.
+        record_write(body, saved=merged - 1)
+        logging.debug("Updated {} cpu lists in configmap {}"
+                      .format(len(changed), self.cm_name))
+        logging.debug("Configmap {} writes: {writes} sent, {writesSaved} "
+                      "saved, {bytesSent} bytes".format(self.cm_name,
+                                                        **write_stats))
+        if self.cache:
+            remember_configmap(result, config)
+        if self._locked_at is not None:
+            self.lock_hold_time = time.monotonic() - self._locked_at
+            logging.debug("Released lock on configmap {} after {:.3f}s"
+                          .format(self.cm_name, self.lock_hold_time))
+        self._locked_at = None
+        self._read_data = None
         self.c = None
         self.c_data = None
 
@@ -94,17 +216,33 @@ class Config:
     def get_pools(self):
         return self.c_data.get_pools()
 
+    def get_tasks(self):
+        return self.c_data.get_tasks()
+
+    def get_task_core_lists(self, task):
+        return self.c_data.get_task_core_lists(task)
+
     def as_dict(self):
         return self.c_data.as_dict()
 
 
 class Conf:
+    # Besides the pool -> socket -> cpu list tree, Conf keeps indexes of
+    # where each cpu list lives and which cpu lists each task is assigned
+    # to. The indexes are maintained by the add_* and task methods of the
+    # tree's objects, so they must be used for every modification.
 
     def __init__(self):
         self.pools = dict()
+        # cpu list -> (pool name, socket id)
+        self.core_list_index = dict()
+        # task -> set of (pool name, cpu list)
+        self.task_index = dict()
+        # task -> start time of its process, in clock ticks after boot
+        self.start_times = dict()
 
     def add_pool(self, exclusive, name):
-        p = Pool(exclusive, name)
+        p = Pool(exclusive, name, self)
         self.pools[name] = p
 
     def get_pool(self, name):
@@ -113,6 +251,53 @@ class Conf:
     def get_pools(self):
         return self.pools.keys()
 
+    def find_core_list(self, core_id):
+        # Returns the (pool name, socket id) of the cpu list or None.
+        return self.core_list_index.get(core_id)
+
+    def get_tasks(self):
+        return self.task_index.keys()
+
+    def get_task_core_lists(self, task):
+        # Returns the (pool name, cpu list) pairs the task is assigned to.
+        return sorted(self.task_index.get(task, ()))
+
+    def get_task_start_time(self, task):
+        # Returns the start time of the task's process when it was given its
+        # cpu lists, or None if it was not recorded.
+        return self.start_times.get(task)
+
+    def set_task_start_time(self, task, start_time):
+        if task in self.task_index:
+            self.start_times[task] = start_time
+
+    def release_stale_task(self, task, start_time):
+        # Releases the cpu lists the task was given by an earlier process
+        # than the one started at start_time, i.e. before its pid was
+        # reused. Returns the (pool name, cpu list) pairs released.
+        recorded = self.start_times.get(task)
+        if recorded is None or recorded == start_time:
+            return []
+        stale = self.get_task_core_lists(task)
+        for pool, core_id in stale:
+            self.pools[pool].remove_task(core_id, task)
+        return stale
+
+    def _add_core_list(self, pool, socket_id, core_id):
+        self.core_list_index[core_id] = (pool, socket_id)
+
+    def _add_task(self, pool, core_id, task):
+        self.task_index.setdefault(task, set()).add((pool, core_id))
+
+    def _remove_task(self, pool, core_id, task):
+        entries = self.task_index.get(task)
+        if entries is None:
+            return
+        entries.discard((pool, core_id))
+        if not entries:
+            del self.task_index[task]
+            self.start_times.pop(task, None)
+
     def as_dict(self):
         result = {}
         pools = {}
@@ -124,16 +309,21 @@ class Conf:
 
 class Pool:
 
-    def __init__(self, exclusive, name):
+    def __init__(self, exclusive, name, conf=None):
         self.exclusive = exclusive
         self.name = name
+        self.conf = conf
         self.sockets = dict()
+        # cpu list -> socket id
+        self.core_list_sockets = dict()
+        # cpu lists without tasks
+        self.free_core_lists = set()
 
     def is_exclusive(self):
         return self.exclusive
 
     def add_socket(self, socket_id):
-        s = Socket(socket_id)
+        s = Socket(socket_id, self)
         self.sockets[socket_id] = s
 
     def get_socket(self, socket_id):
@@ -143,7 +333,7 @@ class Pool:
         return self.sockets.keys()
 
     def get_core_lists(self, socket_id=None):
-        if socket_id:
+        if socket_id is not None:
             return self.get_socket_clists(socket_id)
 
         cores = []
@@ -158,32 +348,46 @@ class Pool:
         return [s.get_core_list(cl) for cl in s.get_core_lists()]
 
     def get_core_list(self, cl, socket_id=None):
-        if socket_id:
+        if socket_id is not None:
             return self.get_socket(socket_id).get_core_list(cl)
 
-        for socket in self.get_sockets():
-            try:
-                return self.get_socket(socket).get_core_list(cl)
-            except KeyError:
-                continue
+        socket = self.core_list_sockets.get(cl)
+        if socket is None:
+            return None
+        return self.sockets[socket].get_core_list(cl)
+
+    def count_free_core_lists(self, socket_id=None):
+        if socket_id is not None:
+            return len(self.get_socket(socket_id).free_core_lists)
+        return len(self.free_core_lists)
 
     def update_clist(self, cl, pid):
-        for socket in self.get_sockets():
-            try:
-                core_list = self.get_socket(socket).get_core_list(cl)
-                core_list.add_task(pid)
-                return
-            except KeyError:
-                continue
+        core_list = self.get_core_list(cl)
+        if core_list is not None:
+            core_list.add_task(pid)
 
     def remove_task(self, cl, pid):
-        for socket in self.get_sockets():
-            try:
-                core_list = self.get_socket(socket).get_core_list(cl)
-                core_list.remove_task(pid)
-                return
-            except KeyError:
-                continue
+        core_list = self.get_core_list(cl)
+        if core_list is not None:
+            core_list.remove_task(pid)
+
+    def _add_core_list(self, socket_id, core_id):
+        self.core_list_sockets[core_id] = socket_id
+        self.free_core_lists.add(core_id)
+        if self.conf is not None:
+            self.conf._add_core_list(self.name, socket_id, core_id)
+
+    def _tasks_changed(self, core_id, added, removed, free):
+        if free:
+            self.free_core_lists.add(core_id)
+        else:
+            self.free_core_lists.discard(core_id)
+        if self.conf is None:
+            return
+        for task in added:
+            self.conf._add_task(self.name, core_id, task)
+        for task in removed:
+            self.conf._remove_task(self.name, core_id, task)
 
     def as_dict(self):
         result = {}
@@ -198,13 +402,19 @@ class Pool:
 
 class Socket:
 
-    def __init__(self, socket_id):
+    def __init__(self, socket_id, pool=None):
         self.socket_id = socket_id
+        self.pool = pool
         self.core_lists = dict()
+        # cpu lists without tasks
+        self.free_core_lists = set()
 
     def add_core_list(self, core_id):
-        cl = CoreList(core_id)
+        cl = CoreList(core_id, self)
         self.core_lists[core_id] = cl
+        self.free_core_lists.add(core_id)
+        if self.pool is not None:
+            self.pool._add_core_list(self.socket_id, core_id)
 
     def get_core_list(self, core_id):
         return self.core_lists[core_id]
@@ -212,22 +422,62 @@ class Socket:
     def get_core_lists(self):
         return self.core_lists.keys()
 
+    def _tasks_changed(self, core_id, added, removed, free):
+        if free:
+            self.free_core_lists.add(core_id)
+        else:
+            self.free_core_lists.discard(core_id)
+        if self.pool is not None:
+            self.pool._tasks_changed(core_id, added, removed, free)
+
 
 class CoreList:
+    # Tasks are kept in an insertion ordered dict, so that adding, removing
+    # and looking up a task does not depend on the number of tasks. A task
+    # is assigned to a cpu list at most once.
 
-    def __init__(self, core_id):
+    def __init__(self, core_id, socket=None):
         self.core_id = core_id
-        self.tasks = []
+        self.socket = socket
+        self._tasks = dict()
+
+    @property
+    def tasks(self):
+        return list(self._tasks)
+
+    @tasks.setter
+    def tasks(self, tasks):
+        old = self._tasks
+        self._tasks = dict.fromkeys(tasks)
+        self._changed([t for t in self._tasks if t not in old],
+                      [t for t in old if t not in self._tasks])
 
     def add_task(self, task):
-        self.tasks += [task]
+        if task in self._tasks:
+            return
+        self._tasks[task] = None
+        self._changed([task], [])
 
     def remove_task(self, task):
-        self.tasks = [t for t in self.tasks if t != task]
+        if task not in self._tasks:
+            return
+        del self._tasks[task]
+        self._changed([], [task])
+
+    def has_task(self, task):
+        return task in self._tasks
+
+    def is_free(self):
+        return not self._tasks
 
     def get_tasks(self):
         return self.tasks
 
+    def _changed(self, added, removed):
+        if self.socket is not None:
+            self.socket._tasks_changed(self.core_id, added, removed,
+                                       self.is_free())
+
     def as_dict(self):
         result = {}
         result["cpus"] = self.core_id
@@ -235,6 +485,131 @@ class CoreList:
         return result
 
 
+def get_config(name, namespace, cache=False):
+    # Returns the CMK configuration stored in the configmap 'name' without
+    # taking the lock. Use Config.lock() to modify it.
+    c = k8s.get_config_map(None, name, namespace)
+    if c is None:
+        raise KeyError("Configmap {} does not exist".format(name))
+    return build_config(parse_configmap(c, cache))
+
+
+def parse_configmap(configmap, cache=False):
+    # Returns the deserialized configuration of the configmap. With 'cache'
+    # set, the result is reused for as long as the configmap's
+    # resourceVersion does not change. Callers must not modify it.
+    name = configmap.metadata.name
+    version = configmap.metadata.resource_version
+    if cache and version is not None and name in _parsed_configs:
+        cached_version, data = _parsed_configs[name]
+        if cached_version == version:
+            return data
+
+    data = decode_config(configmap.data["config"])
+    if cache:
+        remember_configmap(configmap, data)
+    return data
+
+
+# The pool -> socket -> cpu list -> tasks dict of a configuration, with
+# the start times of the tasks' processes.
+class ConfigData(dict):
+    def __init__(self, pools=(), start_times=None):
+        dict.__init__(self, pools)
+        self.start_times = dict(start_times or {})
+
+
+def get_start_times(config):
+    # Configurations read from YAML are plain dicts without start times.
+    return getattr(config, "start_times", {})
+
+
+def encode_config(config):
+    # Serializes the pool -> socket -> cpu list -> tasks dict as compact
+    # JSON. Sockets are stored as [socket id, cpu lists] pairs, because JSON
+    # object keys are always strings while socket ids are integers. The
+    # start times of the tasks, if any, are stored next to the pools.
+    pools = {}
+    for pool, sockets in config.items():
+        pools[pool] = [[socket, clists] for socket, clists in sockets.items()]
+    doc = {"version": CONFIG_VERSION, "pools": pools}
+    start_times = get_start_times(config)
+    if start_times:
+        doc["startTimes"] = start_times
+    return json.dumps(doc, separators=(",", ":"), sort_keys=True)
+
+
+def decode_config(data):
+    # Deserializes configuration written by encode_config() or, for
+    # configmaps written by older releases, by yaml.dump().
+    if data.lstrip().startswith("{"):
+        try:
+            doc = json.loads(data)
+        except ValueError:
+            # YAML in flow style.
+            doc = None
+        if isinstance(doc, dict) and "version" in doc:
+            if doc["version"] > CONFIG_VERSION:
+                raise ValueError("Unsupported configuration version {}"
+                                 .format(doc["version"]))
+            config = ConfigData(start_times=doc.get("startTimes"))
+            for pool, sockets in doc["pools"].items():
+                config[pool] = {socket: clists for socket, clists in sockets}
+            return config
+    return yaml.load(data, Loader=YAML_LOADER)
+
+
+def remember_configmap(configmap, data):
+    if configmap is None or configmap.metadata is None:
+        return
+    version = configmap.metadata.resource_version
+    if version is not None:
+        _parsed_configs[configmap.metadata.name] = (version, data)
+
+
+def changed_cpu_lists(old, new):
+    # Returns the (pool, socket, cpu list) entries whose tasks differ
+    # between the configurations 'old' and 'new', including entries that
+    # only exist in one of them. 'old' may be None, in which case every
+    # entry of 'new' is reported.
+    old = old or {}
+    changed = []
+    for pool in set(old) | set(new):
+        old_pool = old.get(pool, {})
+        new_pool = new.get(pool, {})
+        for socket in set(old_pool) | set(new_pool):
+            old_socket = old_pool.get(socket, {})
+            new_socket = new_pool.get(socket, {})
+            for cl in set(old_socket) | set(new_socket):
+                if old_socket.get(cl) != new_socket.get(cl):
+                    changed.append((pool, socket, cl))
+            if not old_socket and not new_socket and \
+                    (socket not in old_pool or socket not in new_pool):
+                changed.append((pool, socket, None))
+        if not old_pool and not new_pool and \
+                (pool not in old or pool not in new):
+            changed.append((pool, None, None))
+    return changed
+
+
+def record_write(body, saved=0):
+    write_stats["writes"] += 1
+    write_stats["writesSaved"] += saved
+    write_stats["bytesSent"] += len(json.dumps(body))
+
+
+def get_owner(configmap):
+    annotations = configmap.metadata.annotations or {}
+    return annotations.get("Owner", "")
+
+
+def lock_backoff(attempt):
+    # "Full jitter" exponential backoff: uniformly random between zero and
+    # the capped exponential bound.
+    bound = min(LOCK_BACKOFF_CAP, LOCK_BACKOFF_BASE * (2 ** attempt))
+    return random.uniform(0, bound)
+
+
 def new(platform, excl_non_isolcpus, name, namespace):
     # Creates the new CMK configuration for the node. It create a
     # configmap object and POSTs it to the K8s API Server
@@ -246,8 +621,9 @@ def new(platform, excl_non_isolcpus, name, namespace):
         config = update_configmap_exclusive("exclusive-non-isolcpus",
                                             platform, config)
     config = update_configmap_shared("infra", platform, config)
+    check_overlaps(config)
     data = {
-        "config": yaml.dump(config)
+        "config": encode_config(config)
     }
 
     configmap = k8s.get_config_map(None, name, namespace)
@@ -313,10 +689,48 @@ def update_configmap_shared(pool_name, platform, config):
     return config
 
 
+# Returns the cpu lists of the configuration c (a Conf or a configmap as
+# built by new()) that share cpus with any other cpu list, in the same or
+# another pool. Each is returned as (pool name, cpu list, CpuSet of the
+# shared cpus). Two sweeps over the cpu lists, so the cost is linear in
+# their number.
+def find_overlaps(c):
+    if isinstance(c, Conf):
+        c = build_configmap(c)
+    clists = [(pool, cl, CpuSet.parse(cl).mask)
+              for pool in c for socket in c[pool] for cl in c[pool][socket]]
+
+    # Cpus seen so far, and cpus seen more than once.
+    seen = shared = 0
+    for _, _, mask in clists:
+        shared |= seen & mask
+        seen |= mask
+    if not shared:
+        return []
+    return [(pool, cl, CpuSet.from_mask(mask & shared))
+            for pool, cl, mask in clists if mask & shared]
+
+
+# Exits if cpu lists of the configuration c overlap.
+def check_overlaps(c):
+    overlaps = find_overlaps(c)
+    if not overlaps:
+        return
+    for pool, cl, cpus in overlaps:
+        logging.error("CPU list {}:{} shares cpus {} with other cpu lists"
+                      .format(pool, cl, cpus))
+    logging.error("Aborting, the CMK configuration has overlapping cpu "
+                  "lists")
+    sys.exit(1)
+
+
 def build_config(c):
     # Builds the CMK configuration from the configmap c. it builds it
-    # into the Conf class
+    # into the Conf class. c is either the deserialized configuration or
+    # its encoded form in any of the supported formats.
 
+    if isinstance(c, str):
+        c = decode_config(c)
     config = Conf()
     for pool in c.keys():
         config.add_pool(exclusivity[pool], pool)
@@ -324,22 +738,25 @@ def build_config(c):
             config.pools[pool].add_socket(socket)
             for core_list in c[pool][socket].keys():
                 config.pools[pool].sockets[socket].add_core_list(core_list)
-                for task in c[pool][socket][core_list]:
+                tasks = c[pool][socket][core_list]
+                if tasks:
                     config.pools[pool].sockets[socket]\
-                                 .core_lists[core_list].add_task(task)
+                                 .core_lists[core_list].tasks = tasks
+    for task, start_time in get_start_times(c).items():
+        config.set_task_start_time(task, start_time)
 
     return config
 
 
 def build_configmap(c):
-    config = dict()
+    config = ConfigData(start_times=c.start_times)
     for pool in c.get_pools():
         config[pool] = dict()
         for socket in c.pools[pool].get_sockets():
             config[pool][socket] = dict()
             s = c.pools[pool].get_socket(socket)
             for core_list in s.get_core_lists():
-                tasks = s.get_core_list(core_list).tasks
-                config[pool][socket][core_list] = tasks
+                config[pool][socket][core_list] = \
+                    s.get_core_list(core_list).get_tasks()
 
     return config
@@ -0,0 +1,185 @@
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# An immutable set of cpu ids, stored as a bitmask in an int, where bit n is
+# set if cpu n is in the set. Iterating a CpuSet yields the cpu ids in
+# ascending order.
+#
+# Cpu lists are parsed from and formatted to the kernel's cpu list format
+# ("0-3,8,10-11"), plain comma separated lists ("0,1,2,3") and hex masks
+# ("F0F").
+class CpuSet:
+    __slots__ = ("_mask",)
+
+    def __init__(self, cpu_ids=()):
+        mask = 0
+        for cpu_id in cpu_ids:
+            cpu_id = int(cpu_id)
+            if cpu_id < 0:
+                raise ValueError("Invalid cpu id {}".format(cpu_id))
+            mask |= 1 << cpu_id
+        object.__setattr__(self, "_mask", mask)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CpuSet is immutable")
+
+    @classmethod
+    def from_mask(cls, mask):
+        if mask < 0:
+            raise ValueError("Invalid cpu mask {}".format(mask))
+        cpus = cls()
+        object.__setattr__(cpus, "_mask", mask)
+        return cpus
+
+    # Parses a cpu list like "0-3,8,10-11". Raises ValueError if it is
+    # malformed.
+    @classmethod
+    def parse(cls, cpu_list):
+        mask = 0
+        cpu_list = cpu_list.strip()
+        if not cpu_list:
+            return cls()
+        for cpu_range in cpu_list.split(","):
+            bounds = cpu_range.split("-")
+            if len(bounds) == 1:
+                mask |= 1 << int(bounds[0])
+            elif len(bounds) == 2:
+                start, end = int(bounds[0]), int(bounds[1])
+                if end < start:
+                    raise ValueError("Invalid cpu range {}".format(cpu_range))
+                mask |= ((1 << (end - start + 1)) - 1) << start
+            else:
+                raise ValueError("Invalid cpu range {}".format(cpu_range))
+        return cls.from_mask(mask)
+
+    # Returns the union of several cpu lists, e.g. the cpu lists of a pool.
+    @classmethod
+    def parse_lists(cls, cpu_lists):
+        mask = 0
+        for cpu_list in cpu_lists:
+            mask |= cls.parse(cpu_list)._mask
+        return cls.from_mask(mask)
+
+    # Parses a hex mask like "F0F", or "ff,ffffffff" as in the kernel's
+    # cpumap files.
+    @classmethod
+    def parse_mask(cls, hex_mask):
+        return cls.from_mask(int(hex_mask.strip().replace(",", ""), 16))
+
+    @property
+    def mask(self):
+        return self._mask
+
+    # Returns the cpu list in the kernel's format, e.g. "0-3,8".
+    def ranges(self):
+        ranges = []
+        mask = self._mask
+        offset = 0
+        while mask:
+            # Skip the unset bits, then take the run of set bits.
+            skip = (mask & -mask).bit_length() - 1
+            mask >>= skip
+            offset += skip
+            length = (~mask & (mask + 1)).bit_length() - 1
+            start, end = offset, offset + length - 1
+            ranges.append(str(start) if start == end
+                          else "{}-{}".format(start, end))
+            mask >>= length
+            offset += length
+        return ",".join(ranges)
+
+    # Returns the comma separated cpu ids, e.g. "0,1,2,3,8".
+    def cpu_list(self):
+        return ",".join(str(cpu_id) for cpu_id in self)
+
+    # Returns the upper case hex mask, e.g. "10F".
+    def hex_mask(self):
+        return "{:X}".format(self._mask)
+
+    def min(self):
+        if not self._mask:
+            raise ValueError("Empty cpu set")
+        return (self._mask & -self._mask).bit_length() - 1
+
+    def max(self):
+        if not self._mask:
+            raise ValueError("Empty cpu set")
+        return self._mask.bit_length() - 1
+
+    def isdisjoint(self, other):
+        return not self._mask & as_cpuset(other)._mask
+
+    def issubset(self, other):
+        return not self._mask & ~as_cpuset(other)._mask
+
+    def issuperset(self, other):
+        return as_cpuset(other).issubset(self)
+
+    def __iter__(self):
+        mask = self._mask
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
+
+    def __len__(self):
+        return bin(self._mask).count("1")
+
+    def __bool__(self):
+        return self._mask != 0
+
+    def __contains__(self, cpu_id):
+        return cpu_id >= 0 and bool(self._mask >> cpu_id & 1)
+
+    def __or__(self, other):
+        return CpuSet.from_mask(self._mask | as_cpuset(other)._mask)
+
+    def __and__(self, other):
+        return CpuSet.from_mask(self._mask & as_cpuset(other)._mask)
+
+    def __sub__(self, other):
+        return CpuSet.from_mask(self._mask & ~as_cpuset(other)._mask)
+
+    def __xor__(self, other):
+        return CpuSet.from_mask(self._mask ^ as_cpuset(other)._mask)
+
+    def __le__(self, other):
+        return self.issubset(other)
+
+    def __ge__(self, other):
+        return self.issuperset(other)
+
+    def __eq__(self, other):
+        if not isinstance(other, CpuSet):
+            return NotImplemented
+        return self._mask == other._mask
+
+    def __hash__(self):
+        return hash(self._mask)
+
+    def __str__(self):
+        return self.ranges()
+
+    def __repr__(self):
+        return "CpuSet('{}')".format(self.ranges())
+
+
+# Returns cpus as a CpuSet, if it is not one already.
+def as_cpuset(cpus):
+    if isinstance(cpus, CpuSet):
+        return cpus
+    if isinstance(cpus, str):
+        return CpuSet.parse(cpus)
+    return CpuSet(cpus)
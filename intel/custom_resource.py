@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import logging
 import time
 
@@ -170,50 +171,100 @@ class CustomResourceDefinition:
             self.resource_type.plural_name
         ])
 
-    def remove(self):
-        """Remove custom object"""
-        resource_path = "/".join([
+        self.object_path = "/".join([
             self.resource_path,
             self.name
         ])
 
+        # resourceVersion of the custom object when it was last created,
+        # read or replaced, None if unknown.
+        self.resource_version = None
+
+    def remove(self):
+        """Remove custom object"""
         self.api.api_client.call_api(
-            resource_path,
+            self.object_path,
             'DELETE',
             self.resource_type.header_params,
             auth_settings=self.resource_type.auth_settings)
+        self.resource_version = None
 
     def create(self):
         """Create custom object"""
-        self.api.api_client.call_api(
+        self.update_version(self.api.api_client.call_api(
             self.resource_path,
             'POST',
             self.resource_type.header_params,
             body=self.body,
-            auth_settings=self.resource_type.auth_settings)
+            auth_settings=self.resource_type.auth_settings,
+            response_type="object",
+            _return_http_data_only=True))
+
+    def read(self):
+        """Read resourceVersion of custom object"""
+        self.update_version(self.api.api_client.call_api(
+            self.object_path,
+            'GET',
+            self.resource_type.header_params,
+            auth_settings=self.resource_type.auth_settings,
+            response_type="object",
+            _return_http_data_only=True))
+
+    def replace(self):
+        """Replace custom object, if its resourceVersion did not change"""
+        body = copy.deepcopy(self.body)
+        body["metadata"]["resourceVersion"] = self.resource_version
+        self.update_version(self.api.api_client.call_api(
+            self.object_path,
+            'PUT',
+            self.resource_type.header_params,
+            body=body,
+            auth_settings=self.resource_type.auth_settings,
+            response_type="object",
+            _return_http_data_only=True))
+
+    def update_version(self, result):
+        if isinstance(result, dict):
+            self.resource_version = \
+                result.get("metadata", {}).get("resourceVersion")
 
     def save(self):
-        """Save custom object if not exists"""
+        """Create or update custom object, return whether it was saved"""
         try:
-            self.create()
+            self.upsert()
 
         except K8sApiException as e:
             if e.status == client.NOT_FOUND:
                 logging.warning("Custom Resource Definition is not ready yet. "
                                 "Report will be skipped")
-                return
+                return False
             if e.status == client.METHOD_NOT_ALLOWED:
                 logging.error("API is blocked. Report will be skipped")
-                return
-            if e.status != client.CONFLICT:
-                raise e
-            logging.warning("Previous definition has been detected. "
-                            "Recreating...")
+                return False
+            raise e
+        return True
 
+    def upsert(self):
+        if self.resource_version is None:
             try:
-                self.remove()
+                self.create()
+                return
             except K8sApiException as e:
-                if e.status != client.NOT_FOUND:
+                if e.status != client.CONFLICT:
                     raise e
+            logging.info("Previous definition has been detected. "
+                         "Updating...")
+            self.read()
 
-            self.create()
+        try:
+            self.replace()
+        except K8sApiException as e:
+            if e.status == client.NOT_FOUND:
+                # Removed since it was last saved.
+                self.create()
+            elif e.status == client.CONFLICT:
+                # Changed by somebody else since it was last saved.
+                self.read()
+                self.replace()
+            else:
+                raise e
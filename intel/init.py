@@ -12,10 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from . import config, k8s, topology, discover, sst_bf as sst, sst_cp as cp
 import logging
-import sys
 import os
+import sys
+
+from intel.cpuset import CpuSet
+from . import config, discover, k8s, sst_bf as sst, sst_cp as cp, topology
 
 
 def init(num_exclusive_cores, num_shared_cores,
@@ -288,7 +290,7 @@ def check_excl_non_isolcpus(excl_non_isolcpus, platform):
             for cpu in cpu_list:
                 if not cpu.isdigit():
                     raise RuntimeError("Invalid core ID: {}".format(cpu))
-        cpus = topology.parse_cpus_str(cpus_str)
+        cpus = CpuSet.parse(excl_non_isolcpus)
         all_cores = platform.get_cores()
         assign_excl_non_isolcpus(all_cores, "exclusive-non-isolcpus",
                                  cpus)
@@ -12,106 +12,85 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from . import config, proc, k8s
-from intel import util
 import logging
 import os
-import random
-import psutil
 import signal
 import subprocess
 import sys
 
+import psutil
+
+from intel.cpuset import CpuSet
+from . import agent, allocator, config, k8s, proc, topology
+
 
 ENV_CPUS_ASSIGNED = "CMK_CPUS_ASSIGNED"
 ENV_CPUS_ASSIGNED_MASK = "CMK_CPUS_ASSIGNED_MASK"
 ENV_CPUS_SHARED = "CMK_CPUS_SHARED"
 ENV_CPUS_INFRA = "CMK_CPUS_INFRA"
 ENV_NUM_CORES = "CMK_NUM_CORES"
+ENV_ALLOCATION_POLICY = "CMK_ALLOCATION_POLICY"
+ENV_CPUS_PLACEMENT = "CMK_CPUS_PLACEMENT"
+ENV_DEVICE = "CMK_DEVICE"
+ENV_CPUS_LOCALITY = "CMK_CPUS_LOCALITY"
+ENV_CPUS_REMOTE = "CMK_CPUS_REMOTE"
 
 
-def isolate(pool_name, no_affinity, command, args, namespace, socket_id=None):
+def isolate(pool_name, no_affinity, command, args, namespace, socket_id=None,
+            numa_node=None):
     pod_name = os.environ["HOSTNAME"]
     if not isinstance(pod_name, str):
         logging.error("Pod name is not a string, exiting...")
         sys.exit(1)
-    node_name = k8s.get_node_from_pod(None, pod_name)
-    configmap_name = "cmk-config-{}".format(node_name)
-
-    c = config.Config(configmap_name, pod_name, namespace)
-    try:
-        c.lock()
-        pools = c.c_data.pools
-        if pool_name not in c.get_pools():
-            raise KeyError("Requested pool {} does not exist"
-                           .format(pool_name))
 
-        pool = c.get_pool(pool_name)
-
-        socket_aware_pools = ["exclusive", "shared", "exclusive-non-isolcpus"]
-        if socket_id == "-1" or pool_name not in socket_aware_pools:
-            selected_socket = None
-        else:
-            selected_socket = socket_id
-
-        clists = None
-        if pool.is_exclusive():
-            n_cpus = int(os.getenv(ENV_NUM_CORES, 1))
-            if n_cpus < 1:
-                raise ValueError("Requested numbers of cores "
-                                 "must be positive integer")
-
-            available_clists = [cl.core_id for cl in
-                                pool.get_core_lists(selected_socket)
-                                if len(cl.tasks) == 0]
-
-            if len(available_clists) < n_cpus:
-                raise SystemError("Not enough free cpu lists in pool {}"
-                                  .format(pool_name))
-
-            clists = available_clists[:n_cpus]
-        else:
-            # NOTE(CD): This allocation algorithm is probably an
-            # oversimplification, however for known use cases the non-exclusive
-            # pools should never have more than one cpu list anyhow.
-            # If that ceases to hold in the future, we could explore population
-            # or load-based spreading. Keeping it simple for now.
-            try:
-                core_lists = [cl.core_id for cl in
-                              pool.get_core_lists(selected_socket)]
-                clists = [random.choice(core_lists)]
-            except IndexError:
-                raise SystemError("No cpu lists in pool {}".format(pool_name))
-
-        if not clists:
-            raise SystemError("No free cpu lists in pool {}".format(pool_name))
-
-        for cl in clists:
-            pool.update_clist(cl, str(proc.getpid()))
-
-    finally:
-        c.unlock()
+    n_cpus = int(os.getenv(ENV_NUM_CORES, 1))
+    pid = str(proc.getpid())
+    # Placement policy for exclusive cpu lists, None for the pool's default.
+    policy = os.environ.get(ENV_ALLOCATION_POLICY) or None
+    # The device is resolved here rather than by the agent, as network
+    # interfaces are only visible in the pod's network namespace.
+    device = os.environ.get(ENV_DEVICE) or None
+    local_cpus = device_cpus(device) if device else None
+    # Stored with the task, so that reconcile can tell when its pid has
+    # been reused by another process.
+    start_time = process_start_time(pid)
+
+    # Prefer the node's CMK agent, which avoids a round trip to the API
+    # server. Without an agent, update the configmap directly.
+    allocation = agent.allocate(pool_name, pid, n_cpus, socket_id, policy,
+                                numa_node, local_cpus, start_time)
+    if allocation is None:
+        allocation = allocate(pool_name, pid, n_cpus, namespace, socket_id,
+                              policy, numa_node, local_cpus, start_time)
+    clists = allocation["cpuLists"]
+    advertised = allocation["advertised"]
 
     # NOTE: we spawn the child process after exiting the config lock context.
     try:
         # Advertise assigned CPU IDs in the environment.
-        cpu_ids = ",".join(clists)
-        os.environ[ENV_CPUS_ASSIGNED] = cpu_ids
-        cpus_arr = [int(n) for n in cpu_ids.split(',')]
-        cpus_bit_mask = util.convert_array2bitmask(cpus_arr)
-        os.environ[ENV_CPUS_ASSIGNED_MASK] = cpus_bit_mask
+        cpus = CpuSet.parse_lists(clists)
+        os.environ[ENV_CPUS_ASSIGNED] = ",".join(clists)
+        os.environ[ENV_CPUS_ASSIGNED_MASK] = cpus.hex_mask()
+
+        # Advertise how the policy placed the assigned CPUs.
+        if allocation.get("placement"):
+            os.environ[ENV_CPUS_PLACEMENT] = allocation["placement"]
+
+        # Advertise whether the assigned CPUs are local to the device, and
+        # the ones that are not.
+        if device:
+            os.environ[ENV_CPUS_LOCALITY] = \
+                allocation.get("locality") or "unknown"
+            os.environ[ENV_CPUS_REMOTE] = \
+                ",".join(allocation.get("remoteCpuLists") or [])
 
         # Advertise shared pool CPU IDs
-        shared_pool = pools["shared"]
-        if shared_pool is not None:
-            shared_clists = [cl.core_id for cl in shared_pool.get_core_lists()]
-            os.environ[ENV_CPUS_SHARED] = ','.join(shared_clists)
+        if "shared" in advertised:
+            os.environ[ENV_CPUS_SHARED] = ','.join(advertised["shared"])
 
         # Advertise infra pool CPU IDs
-        infra_pool = pools["infra"]
-        if infra_pool is not None:
-            infra_clists = [cl.core_id for cl in infra_pool.get_core_lists()]
-            os.environ[ENV_CPUS_INFRA] = ','.join(infra_clists)
+        if "infra" in advertised:
+            os.environ[ENV_CPUS_INFRA] = ','.join(advertised["infra"])
 
         # We use psutil here (instead of the cmk provided
         # process abstraction) as we need to change the affinity of the current
@@ -126,9 +105,8 @@ def isolate(pool_name, no_affinity, command, args, namespace, socket_id=None):
 command because the --no-affinity flag was supplied""")
 
         else:
-            cpu_list = proc.unfold_cpu_list(cpu_ids)
-            logging.debug("Setting CPU affinity to %s", cpu_list)
-            p.cpu_affinity(cpu_list)
+            logging.debug("Setting CPU affinity to %s", cpus)
+            p.cpu_affinity(list(cpus))
 
         child = subprocess.Popen([command] + args, shell=False)
 
@@ -144,15 +122,60 @@ command because the --no-affinity flag was supplied""")
         child.wait()
 
     finally:
-        pod_name = os.environ["HOSTNAME"]
-        node_name = k8s.get_node_from_pod(None, pod_name)
-        configmap_name = "cmk-config-{}".format(node_name)
+        if not agent.release(pool_name, clists, pid):
+            release(pool_name, clists, pid, namespace)
 
-        c = config.Config(configmap_name, pod_name)
-        c.lock()
-        pool = c.get_pool(pool_name)
-        pid = str(proc.getpid())
-        for clist in clists:
-            pool.remove_task(clist, pid)
 
+# Returns the ids of the cpus local to the PCI device or network interface,
+# or None if they are not known.
+def device_cpus(device):
+    try:
+        numa_node, cpus = topology.device_locality(device)
+    except (OSError, ValueError) as err:
+        logging.warning("Cannot resolve the locality of device {}, "
+                        "ignoring it: {}".format(device, err))
+        return None
+    if not cpus:
+        logging.warning("Device {} has no NUMA affinity, ignoring it"
+                        .format(device))
+        return None
+    logging.debug("Device %s is local to NUMA node %s, cpus %s",
+                  device, numa_node, cpus)
+    return cpus
+
+
+# Returns the start time of the process pid, or None if it cannot be read.
+def process_start_time(pid):
+    try:
+        return proc.Process(int(pid)).start_time()
+    except (OSError, ValueError, IndexError) as err:
+        logging.warning("Cannot read the start time of process {}: {}"
+                        .format(pid, err))
+        return None
+
+
+def get_config(pod_name, namespace):
+    node_name = k8s.get_node_from_pod(None, pod_name)
+    configmap_name = "cmk-config-{}".format(node_name)
+    return config.Config(configmap_name, pod_name, namespace)
+
+
+# Assigns cpu lists from the pool to the task pid by updating the node's
+# configmap under its lock.
+def allocate(pool_name, pid, n_cpus, namespace, socket_id=None,
+             policy=None, numa_node=None, local_cpus=None, start_time=None):
+    c = get_config(os.environ["HOSTNAME"], namespace)
+    try:
+        c.lock()
+        return allocator.allocate(c.c_data, pool_name, pid, n_cpus,
+                                  socket_id, policy, numa_node, local_cpus,
+                                  start_time)
+    finally:
         c.unlock()
+
+
+def release(pool_name, clists, pid, namespace):
+    c = get_config(os.environ["HOSTNAME"], namespace)
+    c.lock()
+    allocator.release(c.c_data, pool_name, clists, pid)
+    c.unlock()
@@ -13,13 +13,32 @@
 # limitations under the License.
 
 import logging
+import os
+from http import client
+
+from kubernetes import client as k8sclient, config as k8sconfig, watch
+from kubernetes.client import V1DeleteOptions, V1Namespace
+from kubernetes.client.rest import ApiException as K8sApiException
+from urllib3.exceptions import HTTPError
 
 from intel import util
-from kubernetes import client as k8sclient, config as k8sconfig
-from kubernetes.client import V1Namespace, V1DeleteOptions
 
 VERSION_NAME = "v1.9.0"
 
+ENV_NODE_NAME = "NODE_NAME"
+ENV_POD_NAMESPACE = "POD_NAMESPACE"
+SA_NAMESPACE_FILE = "/var/run/secrets/kubernetes.io/serviceaccount/namespace"
+
+# Node names resolved by get_node_from_pod(), keyed by pod name. A pod never
+# moves between nodes, so entries stay valid for the process lifetime.
+_node_names = {}
+
+# In-cluster core API client of this process. Long running commands
+# (reconcile, node-report, the agent) read and patch the configmap on every
+# iteration, and reuse the client and its connection pool instead of
+# loading the in-cluster config each time.
+_incluster_client = None
+
 
 # Only set up the Volume Mounts necessary for the container
 CONTAINER_VOLUME_MOUNTS = {
@@ -72,6 +91,11 @@ CONTAINER_VOLUME_MOUNTS = {
                 "mountPath": "/opt/bin",
                 "name": "cmk-install-dir",
                 "readOnly": True
+            },
+            {
+                "mountPath": "/var/run/cmk",
+                "name": "cmk-agent-dir",
+                "readOnly": True
             }
         ],
         "securityContext": {
@@ -93,6 +117,11 @@ CONTAINER_VOLUME_MOUNTS = {
                 "mountPath": "/opt/bin",
                 "name": "cmk-install-dir",
                 "readOnly": True
+            },
+            {
+                "mountPath": "/var/run/cmk",
+                "name": "cmk-agent-dir",
+                "readOnly": True
             }
         ],
         "securityContext": {
@@ -123,6 +152,17 @@ CONTAINER_VOLUME_MOUNTS = {
             "fsGroup": 2000
         }
     },
+    "agent": {
+        "volumeMounts": [
+            {
+                "mountPath": "/var/run/cmk",
+                "name": "cmk-agent-dir"
+            }
+        ],
+        "securityContext": {
+            "readOnlyRootFilesystem": True
+        }
+    },
     "reconfigure": {
         "volumeMounts": [
             {
@@ -169,6 +209,13 @@ def get_pod_template(saname="cmk-serviceaccount"):
                         "path": "/opt/bin"
                     },
                     "name": "cmk-install-dir"
+                },
+                {
+                    "hostPath": {
+                        "path": "/var/run/cmk",
+                        "type": "DirectoryOrCreate"
+                    },
+                    "name": "cmk-agent-dir"
                 }
             ]
         }
@@ -250,14 +297,35 @@ def deployment_from(pod):
 
 
 def client_from_config(config):
+    global _incluster_client
     if config is None:
-        k8sconfig.load_incluster_config()
-        return k8sclient.CoreV1Api()
+        if _incluster_client is None:
+            k8sconfig.load_incluster_config()
+            _incluster_client = k8sclient.CoreV1Api()
+        return _incluster_client
     else:
         client = k8sclient.ApiClient(configuration=config)
         return k8sclient.CoreV1Api(api_client=client)
 
 
+# Drops the cached in-cluster client, so that the next call loads the
+# in-cluster config (e.g. a rotated service account token) again.
+def reset_clients():
+    global _incluster_client
+    _incluster_client = None
+
+
+# Drops the cached in-cluster client if err shows that it cannot be used
+# anymore: its credentials were rejected, or its connection failed.
+def reset_clients_after(err):
+    if isinstance(err, K8sApiException):
+        stale = err.status in (client.UNAUTHORIZED, client.FORBIDDEN)
+    else:
+        stale = isinstance(err, (HTTPError, ConnectionError))
+    if stale:
+        reset_clients()
+
+
 def apps_api_client_from_config(config):
     if config is None:
         k8sconfig.load_incluster_config()
@@ -312,6 +380,14 @@ def get_container_template(cmd):
                         "fieldPath": "spec.nodeName"
                     }
                 }
+            },
+            {
+                "name": "POD_NAMESPACE",
+                "valueFrom": {
+                    "fieldRef": {
+                        "fieldPath": "metadata.namespace"
+                    }
+                }
             }
         ],
         "image": "IMAGENAME",
@@ -333,12 +409,58 @@ def get_node_list(config, label_selector=None):
     return nodes["items"]
 
 
-# get_node_from_pod returns the node that a given pod is running on
-def get_node_from_pod(config, pod_name):
-    pods = get_pod_list(config)
-    for p in pods["items"]:
-        if p["metadata"]["name"] == pod_name:
-            return p["spec"]["node_name"]
+# get_node_from_pod returns the node that a given pod is running on.
+# The node name is taken, in order of preference, from the NODE_NAME
+# environment variable (downward API), from an earlier lookup in this
+# process or from a single read of the pod. Listing every pod in the
+# cluster is only used when the pod's namespace is unknown or the pod
+# cannot be read by name.
+def get_node_from_pod(config, pod_name, namespace=None):
+    node_name = os.getenv(ENV_NODE_NAME)
+    if node_name:
+        return node_name
+
+    if pod_name in _node_names:
+        return _node_names[pod_name]
+
+    if namespace is None:
+        namespace = get_pod_namespace()
+
+    node_name = None
+    if namespace is not None:
+        k8s_api = client_from_config(config)
+        try:
+            pod = k8s_api.read_namespaced_pod(pod_name, namespace)
+            node_name = pod.spec.node_name
+        except K8sApiException as err:
+            if err.status != client.NOT_FOUND:
+                raise err
+            logging.warning("Pod {} not found in namespace {}, searching "
+                            "all namespaces".format(pod_name, namespace))
+
+    if node_name is None:
+        pods = get_pod_list(config)
+        for p in pods["items"]:
+            if p["metadata"]["name"] == pod_name:
+                node_name = p["spec"]["node_name"]
+                break
+
+    if node_name is not None:
+        _node_names[pod_name] = node_name
+    return node_name
+
+
+# get_pod_namespace returns the namespace of the pod this process runs in,
+# or None if it cannot be determined.
+def get_pod_namespace():
+    namespace = os.getenv(ENV_POD_NAMESPACE)
+    if namespace:
+        return namespace
+    try:
+        with open(SA_NAMESPACE_FILE) as f:
+            return f.read().strip() or None
+    except IOError:
+        return None
 
 
 # get_pod_list() returns the pod list in the current Kubernetes cluster.
@@ -448,13 +570,29 @@ def get_kube_version(config):
     return version_info.git_version
 
 
-# Get named configmap
+# Get named configmap, or None if it does not exist
 def get_config_map(config, name, ns_name):
     k8s_api = client_from_config(config)
-    configmaps = k8s_api.list_namespaced_config_map(ns_name)
-    for cm in configmaps.items:
-        if cm.metadata.name == name:
-            return cm
+    try:
+        return k8s_api.read_namespaced_config_map(name, ns_name)
+    except K8sApiException as err:
+        if err.status == client.NOT_FOUND:
+            return None
+        raise err
+
+
+# Watch named configmap for changes newer than resource_version. Returns a
+# generator of watch events; closing the generator closes the connection.
+def watch_config_map(config, name, ns_name, resource_version=None,
+                     timeout_seconds=None):
+    k8s_api = client_from_config(config)
+    kwargs = {"field_selector": "metadata.name={}".format(name)}
+    if resource_version is not None:
+        kwargs["resource_version"] = resource_version
+    if timeout_seconds is not None:
+        kwargs["timeout_seconds"] = timeout_seconds
+    return watch.Watch().stream(k8s_api.list_namespaced_config_map, ns_name,
+                                **kwargs)
 
 
 # Delete namespace by name.
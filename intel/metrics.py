@@ -0,0 +1,152 @@
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import threading
+
+# Minimal Prometheus metrics: counters and histograms, rendered in the
+# Prometheus text exposition format.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds, in seconds, of the default histogram buckets.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(),
+                  buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames,
+                                       buckets))
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append("# HELP {} {}".format(
+                metric.name, metric.documentation.replace("\\", "\\\\")
+                .replace("\n", "\\n")))
+            lines.append("# TYPE {} {}".format(metric.name, metric.type))
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        # label values -> value(s) of the metric
+        self.values = {}
+
+    def label_values(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError("Metric {} has labels {}, got {}".format(
+                self.name, ", ".join(self.labelnames),
+                ", ".join(sorted(labels))))
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def format_labels(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join('{}="{}"'.format(name, escape(value))
+                              for name, value in pairs) + "}"
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self.label_values(labels), 0)
+
+    def samples(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        if not values and not self.labelnames:
+            values = [((), 0)]
+        return ["{}{} {}".format(self.name, self.format_labels(key),
+                                 format_value(value))
+                for key, value in values]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        Metric.__init__(self, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            if key not in self.values:
+                # Per bucket counts, the last one is +Inf, and the sum.
+                self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts, _ = self.values[key]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key][1] += value
+
+    def get_count(self, **labels):
+        with self.lock:
+            value = self.values.get(self.label_values(labels))
+            return 0 if value is None else sum(value[0])
+
+    def samples(self):
+        with self.lock:
+            values = sorted((key, (list(counts), total))
+                            for key, (counts, total) in self.values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            bounds = [format_value(b) for b in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append("{}_bucket{} {}".format(
+                    self.name, self.format_labels(key, [("le", bound)]),
+                    cumulative))
+            lines.append("{}_sum{} {}".format(
+                self.name, self.format_labels(key), format_value(total)))
+            lines.append("{}_count{} {}".format(
+                self.name, self.format_labels(key), cumulative))
+        return lines
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n") \
+        .replace('"', '\\"')
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
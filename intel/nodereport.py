@@ -12,61 +12,38 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import itertools
 import json
 import logging
 import os
 import time
 
-from kubernetes import config as k8sconfig, client as k8sclient
-from . import config, custom_resource, discover, \
-    k8s, proc, third_party, topology, util, sst_bf as sst
+from . import config, discover, k8s, publisher, sst_bf as sst, topology
 
 
-def nodereport(seconds, publish, namespace):
+def nodereport(seconds, publish, namespace, heartbeat=None):
     if seconds is None:
         seconds = 0
     else:
         seconds = int(seconds)
     should_exit = (seconds <= 0)
+    report_publisher = publisher.ReportPublisher(
+        "cmk-nodereport", ["cmk-nr"], "Nodereport", heartbeat)
 
     while True:
-        report = generate_report(namespace)
+        report = generate_report(namespace, cache=True)
 
         print(report.json())
 
         if publish and report is not None:
             logging.debug("Publishing node report to Kubernetes API server")
-            k8sconfig.load_incluster_config()
-            v1beta = k8sclient.ExtensionsV1beta1Api()
-
-            version = util.parse_version(k8s.get_kube_version(None))
-
-            if version >= util.parse_version("v1.7.0"):
-                node_report_type = \
-                    custom_resource.CustomResourceDefinitionType(
-                        v1beta,
-                        "intel.com",
-                        "cmk-nodereport",
-                        ["cmk-nr"]
-                    )
-                # custom_resource throws an exception if the environment
-                # variable is not set.
-                node_name = os.getenv("NODE_NAME")
-                node_report = node_report_type.create(node_name)
-                node_report.body["spec"]["report"] = report.as_dict()
-                node_report.save()
-            else:
-                node_report_type = third_party.ThirdPartyResourceType(
-                    v1beta,
-                    "cmk.intel.com",
-                    "Nodereport")
-                # third_party throws an exception if the environment
-                # variable is not set.
-                node_name = os.getenv("NODE_NAME")
-                node_report = node_report_type.create(node_name)
-                node_report.body["report"] = report.as_dict()
-                node_report.save()
+            try:
+                report_publisher.publish(report.as_dict())
+            except Exception as err:
+                if should_exit:
+                    raise
+                # Retried with a fresh client on the next iteration.
+                logging.error("Error publishing node report: {}"
+                              .format(err))
 
         if should_exit:
             break
@@ -76,7 +53,7 @@ def nodereport(seconds, publish, namespace):
         time.sleep(seconds)
 
 
-def generate_report(namespace):
+def generate_report(namespace, cache=False):
     report = NodeReport()
     check_describe(report, namespace)
     check_cmk_config(report, namespace)
@@ -86,7 +63,7 @@ def generate_report(namespace):
     except Exception as err:
         logging.info("Could not read SST-BF NFD label: {}".format(err))
 
-    for socket in topology.discover(sst_bf).sockets.values():
+    for socket in topology.discover(sst_bf, cache).sockets.values():
         report.add_socket(socket)
     return report
 
@@ -96,10 +73,10 @@ def check_describe(report, namespace):
         pod_name = os.environ["HOSTNAME"]
         node_name = k8s.get_node_from_pod(None, pod_name)
         configmap_name = "cmk-config-{}".format(node_name)
-        c = config.get_config(configmap_name, namespace)
+        c = config.get_config(configmap_name, namespace, cache=True)
         report.add_description(c.as_dict())
-    except Exception:
-        pass
+    except Exception as err:
+        k8s.reset_clients_after(err)
 
 
 def check_cmk_config(report, namespace):
@@ -110,41 +87,17 @@ def check_cmk_config(report, namespace):
         pod_name = os.environ["HOSTNAME"]
         node_name = k8s.get_node_from_pod(None, pod_name)
         configmap_name = "cmk-config-{}".format(node_name)
-        c = config.get_config(configmap_name, namespace)
-    except Exception:
+        c = config.get_config(configmap_name, namespace, cache=True)
+    except Exception as err:
+        k8s.reset_clients_after(err)
         check_conf.add_error("Unable to read CMK configmap")
         return  # Nothing more we can check for now
 
     # Ensure pool cpu lists are disjoint
-    cpu_lists = []
-    for p in c.get_pools():
-        pool = c.get_pool(p)
-        clists = [cl.core_id for cl in pool.get_core_lists()]
-        cpu_lists += [
-            {
-                "pool": p,
-                "list": clists,
-                "cpus": proc.unfold_cpu_list(",".join(clists))
-            }
-        ]
-
-    # Subset of cartesian product without self-maplets:
-    # If a -> b is in the result then b -> a is not.
-    # Search the filtered product for overlapping CPU lists.
-    def same_list(a, b):
-        return a["pool"] is b["pool"] and a["list"] is b["list"]
-
-    def disjoint(a, b):
-        return not set(a["cpus"]).intersection(set(b["cpus"]))
-
-    for (a, b) in itertools.combinations_with_replacement(cpu_lists, 2):
-        if not same_list(a, b) and not disjoint(a, b):
-            check_conf.add_error(
-                    "CPU list overlap detected in "
-                    "{}:{} and {}:{} (in both: {})".format(
-                        a["pool"], a["list"],
-                        b["pool"], b["list"],
-                        b["cpus"]))
+    for pool, cl, cpus in config.find_overlaps(c):
+        check_conf.add_error(
+            "CPU list overlap detected in {}:{} (shared with other cpu "
+            "lists: {})".format(pool, cl, cpus))
 
 
 class NodeReport():
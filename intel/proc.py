@@ -12,8 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import os
 import logging
+import os
+
+from intel.cpuset import CpuSet
 
 ENV_PROC_FS = "CMK_PROC_FS"
 
@@ -36,25 +38,10 @@ def getpid():
         return pid
 
 
-def unfold_cpu_list(list):
-    cpu_list = []
-
-    if list == "":
-        return cpu_list
-
-    for cpu_range in list.split(','):
-        cpu_range_boundaries = cpu_range.split('-')
-        num_cpu_range_boundaries = len(cpu_range_boundaries)
-
-        if num_cpu_range_boundaries == 1:
-            cpu_list.append(int(cpu_range_boundaries[0]))
-
-        elif num_cpu_range_boundaries == 2:
-            start = int(cpu_range_boundaries[0])
-            end = int(cpu_range_boundaries[1])
-            cpu_list.extend(range(start, end + 1))
-
-    return cpu_list
+# Returns the set of pids in procfs, from a single scan of its directory.
+def live_pids():
+    with os.scandir(procfs()) as entries:
+        return {int(entry.name) for entry in entries if entry.name.isdigit()}
 
 
 class Process:
@@ -67,6 +54,14 @@ class Process:
     def exists(self):
         return os.path.exists(self.task_dir())
 
+    def start_time(self):
+        # The start time (in clock ticks after boot) is the 22nd field of
+        # <procfs>/<pid>/stat. The second one, the command name in
+        # parentheses, may contain spaces and parentheses itself.
+        with open(os.path.join(self.task_dir(), "stat")) as stat:
+            contents = stat.read()
+        return int(contents[contents.rindex(")") + 2:].split()[19])
+
     def cpus_allowed(self):
         with open(os.path.join(procfs(), str(self.pid), "status")) as status:
             for line in status:
@@ -78,7 +73,7 @@ class Process:
                 second = fields[1].strip()
 
                 if first == "Cpus_allowed_list":
-                    return unfold_cpu_list(second)
+                    return list(CpuSet.parse(second))
 
             raise ValueError(
                 "status file does not contain 'Cpus_allowed_list'")
@@ -0,0 +1,108 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+import time
+
+from kubernetes import client as k8sclient, config as k8sconfig
+
+from intel import custom_resource, k8s, third_party, util
+
+
+# Publishes the reports of a node as a custom resource (a third party
+# resource before Kubernetes 1.7) named after the node. The API client,
+# the Kubernetes version and the resource type are set up by the first
+# report and reused by the following ones, so that a long running
+# reconcile or node-report only updates the report on each iteration.
+# After an API error they are set up again on the next report.
+#
+# A report that is the same as the last published one is only published
+# again once heartbeat seconds have passed since, or never if heartbeat is
+# 0 or None.
+class ReportPublisher:
+    def __init__(self, crd_name, short_names, tpr_kind, heartbeat=None):
+        self.crd_name = crd_name
+        self.short_names = short_names
+        self.tpr_kind = tpr_kind
+        self.heartbeat = heartbeat
+        # The node's report resource, once its type is ready.
+        self.resource = None
+        self.is_crd = None
+        # Digest and time of the last published report.
+        self.digest = None
+        self.published_at = None
+
+    # Returns whether the report was published.
+    def publish(self, report):
+        digest = util.json_digest(report)
+        due = self.heartbeat_due()
+        if digest == self.digest and not due:
+            logging.debug("Report is unchanged. Skipping...")
+            return False
+
+        try:
+            resource = self.get_resource()
+            if self.is_crd:
+                resource.body["spec"]["report"] = report
+            else:
+                resource.body["report"] = report
+            saved = resource.save()
+        except Exception as err:
+            self.resource = None
+            self.digest = None
+            k8s.reset_clients_after(err)
+            raise
+        if not saved:
+            # Skipped by the resource, e.g. while its type is not ready.
+            self.digest = None
+            return False
+        self.digest = digest
+        self.published_at = time.monotonic()
+        return True
+
+    def heartbeat_due(self):
+        if not self.heartbeat or self.published_at is None:
+            return False
+        return time.monotonic() - self.published_at >= self.heartbeat
+
+    def get_resource(self):
+        if self.resource is not None:
+            return self.resource
+
+        k8sconfig.load_incluster_config()
+        v1beta = k8sclient.ExtensionsV1beta1Api()
+        version = util.parse_version(k8s.get_kube_version(None))
+        # custom_resource and third_party throw an exception if the
+        # environment variable is not set.
+        node_name = os.getenv("NODE_NAME")
+
+        self.is_crd = version >= util.parse_version("v1.7.0")
+        if self.is_crd:
+            resource_type = custom_resource.CustomResourceDefinitionType(
+                v1beta,
+                "intel.com",
+                self.crd_name,
+                self.short_names
+            )
+        else:
+            resource_type = third_party.ThirdPartyResourceType(
+                v1beta,
+                "cmk.intel.com",
+                self.tpr_kind)
+        # Creates the resource type and waits until it is ready.
+        self.resource = resource_type.create(node_name)
+        logging.debug("Publishing reports as {} {}".format(
+            self.crd_name if self.is_crd else self.tpr_kind, node_name))
+        return self.resource
@@ -1,9 +1,12 @@
-from . import k8s
-from kubernetes.client.rest import ApiException as K8sApiException
 import logging
-import psutil
 import sys
+
+import psutil
 import yaml
+from kubernetes.client.rest import ApiException as K8sApiException
+
+from intel.cpuset import CpuSet
+from . import k8s
 
 
 def reaffinitize(node_name, namespace):
@@ -36,11 +39,11 @@ def reaffinitize_cores(procs):
         affin = p.cpu_affinity()
         affin_found = False
         for pid in list(procs.process_map.keys()):
-            cl = ",".join(procs.process_map[pid].old_clists)
-            correct_clist = [int(c) for c in cl.split(",")]
-            if set(correct_clist) == set(affin):
-                new_affin = [int(c) for c in
-                             procs.process_map[pid].new_clist.split(",")]
+            correct_cpus = CpuSet.parse_lists(
+                procs.process_map[pid].old_clists)
+            if correct_cpus == CpuSet(affin):
+                new_affin = list(CpuSet.parse(
+                    procs.process_map[pid].new_clist))
                 logging.info("New core alignment: {}"
                              .format(new_affin))
                 affin_found = True
@@ -17,15 +17,15 @@ import logging
 import os
 import time
 
-from kubernetes import config as k8sconfig, client as k8sclient
-from . import config, proc, third_party, custom_resource, k8s, util
+from . import config, k8s, proc, publisher
 
 
-def reconcile(seconds, publish, namespace):
+def reconcile(seconds, publish, namespace, heartbeat=None,
+              verify_start_time=False):
     pod_name = os.environ["HOSTNAME"]
     node_name = k8s.get_node_from_pod(None, pod_name)
     configmap_name = "cmk-config-{}".format(node_name)
-    c = config.Config(configmap_name, pod_name, namespace)
+    c = config.Config(configmap_name, pod_name, namespace, cache=True)
     report = None
 
     if seconds is None:
@@ -34,10 +34,13 @@ def reconcile(seconds, publish, namespace):
         seconds = int(seconds)
 
     should_exit = (seconds <= 0)
+    report_publisher = publisher.ReportPublisher(
+        "cmk-reconcilereport", ["cmk-rr"], "Reconcilereport",
+        heartbeat)
 
     while True:
         c.lock()
-        report = generate_report(c)
+        report = generate_report(c, verify_start_time)
         print(report.json())
         reclaim_cpu_lists(c, report)
         c.unlock()
@@ -45,34 +48,14 @@ def reconcile(seconds, publish, namespace):
         if publish and report is not None:
             logging.debug("Publishing reconcile report to "
                           "Kubernetes API server")
-            k8sconfig.load_incluster_config()
-            v1beta = k8sclient.ExtensionsV1beta1Api()
-
-            version = util.parse_version(k8s.get_kube_version(None))
-
-            if version >= util.parse_version("v1.7.0"):
-                reconcile_report_type = \
-                    custom_resource.CustomResourceDefinitionType(
-                        v1beta,
-                        "intel.com",
-                        "cmk-reconcilereport",
-                        ["cmk-rr"]
-                    )
-
-                node_name = os.getenv("NODE_NAME")
-                reconcile_report = reconcile_report_type.create(node_name)
-                reconcile_report.body["spec"]["report"] = report
-                reconcile_report.save()
-            else:
-                reconcile_report_type = third_party.ThirdPartyResourceType(
-                    v1beta,
-                    "cmk.intel.com",
-                    "Reconcilereport")
-
-                node_name = os.getenv("NODE_NAME")
-                reconcile_report = reconcile_report_type.create(node_name)
-                reconcile_report.body["report"] = report
-                reconcile_report.save()
+            try:
+                report_publisher.publish(report)
+            except Exception as err:
+                if should_exit:
+                    raise
+                # Retried with a fresh client on the next iteration.
+                logging.error("Error publishing reconcile report: {}"
+                              .format(err))
 
         if should_exit:
             break
@@ -91,22 +74,43 @@ def reclaim_cpu_lists(conf, report):
         cl.remove_task(str(r.pid()))
 
 
-def generate_report(conf):
+# Reports the cpu lists of tasks whose process no longer exists. The pids in
+# procfs are read with a single directory scan. With verify_start_time, the
+# cpu lists of a task whose pid was reused by a new process are reported
+# too.
+def generate_report(conf, verify_start_time=False):
     report = ReconcileReport()
+    live = proc.live_pids()
+
+    # Every task is checked once, however many cpu lists it holds.
+    for task in list(conf.get_tasks()):
+        pid = int(task)
+        if pid in live and not \
+                (verify_start_time and pid_reused(conf, task, pid)):
+            continue
+        for pool, core_id in conf.get_task_core_lists(task):
+            report.add_reclaimed_cpu_list(pid, pool, core_id)
 
-    for pool in conf.get_pools():
-        p = conf.get_pool(pool)
-        for cl in p.get_core_lists():
-            for task in cl.tasks:
-                p = proc.Process(task)
-                if not p.exists():
-                    report.add_reclaimed_cpu_list(
-                        p.pid,
-                        pool,
-                        cl.core_id)
     return report
 
 
+# Returns whether the process pid was started after the one the task's cpu
+# lists were given to, as recorded at allocation time.
+def pid_reused(conf, task, pid):
+    recorded = conf.get_task_start_time(task)
+    if recorded is None:
+        return False
+    try:
+        start_time = proc.Process(pid).start_time()
+    except (OSError, ValueError, IndexError):
+        # Exited since the scan, reclaimed on the next pass.
+        return False
+    if start_time == recorded:
+        return False
+    logging.info("Pid {} has been reused by a new process".format(pid))
+    return True
+
+
 class ReconcileReport(dict):
     def __init__(self):
         self["reclaimedCpuLists"] = []
@@ -1,11 +1,14 @@
-from kubernetes import client as k8sclient
-from kubernetes import stream
-from kubernetes.client.rest import ApiException as K8sApiException
-from . import k8s, config, topology, init, clusterinit, util, discover
 import logging
 import os
 import sys
+
 import yaml
+from kubernetes import client as k8sclient
+from kubernetes import stream
+from kubernetes.client.rest import ApiException as K8sApiException
+
+from intel.cpuset import CpuSet
+from . import clusterinit, config, discover, init, k8s, util
 
 
 class Procs():
@@ -69,9 +72,9 @@ def reconfigure(node_name, num_exclusive_cores, num_shared_cores,
         proc_info = built_proc_info[0]
         procs = built_proc_info[1]
 
-        num_excl_non_isols = len(topology.
-                                 parse_cpus_str(excl_non_isolcpus.
-                                                split(",")))
+        num_excl_non_isols = 0
+        if excl_non_isolcpus != "-1":
+            num_excl_non_isols = len(CpuSet.parse(excl_non_isolcpus))
         check_processes(proc_info, num_exclusive_cores, num_excl_non_isols)
 
         # Maybe can remove config_cm var and conf.c_data
@@ -166,6 +169,7 @@ def reconfigure_directory(c, num_exclusive_cores, num_shared_cores,
         conf = config.update_configmap_exclusive("exclusive-non-isolcpus",
                                                  platform, conf)
     conf = config.update_configmap_shared("infra", platform, conf)
+    config.check_overlaps(conf)
     conf = config.build_config(conf)
 
     # Repatch the nodes with ERs/OIRs
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import datetime
 import logging
 import time
@@ -137,60 +138,104 @@ class ThirdPartyResource:
 
         self.auth_settings = ['BearerToken']
 
-    def remove(self):
-        resource_path = "/".join([
+        self.resource_path = "/".join([
             APIS_PATH,
             self.resource_type.type_url,
             self.resource_type.type_version,
             "namespaces", self.namespace,
-            self.resource_type.type_name + "s",
-            self.name
+            self.resource_type.type_name + "s"
         ])
 
+        self.object_path = "/".join([self.resource_path, self.name])
+
+        # resourceVersion of the resource when it was last created, read
+        # or replaced, None if unknown.
+        self.resource_version = None
+
+    def remove(self):
         self.api.api_client.call_api(
-            resource_path,
+            self.object_path,
             'DELETE',
             self.header_params,
             auth_settings=self.auth_settings)
+        self.resource_version = None
 
     def create(self):
-        resource_path = "/".join([
-            APIS_PATH,
-            self.resource_type.type_url,
-            self.resource_type.type_version,
-            "namespaces", self.namespace,
-            self.resource_type.type_name + "s"
-        ])
-
         self.body["last_updated"] = datetime.datetime.now().isoformat()
 
-        self.api.api_client.call_api(
-            resource_path,
+        self.update_version(self.api.api_client.call_api(
+            self.resource_path,
             'POST',
             self.header_params,
             body=self.body,
-            auth_settings=self.auth_settings)
+            auth_settings=self.auth_settings,
+            response_type="object",
+            _return_http_data_only=True))
+
+    def read(self):
+        self.update_version(self.api.api_client.call_api(
+            self.object_path,
+            'GET',
+            self.header_params,
+            auth_settings=self.auth_settings,
+            response_type="object",
+            _return_http_data_only=True))
 
+    def replace(self):
+        self.body["last_updated"] = datetime.datetime.now().isoformat()
+        body = copy.deepcopy(self.body)
+        body["metadata"]["resourceVersion"] = self.resource_version
+
+        self.update_version(self.api.api_client.call_api(
+            self.object_path,
+            'PUT',
+            self.header_params,
+            body=body,
+            auth_settings=self.auth_settings,
+            response_type="object",
+            _return_http_data_only=True))
+
+    def update_version(self, result):
+        if isinstance(result, dict):
+            self.resource_version = \
+                result.get("metadata", {}).get("resourceVersion")
+
+    # Returns whether the resource was saved.
     def save(self):
         try:
-            self.create()
+            self.upsert()
 
         except K8sApiException as e:
             if e.status == client.NOT_FOUND:
                 logging.warning("Third Party Resource is not ready yet. "
                                 "Report will be skipped")
-                return
+                return False
             if e.status == client.METHOD_NOT_ALLOWED:
                 logging.error("API is blocked. Report will be skipped")
-                return
-            if e.status != client.CONFLICT:
-                raise e
-            logging.info("Previous resource has been detected. Recreating...")
+                return False
+            raise e
+        return True
 
+    def upsert(self):
+        if self.resource_version is None:
             try:
-                self.remove()
+                self.create()
+                return
             except K8sApiException as e:
-                if e.status != client.NOT_FOUND:
+                if e.status != client.CONFLICT:
                     raise e
+            logging.info("Previous resource has been detected. Updating...")
+            self.read()
 
-            self.create()
+        try:
+            self.replace()
+        except K8sApiException as e:
+            if e.status == client.NOT_FOUND:
+                # Removed since it was last saved.
+                self.create()
+            elif e.status == client.CONFLICT:
+                # Changed by somebody else since it was last saved.
+                self.read()
+                self.replace()
+            else:
+                raise e
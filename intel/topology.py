@@ -12,12 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from . import proc
-from collections import OrderedDict
+import hashlib
 import json
 import logging
 import os
+import re
 import subprocess
+import threading
+from collections import OrderedDict
+
+from intel.cpuset import CpuSet
+from . import proc
 from . import sst_bf
 from . import sst_cp
 
@@ -25,25 +30,89 @@ ENV_LSCPU_SYSFS = "CMK_DEV_LSCPU_SYSFS"
 
 
 # Returns a dictionary of socket_id (int) to intel.topology.Socket.
-def discover(sst_bf_discovery):
-    isol = isolcpus()
+# With cache, lscpu, the isolated cpus and the SST-BF cpus are only read
+# again when the fingerprint of the topology changed since the last call.
+def discover(sst_bf_discovery, cache=False):
+    values = topology_cache.current() if cache else {}
+
+    def cached(name, read):
+        if name not in values:
+            values[name] = read()
+        return values[name]
+
+    isol = cached("isolcpus", isolcpus)
     if isol:
         logging.info("Isolated logical cores: {}".format(
             ",".join([str(c) for c in isol])))
 
     sst_bf_cpus = []
     if sst_bf_discovery:
-        sst_bf_cpus = sst_bf.cpus()
+        sst_bf_cpus = cached("sst_bf", sst_bf.cpus)
         if sst_bf_cpus:
             logging.info("High priority SST-BF cores: {}".format(
                 ",".join([str(c) for c in sst_bf_cpus])))
 
-    return parse(lscpu(), isol, sst_bf_cpus)
+    return parse(cached("lscpu", lscpu), isol, sst_bf_cpus)
+
+
+# The CPU topology only changes with a reboot or CPU hotplug. Long running
+# processes keep what discover() read for as long as the fingerprint stays
+# the same.
+class TopologyCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.key = None
+        self.values = {}
+
+    # Returns the cached values for the current fingerprint, or an empty,
+    # uncached dictionary if there is no fingerprint.
+    def current(self):
+        key = fingerprint()
+        if key is None:
+            return {}
+        with self.lock:
+            if key != self.key:
+                if self.key is not None:
+                    logging.info("CPU topology may have changed, "
+                                 "discovering it again")
+                self.key = key
+                self.values = {}
+            return self.values
+
+
+topology_cache = TopologyCache()
+
+
+# Returns a fingerprint of the online cpus, the kernel command line and the
+# boot id, or None if any of them can not be read.
+def fingerprint():
+    paths = [os.path.join(sysfs(), "devices", "system", "cpu", "online"),
+             os.path.join(proc.procfs(), "cmdline"),
+             os.path.join(proc.procfs(), "sys", "kernel", "random",
+                          "boot_id")]
+    key = []
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                key.append((path, hashlib.sha256(f.read()).hexdigest()))
+        except OSError:
+            return None
+    return tuple(key)
 
 
 class Platform:
     def __init__(self, sockets):
         self.sockets = sockets
+        self.numa_nodes = {}
+        for socket in sockets.values():
+            for core in socket.cores.values():
+                node_id = core.numa_node()
+                if node_id is None:
+                    continue
+                if node_id not in self.numa_nodes:
+                    self.numa_nodes[node_id] = NumaNode(node_id,
+                                                        socket.socket_id)
+                self.numa_nodes[node_id].cores[core.core_id] = core
 
     def has_isolated_cores(self):
         for socket in self.sockets.values():
@@ -68,6 +137,16 @@ class Platform:
             return None
         return self.sockets[id]
 
+    def get_numa_node(self, id):
+        return self.numa_nodes.get(id)
+
+    def locality_units(self):
+        # Returns the NUMA nodes if there are more of them than sockets,
+        # e.g. with sub-NUMA clustering, otherwise the sockets.
+        if len(self.numa_nodes) > len(self.sockets):
+            return [self.numa_nodes[n] for n in sorted(self.numa_nodes)]
+        return list(self.sockets.values())
+
     def get_cores(self, mode="packed"):
         return self.get_cores_general(mode, False)
 
@@ -102,20 +181,20 @@ class Platform:
         return cores
 
     def allocate_spread(self, isolated_cores=False, sst_bf_cores=False):
+        # Spreads the cores over the sockets or, on platforms with several
+        # NUMA nodes per socket, over the NUMA nodes.
         output_cores = []
         socket_cores = {}
 
-        for socket in self.sockets:
+        for socket, unit in enumerate(self.locality_units()):
             if isolated_cores and sst_bf_cores:
-                socket_cores[socket] = \
-                    self.sockets[socket].get_isolated_sst_bf_cores()
+                socket_cores[socket] = unit.get_isolated_sst_bf_cores()
             elif isolated_cores and not sst_bf_cores:
-                socket_cores[socket] = \
-                    self.sockets[socket].get_isolated_cores()
+                socket_cores[socket] = unit.get_isolated_cores()
             elif not isolated_cores and sst_bf_cores:
-                socket_cores[socket] = self.sockets[socket].get_sst_bf_cores()
+                socket_cores[socket] = unit.get_sst_bf_cores()
             else:
-                socket_cores[socket] = self.sockets[socket].get_cores()
+                socket_cores[socket] = unit.get_cores()
         while len(socket_cores) > 0:
             sockets = [socket for socket in socket_cores]
             for socket in sockets:
@@ -139,6 +218,19 @@ class Platform:
             cores += socket.get_cores_from_pool(pool)
         return cores
 
+    def get_cpus(self):
+        # Returns a map of cpu id to intel.topology.CPU.
+        cpus = {}
+        for socket in self.sockets.values():
+            for core in socket.cores.values():
+                cpus.update(core.cpus)
+        return cpus
+
+    def cache_domains(self):
+        # Returns a map of cpu id to the (L2, L3) cache ids of the cpu.
+        return {cpu_id: (cpu.l2, cpu.l3)
+                for cpu_id, cpu in self.get_cpus().items()}
+
     def get_epp_cores(self, epp_value, num_required,
                       unavailable_cores=[]):
         return sst_cp.get_epp_cores(self, epp_value, num_required,
@@ -148,13 +240,33 @@ class Platform:
         return sst_cp.get_epp_cores_no_limit(self, epp_value)
 
 
+# The lists of isolated, shared, SST-BF and per pool cores are computed
+# once and kept until a core is added to or removed from the socket, or
+# (for the pools) the pool of any core changes. The cores and cpus
+# themselves are not expected to change after parsing.
 class Socket:
+    __slots__ = ("socket_id", "cores", "views")
+
     def __init__(self, socket_id, cores=None):
         if not cores:
             cores = {}
         self.socket_id = socket_id
         self.cores = OrderedDict(
             sorted(cores.items(), key=lambda pair: pair[1].core_id))
+        self.views = {}
+
+    # Returns the cached value of view, computing it again if key changed.
+    def view(self, name, key, compute):
+        cached = self.views.get(name)
+        if cached is None or cached[0] != key:
+            cached = (key, compute())
+            self.views[name] = cached
+        return cached[1]
+
+    # Returns a copy of the cores for which select is true.
+    def select_cores(self, name, select):
+        return list(self.view(name, len(self.cores), lambda: [
+            core for core in self.cores.values() if select(core)]))
 
     def has_isolated_cores(self):
         for core in self.cores.values():
@@ -178,20 +290,30 @@ class Socket:
         return [core for core in self.cores.values()]
 
     def get_isolated_cores(self):
-        return [core for core in self.cores.values() if core.is_isolated()]
+        return self.select_cores("isolated", Core.is_isolated)
 
     def get_sst_bf_cores(self):
-        return [core for core in self.cores.values() if core.is_sst_bf()]
+        return self.select_cores("sst_bf", Core.is_sst_bf)
 
     def get_isolated_sst_bf_cores(self):
-        return [core for core in self.cores.values()
-                if core.is_sst_bf() and core.is_isolated()]
+        return self.select_cores(
+            "isolated_sst_bf",
+            lambda core: core.is_sst_bf() and core.is_isolated())
 
     def get_shared_cores(self):
-        return [core for core in self.cores.values() if not core.is_isolated()]
+        return self.select_cores("shared",
+                                 lambda core: not core.is_isolated())
 
     def get_cores_from_pool(self, pool):
-        return [core for core in self.cores.values() if core.pool == pool]
+        def pool_index():
+            index = {}
+            for core in self.cores.values():
+                index.setdefault(core.pool, []).append(core)
+            return index
+
+        index = self.view("pools", (len(self.cores), Core.pool_changes),
+                          pool_index)
+        return list(index.get(pool, []))
 
     def as_dict(self, include_pool=True):
         return {
@@ -203,18 +325,52 @@ class Socket:
         return json.dumps(self.as_dict(), indent=2, sort_keys=True)
 
 
+# The cores of a socket that belong to one NUMA node.
+class NumaNode(Socket):
+    __slots__ = ("node_id",)
+
+    def __init__(self, node_id, socket_id, cores=None):
+        Socket.__init__(self, socket_id, cores)
+        self.node_id = node_id
+
+    def as_dict(self, include_pool=True):
+        result = Socket.as_dict(self, include_pool)
+        result["id"] = self.node_id
+        result["socket"] = self.socket_id
+        return result
+
+
 class Core:
+    __slots__ = ("core_id", "_pool", "cpus")
+
+    # Number of pool assignments so far, on any core.
+    pool_changes = 0
+
     def __init__(self, core_id, cpus=None):
         if not cpus:
             cpus = {}
         self.core_id = core_id
-        self.pool = None
+        self._pool = None
         self.cpus = OrderedDict(
             sorted(cpus.items(), key=lambda pair: pair[1].cpu_id))
 
+    @property
+    def pool(self):
+        return self._pool
+
+    @pool.setter
+    def pool(self, pool):
+        self._pool = pool
+        Core.pool_changes += 1
+
     def cpu_ids(self):
         return list(self.cpus.keys())
 
+    def numa_node(self):
+        for cpu in self.cpus.values():
+            return cpu.numa_node
+        return None
+
     def is_isolated(self):
         if len(self.cpus) == 0:
             return False
@@ -248,10 +404,17 @@ class Core:
 
 
 class CPU:
+    __slots__ = ("cpu_id", "isolated", "sst_bf", "numa_node", "l2", "l3")
+
     def __init__(self, cpu_id):
         self.cpu_id = cpu_id
         self.isolated = False
         self.sst_bf = False
+        # Ids of the NUMA node and the L2 and L3 caches of the CPU, None
+        # if unknown.
+        self.numa_node = None
+        self.l2 = None
+        self.l3 = None
 
     def as_dict(self):
         if self.sst_bf:
@@ -275,16 +438,22 @@ class CPU:
 # # CPU,Core,Socket,Node,,L1d,L1i,L2,L3
 # 0,0,0,0,,0,0,0,0
 # 1,1,0,0,,1,1,1,0
+# The CPU, Core and Socket columns always come first, the positions of the
+# Node and cache columns are taken from the header.
 def parse(lscpu_output, isolated_cpus=None, sst_bf_cpus=None):
-    if not isolated_cpus:
-        isolated_cpus = []
-
-    if not sst_bf_cpus:
-        sst_bf_cpus = []
+    isolated_cpus = CpuSet(isolated_cpus or [])
+    sst_bf_cpus = CpuSet(sst_bf_cpus or [])
 
     sockets = {}
+    node_column = l2_column = l3_column = None
 
     for line in lscpu_output.split("\n"):
+        if line.startswith("# CPU,"):
+            names = line[2:].split(",")
+            columns = {name: i for i, name in enumerate(names) if name}
+            node_column = columns.get("Node")
+            l2_column = columns.get("L2")
+            l3_column = columns.get("L3")
         if line and not line.startswith("#"):
             cpuinfo = line.split(",")
 
@@ -308,12 +477,30 @@ def parse(lscpu_output, isolated_cpus=None, sst_bf_cpus=None):
             if cpu.cpu_id in sst_bf_cpus:
                 cpu.sst_bf = True
 
+            cpu.numa_node = parse_column(cpuinfo, node_column)
+            cpu.l2 = parse_column(cpuinfo, l2_column)
+            cpu.l3 = parse_column(cpuinfo, l3_column)
+
             core.cpus[cpu_id] = cpu
 
     return Platform(sockets)
 
 
+def parse_column(cpuinfo, index):
+    if index is None or index >= len(cpuinfo) or not cpuinfo[index]:
+        return None
+    return int(cpuinfo[index])
+
+
+# Returns the cpu topology in the format of `lscpu -p`. It is read from
+# sysfs directly, falling back to running lscpu if that fails.
 def lscpu():
+    try:
+        return read_sysfs_topology()
+    except (OSError, ValueError) as err:
+        logging.debug("Could not read the cpu topology from {}, running "
+                      "lscpu: {}".format(sysfs(), err))
+
     sys_fs_path = os.getenv(ENV_LSCPU_SYSFS)
     if sys_fs_path is None:
         cmd_out = subprocess.check_output("lscpu -p", shell=True)
@@ -324,6 +511,151 @@ def lscpu():
     return cmd_out.decode("UTF-8")
 
 
+# Returns the topology of the online cpus in sysfs, formatted like the
+# output of `lscpu -p`. Like lscpu, cores, sockets and caches are numbered
+# in the order of their first cpu, except for caches with an id in sysfs.
+# Raises OSError if the topology of a cpu can not be read.
+def read_sysfs_topology():
+    cpu_dir = os.path.join(sysfs(), "devices", "system", "cpu")
+    cpu_ids = online_cpus(cpu_dir)
+    nodes = node_cpus()
+
+    cores = {}
+    sockets = {}
+    # Cache name (e.g. "L2") to a map of shared cpu list to cache id.
+    caches = {}
+    rows = []
+    for cpu_id in cpu_ids:
+        path = os.path.join(cpu_dir, "cpu{}".format(cpu_id))
+        core = logical_id(cores, read_topology(path, "thread_siblings_list"))
+        socket = logical_id(sockets, read_topology(path, "core_siblings_list",
+                                                   "package_cpus_list"))
+        cpu_caches = {}
+        for name, shared_cpus, cache_id in read_caches(path):
+            ids = caches.setdefault(name, {})
+            if shared_cpus not in ids:
+                ids[shared_cpus] = len(ids) if cache_id is None else cache_id
+            cpu_caches[name] = ids[shared_cpus]
+        rows.append((cpu_id, core, socket, nodes.get(cpu_id), cpu_caches))
+
+    names = sorted(caches)
+    lines = ["# " + ",".join(["CPU", "Core", "Socket", "Node"] +
+                             ([""] + names if names else []))]
+    for cpu_id, core, socket, node, cpu_caches in rows:
+        columns = [cpu_id, core, socket, node]
+        if names:
+            columns += [None] + [cpu_caches.get(name) for name in names]
+        lines.append(",".join("" if c is None else str(c) for c in columns))
+    return "\n".join(lines) + "\n"
+
+
+# Returns the ids of the online cpus that have a topology in sysfs.
+def online_cpus(cpu_dir):
+    online = os.path.join(cpu_dir, "online")
+    if os.path.exists(online):
+        cpu_ids = list(CpuSet.parse(read_sysfs_file(online)))
+    else:
+        cpu_ids = sorted(int(name[3:]) for name in os.listdir(cpu_dir)
+                         if re.match(r"cpu\d+$", name))
+    cpu_ids = [cpu_id for cpu_id in cpu_ids if os.path.isdir(
+        os.path.join(cpu_dir, "cpu{}".format(cpu_id), "topology"))]
+    if not cpu_ids:
+        raise OSError("No cpu topology in {}".format(cpu_dir))
+    return cpu_ids
+
+
+# Returns a map of cpu id to NUMA node id.
+def node_cpus():
+    node_dir = os.path.join(sysfs(), "devices", "system", "node")
+    nodes = {}
+    if not os.path.isdir(node_dir):
+        return nodes
+    for name in os.listdir(node_dir):
+        if not re.match(r"node\d+$", name):
+            continue
+        cpulist = read_sysfs_file(os.path.join(node_dir, name, "cpulist"))
+        for cpu_id in CpuSet.parse(cpulist):
+            nodes[cpu_id] = int(name[4:])
+    return nodes
+
+
+# Returns the content of the first of the topology files of a cpu that
+# exists.
+def read_topology(cpu_path, *names):
+    for name in names[:-1]:
+        path = os.path.join(cpu_path, "topology", name)
+        if os.path.exists(path):
+            return read_sysfs_file(path)
+    return read_sysfs_file(os.path.join(cpu_path, "topology", names[-1]))
+
+
+# Returns (name, shared cpu list, id or None) of the caches of a cpu.
+def read_caches(cpu_path):
+    cache_dir = os.path.join(cpu_path, "cache")
+    if not os.path.isdir(cache_dir):
+        return []
+    caches = []
+    for index in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, index)
+        if not re.match(r"index\d+$", index):
+            continue
+        level = read_sysfs_file(os.path.join(path, "level"))
+        cache_type = read_sysfs_file(os.path.join(path, "type"))
+        name = "L" + level + {"Data": "d", "Instruction": "i"}.get(
+            cache_type, "")
+        cache_id = None
+        if os.path.exists(os.path.join(path, "id")):
+            cache_id = int(read_sysfs_file(os.path.join(path, "id")))
+        caches.append((name, read_sysfs_file(
+            os.path.join(path, "shared_cpu_list")), cache_id))
+    return caches
+
+
+def logical_id(ids, key):
+    if key not in ids:
+        ids[key] = len(ids)
+    return ids[key]
+
+
+def read_sysfs_file(path):
+    with open(path) as f:
+        return f.read().strip()
+
+
+# Returns the sysfs mount point, below CMK_DEV_LSCPU_SYSFS if it is set.
+def sysfs():
+    return os.path.join(os.getenv(ENV_LSCPU_SYSFS, "/"), "sys")
+
+
+# Returns the NUMA node (None if unknown) and the ids of the cpus local to a
+# PCI device, given its address (e.g. "0000:18:00.1") or the name of its
+# network interface. Raises OSError if the device does not exist.
+def device_locality(device):
+    paths = [os.path.join(sysfs(), "bus", "pci", "devices", device),
+             os.path.join(sysfs(), "class", "net", device, "device")]
+    path = next((p for p in paths if os.path.isdir(p)), None)
+    if path is None:
+        raise OSError("Device {} not found in {}".format(device, sysfs()))
+
+    numa_node = None
+    if os.path.exists(os.path.join(path, "numa_node")):
+        with open(os.path.join(path, "numa_node")) as f:
+            numa_node = int(f.read().strip())
+        # The kernel reports -1 for devices without NUMA affinity.
+        if numa_node < 0:
+            numa_node = None
+
+    cpulists = [os.path.join(path, "local_cpulist")]
+    if numa_node is not None:
+        cpulists.append(os.path.join(sysfs(), "devices", "system", "node",
+                                     "node{}".format(numa_node), "cpulist"))
+    for cpulist in cpulists:
+        if os.path.exists(cpulist):
+            with open(cpulist) as f:
+                return numa_node, list(CpuSet.parse(f.read()))
+    return numa_node, []
+
+
 def isolcpus():
     with open(os.path.join(proc.procfs(), "cmdline")) as f:
         return parse_isolcpus(f.read())
@@ -331,7 +663,7 @@ def isolcpus():
 
 # Returns list of isolated cpu ids from /proc/cmdline content.
 def parse_isolcpus(cmdline):
-    cpus = []
+    cpus = CpuSet()
 
     # Ensure that newlines are removed.
     cmdline_stripped = cmdline.rstrip()
@@ -346,23 +678,6 @@ def parse_isolcpus(cmdline):
         value = pair[1]
 
         if key == "isolcpus":
-            cpus_str = value.split(",")
-            cpus += parse_cpus_str(cpus_str)
-
-    # Get unique cpu_ids from list
-    cpus = list(set(cpus))
-    return cpus
-
+            cpus |= CpuSet.parse(value)
 
-def parse_cpus_str(cpus_str):
-    cpus = []
-    for cpu_id in cpus_str:
-        if "-" not in cpu_id:
-            cpus.append(int(cpu_id))
-            continue
-        cpu_range = cpu_id.split("-")
-        cpu_range = ' '.join(cpu_range).split()
-        if len(cpu_range) != 2:
-            continue
-        cpus += range(int(cpu_range[0]), int(cpu_range[1])+1)
-    return cpus
+    return list(cpus)
@@ -36,6 +36,8 @@ def uninstall(install_dir, conf_dir, namespace):
                    postfix=os.getenv("NODE_NAME"))
     delete_cmk_pod("cmk-reconcile-nodereport-ds", namespace,
                    postfix=os.getenv("NODE_NAME"))
+    delete_cmk_pod("cmk-reconcile-nodereport-agent-ds", namespace,
+                   postfix=os.getenv("NODE_NAME"))
 
     delete_cmk_pod("cmk-node-report-ds-all", namespace)
     delete_cmk_pod("cmk-reconcile-ds-all", namespace)
@@ -12,18 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
+import json
 import logging
 import re
 from base64 import b64encode
 from datetime import datetime, timedelta
+from os.path import join, normpath, pardir, realpath
+
 from cryptography import x509
-from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.asymmetric import rsa
 from packaging.version import parse
 
-from os.path import normpath, realpath, join, pardir
+from intel.cpuset import CpuSet
 
 
 def cmk_root():
@@ -108,7 +112,12 @@ def generate_secrets(service, namespace):
 
 
 def convert_array2bitmask(array):
-    bitmask = 0
-    for val in array:
-        bitmask = bitmask | (1 << val)
-    return str(hex(bitmask))[2:].upper()
+    return CpuSet(array).hex_mask()
+
+
+# Returns a digest of a JSON serializable object, which only depends on its
+# content, e.g. not on the order of the keys of its dicts.
+def json_digest(obj):
+    data = json.dumps(obj, sort_keys=True, separators=(",", ":"),
+                      default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
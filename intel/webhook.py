@@ -12,13 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from yamlreader import yaml_load, data_merge as merge, YamlReaderError
-import ssl
-import logging
-import json
 import base64
+import copy
+import json
+import logging
+import os
+import re
+import signal
+import ssl
 import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from yamlreader import data_merge as merge, yaml_load, YamlReaderError
+
+from intel import metrics
 
 CMK_ER_NAME = ['cmk.intel.com/exclusive-cores',
                'cmk.intel.com/exclusive-non-isolcpus-cores']
@@ -27,11 +36,64 @@ ENV_NUM_CORES = 'CMK_NUM_CORES'
 CIPHERS = "ECDHE-RSA-AES256-GCM-SHA384:\
 ECDHE-ECDSA-AES256-GCM-SHA384"
 
+# Admission reviews that don't mention CMK anywhere can't require a
+# mutation: the extended resources and the mutate annotation all contain
+# it.
+CMK_MARKER = b"cmk.intel.com"
+# Matches the start of a pod admission review as serialized by the API
+# server, which writes the fields in a fixed order, capturing its
+# apiVersion and request uid.
+FAST_PATH_RE = re.compile(
+    rb'\s*\{\s*"kind"\s*:\s*"AdmissionReview"\s*,'
+    rb'\s*"apiVersion"\s*:\s*"([^"\\]+)"\s*,'
+    rb'\s*"request"\s*:\s*\{\s*"uid"\s*:\s*"([^"\\]+)"\s*,'
+    rb'\s*"kind"\s*:\s*\{[^{}]*"kind"\s*:\s*"Pod"')
+ALLOW_RESPONSE = b'{"kind":"AdmissionReview","apiVersion":"%s",' \
+                 b'"response":{"allowed":true,"uid":"%s"}}'
+
+# Serving modes: "threaded" handles each connection in its own thread,
+# "single" handles one connection at a time.
+SERVER_MODES = ["threaded", "single"]
+DEFAULT_SERVER_MODE = "threaded"
+# Connections served at once in "threaded" mode. Further ones wait to be
+# accepted until one is closed.
+DEFAULT_MAX_CONNECTIONS = 128
+# Seconds an idle keep-alive connection is kept open for the next request.
+DEFAULT_KEEP_ALIVE_TIMEOUT = 2
+# Seconds a client is waited for in the middle of the TLS handshake or a
+# request.
+DEFAULT_REQUEST_TIMEOUT = 10
+# Largest admission request body accepted, in bytes. An admission review
+# carries the pod, and its old version on updates, and the API server
+# accepts objects of up to 1.5 MiB.
+DEFAULT_MAX_REQUEST_SIZE = 3 * 1024 * 1024
+
 
 class MutationError(Exception):
     pass
 
 
+# Prometheus metrics, served on /metrics.
+registry = metrics.Registry()
+request_duration = registry.histogram(
+    "cmk_webhook_request_duration_seconds",
+    "Time spent handling admission requests, by path through the handler "
+    "(fast, skipped, mutated or failed).", ["path"])
+mutation_duration = registry.histogram(
+    "cmk_webhook_mutation_duration_seconds",
+    "Time spent applying the mutations to a pod.")
+patch_duration = registry.histogram(
+    "cmk_webhook_patch_duration_seconds",
+    "Time spent generating and encoding the JSON patch of a pod.")
+admissions = registry.counter(
+    "cmk_webhook_admissions_total",
+    "Admission requests by result (mutated, skipped or failed).",
+    ["result"])
+tls_handshake_failures = registry.counter(
+    "cmk_webhook_tls_handshake_failures_total",
+    "TLS handshakes with clients that failed.")
+
+
 class WebhookServerConfig(object):
     def __init__(self):
         self.server = {}
@@ -50,10 +112,28 @@ class WebhookServerConfig(object):
             self.cert = config["server"]["cert"]
             self.key = config["server"]["key"]
             self.mutations = config["server"]["mutations"]
-        except KeyError as err:
+            self.mode = config["server"].get("mode", DEFAULT_SERVER_MODE)
+            self.max_connections = int(config["server"].get(
+                "max-connections", DEFAULT_MAX_CONNECTIONS))
+            self.keep_alive_timeout = float(config["server"].get(
+                "keep-alive-timeout", DEFAULT_KEEP_ALIVE_TIMEOUT))
+            self.request_timeout = float(config["server"].get(
+                "request-timeout", DEFAULT_REQUEST_TIMEOUT))
+            self.max_request_size = int(config["server"].get(
+                "max-request-size", DEFAULT_MAX_REQUEST_SIZE))
+        except (KeyError, ValueError) as err:
             logging.error("Error loading configuration: {}".format(str(err)))
             sys.exit(1)
 
+        if self.mode not in SERVER_MODES:
+            logging.error("Unknown server mode {}, must be one of {}"
+                          .format(self.mode, ", ".join(SERVER_MODES)))
+            sys.exit(1)
+        if self.max_connections < 1:
+            logging.error("Maximum number of connections must be a positive "
+                          "integer")
+            sys.exit(1)
+
 
 class WebhookServer(HTTPServer):
     def __init__(self, config, handler_class, cafile, insecure):
@@ -80,50 +160,250 @@ class WebhookServer(HTTPServer):
         except KeyError as err:
             logging.error("Error applying server config {}.".format(str(err)))
             sys.exit(1)
-        self.socket = ssl_context.wrap_socket(self.socket, server_side=True)
+        # The TLS handshake is done by the thread handling the connection,
+        # not while accepting it, so a slow client only holds up its own
+        # connection.
+        self.socket = ssl_context.wrap_socket(self.socket, server_side=True,
+                                              do_handshake_on_connect=False)
+        self.connections = None
+        if self.config.mode == "threaded":
+            self.connections = threading.BoundedSemaphore(
+                self.config.max_connections)
+        self.threads = set()
+        self.threads_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        if self.connections is None:
+            HTTPServer.process_request(self, request, client_address)
+            return
+        # Idle keep-alive connections are closed after keep-alive-timeout,
+        # so a connection waiting here is not held up for long.
+        self.connections.acquire()
+        thread = threading.Thread(target=self.process_request_thread,
+                                  args=(request, client_address),
+                                  daemon=True)
+        with self.threads_lock:
+            self.threads.add(thread)
+        thread.start()
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self.threads_lock:
+                self.threads.discard(threading.current_thread())
+            self.connections.release()
+
+    def finish_request(self, request, client_address):
+        request.settimeout(self.config.request_timeout)
+        try:
+            request.do_handshake()
+        except (ssl.SSLError, OSError) as err:
+            logging.error("TLS handshake with {} failed: {}"
+                          .format(client_address[0], err))
+            tls_handshake_failures.inc()
+            return
+        HTTPServer.finish_request(self, request, client_address)
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        # Let the connections finish the requests in flight.
+        with self.threads_lock:
+            threads = list(self.threads)
+        for thread in threads:
+            thread.join()
 
 
 class WebhookRequestHandler(BaseHTTPRequestHandler):
-    def do_POST(self):  # noqa: N802
-        if self.path.startswith("/mutate"):
-            if self.headers['Content-Type'] != "application/json":
-                logging.error("Incorrect content type")
-                self.send_response(500)
-            content_length = int(self.headers['Content-Length'])
-            if content_length > 10000:
-                logging.error("HTTP body too large")
-                self.send_response(500)
+    # HTTP/1.1 keeps connections, and so TLS sessions, open across
+    # admission requests. Every response needs a Content-Length for it.
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, don't let them wait for
+    # the client's delayed ACK.
+    disable_nagle_algorithm = True
+
+    def handle_one_request(self):
+        # Waits up to keep-alive-timeout for the next request on the
+        # connection, then up to request-timeout for the request itself.
+        config = self.server.config
+        self.connection.settimeout(config.keep_alive_timeout)
+        try:
+            waiting = self.rfile.peek(1)
+        except OSError:
+            # Timed out, or reset by the client.
+            waiting = b""
+        if not waiting:
+            self.close_connection = True
+            return
+        self.connection.settimeout(config.request_timeout)
+        BaseHTTPRequestHandler.handle_one_request(self)
+
+    def do_GET(self):  # noqa: N802
+        if self.path != "/metrics":
+            self.send_empty_response(404)
+            return
+        response = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', metrics.CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
 
-            post_data = self.rfile.read(content_length).decode('utf-8')
+    def do_POST(self):  # noqa: N802
+        if not self.path.startswith("/mutate"):
+            self.send_empty_response(400)
+            return
+        start = time.monotonic()
+        path = self.admit()
+        elapsed = time.monotonic() - start
+        request_duration.observe(elapsed, path=path)
+        admissions.inc(result="skipped" if path == "fast" else path)
+
+    # Handles an admission request, returns the path it took through the
+    # handler.
+    def admit(self):
+        if self.headers['Content-Type'] != "application/json":
+            logging.error("Incorrect content type")
+            self.send_empty_response(500)
+            return "failed"
+        content_length = int(self.headers['Content-Length'])
+        if content_length > self.server.config.max_request_size:
+            logging.error("HTTP body of {} bytes too large, the maximum is "
+                          "{}".format(content_length,
+                                      self.server.config.max_request_size))
+            self.send_empty_response(413)
+            return "failed"
+
+        post_data = self.rfile.read(content_length)
+
+        response = fast_path_response(post_data)
+        if response is not None:
+            self.send_json_response(response)
+            return "fast"
 
-            try:
-                admission_review = json.loads(post_data)
-                if admission_review["kind"] != "AdmissionReview":
-                    logging.error("Request must be an admission review")
-                    raise MutationError
-                mutate(admission_review, self.server.config.mutations)
-                response = json.dumps(admission_review)
-
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(response.encode('utf-8'))
-            except ValueError as err:
-                logging.error("Error while loading request {}".format(
-                              err))
-                self.send_response(500)
-            except MutationError:
-                logging.error("Error mutating resource")
-                self.send_response(500)
+        try:
+            admission_review = json.loads(post_data.decode('utf-8'))
+            if admission_review["kind"] != "AdmissionReview":
+                logging.error("Request must be an admission review")
+                raise MutationError
+            mutate(admission_review, self.server.config.mutations)
+            self.send_json_response(
+                json.dumps(admission_review).encode('utf-8'))
+        except ValueError as err:
+            logging.error("Error while loading request {}".format(
+                          err))
+            self.send_empty_response(500)
+            return "failed"
+        except MutationError:
+            logging.error("Error mutating resource")
+            self.send_empty_response(500)
+            return "failed"
+        if "patch" in admission_review["response"]:
+            return "mutated"
+        return "skipped"
+
+    def send_json_response(self, response):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def send_empty_response(self, code):
+        # The request body may not have been read, so the connection can't
+        # be used for another request.
+        self.close_connection = True
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+
+class MutationTemplate(object):
+    # The mutations of a mutations file, parsed once and re-read only when
+    # the file changes, e.g. when its ConfigMap volume is updated. The
+    # template is shared by all requests and must not be modified; mutate
+    # merges deep copies of it.
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.mutations = None
+        self.version = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        try:
+            st = os.stat(self.filepath)
+            # ConfigMap volumes are updated by swapping symlinks, which
+            # gives the file a new inode.
+            version = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except OSError as err:
+            if self.mutations is None:
+                logging.error("Error opening mutations file {}: {}"
+                              .format(self.filepath, err))
+                sys.exit(1)
+            logging.warning("Cannot stat mutations file {}, using the "
+                            "loaded mutations: {}".format(self.filepath, err))
+            return self.mutations
+
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    self.reload(version)
+        return self.mutations
+
+    def reload(self, version):
+        if self.mutations is None:
+            mutations = load_mutations(self.filepath)
         else:
-            self.send_response(400)
+            # Keep serving the previous mutations if the new ones are
+            # broken.
+            try:
+                mutations = read_mutations(self.filepath)
+            except YamlReaderError as err:
+                logging.error("Error reloading mutations from file {}, "
+                              "using the loaded mutations: {}"
+                              .format(self.filepath, err))
+                self.version = version
+                return
+            logging.info("Reloaded mutations from file {}."
+                         .format(self.filepath))
+        self.mutations = mutations
+        self.version = version
+
+
+# mutations file -> MutationTemplate
+_templates = {}
+
+
+def get_mutations(filepath):
+    if filepath not in _templates:
+        _templates[filepath] = MutationTemplate(filepath)
+    return _templates[filepath].get()
+
+
+def read_mutations(filepath):
+    return yaml_load(filepath).get('mutations', {})
+
+
+# Returns the response allowing a pod admission review that doesn't need a
+# mutation, without decoding the review, or None if the review has to go
+# through mutate.
+def fast_path_response(post_data):
+    if CMK_MARKER in post_data:
+        return None
+    match = FAST_PATH_RE.match(post_data)
+    if match is None:
+        return None
+    return ALLOW_RESPONSE % match.groups()
 
 
 def load_mutations(filepath):
     # load mutations from config file
     try:
-        config = yaml_load(filepath)
-        mutations = config.get('mutations', {})
+        mutations = read_mutations(filepath)
     except YamlReaderError:
         logging.error("Error loading mutations from file {}."
                       .format(filepath))
@@ -142,11 +422,15 @@ def mutate(admission_review, mutations_file):
         raise MutationError
 
     if is_mutation_required(pod):
-        mutations = load_mutations(mutations_file)
+        start = time.monotonic()
+        # keep the pod as received, to only send back what was changed
+        original = copy.deepcopy(pod)
+        mutations = get_mutations(mutations_file)
 
-        # apply pod mutations
+        # apply pod mutations, merge shares the merged values with the pod
+        # so the template is copied each time
         try:
-            merge(pod, mutations.get("perPod", {}))
+            merge(pod, copy.deepcopy(mutations.get("perPod", {})))
         except YamlReaderError as err:
             logging.error("Error when applying pod mutations: "
                           "{}".format(str(err)))
@@ -154,31 +438,32 @@ def mutate(admission_review, mutations_file):
 
         # apply mutation to containers
         for i in range(len(pod['spec']['containers'])):
-            # Need to reload mutations as they were geting changed
-            mutations = load_mutations(mutations_file)
             container = pod['spec']['containers'][i]
 
-            pod['spec']['containers'][i] = apply_mutation(container, mutations)
+            pod['spec']['containers'][i] = \
+                apply_mutation(container, copy.deepcopy(mutations))
 
         # apply mutation to initContainers which may not exist
         try:
             for i in range(len(pod['spec']['initContainers'])):
-                mutations = load_mutations(mutations_file)
                 container = pod['spec']['initContainers'][i]
 
                 pod['spec']['initContainers'][i] = \
-                    apply_mutation(container, mutations)
+                    apply_mutation(container, copy.deepcopy(mutations))
         except KeyError:
             pass
 
+        patch_start = time.monotonic()
+        mutation_duration.observe(patch_start - start)
         # generate patch based on modified pod spec
-        patch = generate_patch(pod)
+        patch = generate_patch(original, pod)
 
         resp = {
             'allowed': True,
             'uid': admission_review['request']['uid'],
             'patch': encode_patch(patch)
         }
+        patch_duration.observe(time.monotonic() - patch_start)
 
     else:
         logging.info("Mutation is not required. Skipping...")
@@ -223,23 +508,48 @@ def apply_mutation(container, mutations):
     return container
 
 
-def generate_patch(pod):
-    # NOTE: workaround for K8s API server not accepting '/' as a patch path
-    patch = [
-        {
-            'op': 'replace',
-            'path': '/metadata',
-            'value': pod['metadata']
-        },
-        {
-            'op': 'replace',
-            'path': '/spec',
-            'value': pod['spec']
-        }
-    ]
+# Returns the RFC 6902 JSON Patch that turns the original pod into the
+# mutated one. Only the changed parts of the pod are sent, so fields set by
+# other admission webhooks in the meantime are left alone.
+def generate_patch(original, pod):
+    patch = []
+    diff(original, pod, "", patch)
     return patch
 
 
+def diff(old, new, path, patch):
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                patch.append({'op': 'remove',
+                              'path': path + '/' + escape_path(key)})
+        for key, value in new.items():
+            key_path = path + '/' + escape_path(key)
+            if key not in old:
+                patch.append({'op': 'add', 'path': key_path, 'value': value})
+            else:
+                diff(old[key], value, key_path, patch)
+    elif isinstance(old, list) and isinstance(new, list):
+        # Mutations append to lists (env, volumes, tolerations...), which
+        # become "add" operations of the new items.
+        common = min(len(old), len(new))
+        for i in range(common):
+            diff(old[i], new[i], "{}/{}".format(path, i), patch)
+        for i in range(common, len(new)):
+            patch.append({'op': 'add', 'path': "{}/{}".format(path, i),
+                          'value': new[i]})
+        # Removed from the end, so the indexes of the others don't move.
+        for i in reversed(range(common, len(old))):
+            patch.append({'op': 'remove', 'path': "{}/{}".format(path, i)})
+    elif old != new:
+        patch.append({'op': 'replace', 'path': path, 'value': new})
+
+
+def escape_path(key):
+    # JSON Pointer escaping (RFC 6901), e.g. for annotation names.
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+
 def inject_env(container, name, value):
     if 'env' not in container:
         container['env'] = []
@@ -290,10 +600,21 @@ def is_mutation_required(pod):
 def webhook(config_file, cafile, insecure):
     config = WebhookServerConfig()
     config.load(config_file)
+    # fail early on a broken mutations file
+    get_mutations(config.mutations)
 
     webhook_server = WebhookServer(config, WebhookRequestHandler,
                                    cafile, insecure)
 
+    def stop(signum, frame):
+        # Stops accepting connections; the requests in flight are finished
+        # by server_close.
+        threading.Thread(target=webhook_server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+
+    logging.info("CMK webhook server listening on {}:{} ({} mode)"
+                 .format(config.address, config.port, config.mode))
     try:
         webhook_server.serve_forever()
     except KeyboardInterrupt:
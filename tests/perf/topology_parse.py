@@ -0,0 +1,96 @@
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Microbenchmark of the CMK topology parser.
+
+Parses synthetic `lscpu -p` output of hosts with the given numbers of cpus,
+with two threads per core, 56 cpus per socket and half of the cpus
+isolated. Then queries the pool views that init uses and serializes the
+sockets as node-report does. Reports the median time of each step.
+
+Usage:
+  topology_parse.py [--cpus=<list>] [--rounds=<num>]
+
+Options:
+  --cpus=<list>     Comma separated numbers of cpus [default: 56,448,1792].
+  --rounds=<num>    Number of rounds per number of cpus [default: 20].
+"""
+
+import statistics
+import time
+
+from docopt import docopt
+
+from intel import topology
+
+CPUS_PER_SOCKET = 56
+POOLS = ["exclusive", "shared", "infra"]
+
+
+# Returns lscpu output of a host with n_cpus cpus, where cpu c and
+# c + n_cpus / 2 are the threads of one core.
+def lscpu_output(n_cpus):
+    n_cores = n_cpus // 2
+    cores_per_socket = CPUS_PER_SOCKET // 2
+    lines = ["# CPU,Core,Socket,Node,,L1d,L1i,L2,L3"]
+    for cpu in range(n_cpus):
+        core = cpu % n_cores
+        socket = core // cores_per_socket
+        lines.append("{0},{1},{2},{2},,{1},{1},{1},{2}".format(
+            cpu, core, socket))
+    return "\n".join(lines)
+
+
+def run(n_cpus, rounds):
+    output = lscpu_output(n_cpus)
+    isolated = list(range(n_cpus // 4)) + \
+        list(range(n_cpus // 2, n_cpus // 2 + n_cpus // 4))
+    timings = {"parse": [], "views": [], "as_dict": []}
+    for _ in range(rounds):
+        start = time.perf_counter()
+        platform = topology.parse(output, isolated)
+        timings["parse"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for i, core in enumerate(platform.get_isolated_cores()):
+            core.pool = POOLS[i % 2]
+        for core in platform.get_shared_cores():
+            core.pool = "infra"
+        for _ in range(10):
+            for pool in POOLS:
+                platform.get_cores_from_pool(pool)
+            platform.get_isolated_cores()
+            platform.get_shared_cores()
+        timings["views"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for socket in platform.sockets.values():
+            socket.as_dict()
+        timings["as_dict"].append(time.perf_counter() - start)
+    return {step: statistics.median(t) for step, t in timings.items()}
+
+
+def main():
+    args = docopt(__doc__)
+    print("{:>6} {:>10} {:>10} {:>10}".format(
+        "cpus", "parse", "views", "as_dict"))
+    for n_cpus in [int(n) for n in args["--cpus"].split(",")]:
+        timings = run(n_cpus, int(args["--rounds"]))
+        print("{:>6} {:>7.2f} ms {:>7.2f} ms {:>7.2f} ms".format(
+            n_cpus, timings["parse"] * 1000, timings["views"] * 1000,
+            timings["as_dict"] * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Load test for the CMK webhook server.
+
+Sends synthetic AdmissionReview requests for CMK pods from a number of
+concurrent clients, each reusing a single keep-alive connection, and
+reports the throughput and latency percentiles.
+
+Usage:
+  webhook_load.py [--host=<host>] [--port=<port>] [--requests=<num>]
+                  [--concurrency=<num>] [--containers=<num>]
+                  [--cmk-percent=<num>] [--cafile=<file>] [--cert=<file>]
+                  [--key=<file>]
+
+Options:
+  --host=<host>         Webhook server host [default: localhost].
+  --port=<port>         Webhook server port [default: 443].
+  --requests=<num>      Total number of admission requests [default: 1000].
+  --concurrency=<num>   Number of concurrent clients [default: 16].
+  --containers=<num>    Containers in each pod [default: 1].
+  --cmk-percent=<num>   Percentage of pods requesting CMK exclusive cores,
+                        the others don't need to be mutated [default: 100].
+  --cafile=<file>       CA certificate of the server. If not set, the
+                        server certificate is not verified.
+  --cert=<file>         Client certificate, for mutual TLS.
+  --key=<file>          Client private key, for mutual TLS.
+"""
+
+import http.client
+import json
+import random
+import ssl
+import threading
+import time
+import uuid
+
+from docopt import docopt
+
+
+# Returns an admission review for a pod, with its fields in the order the
+# API server writes them.
+def admission_review(n_containers=1, cmk=True):
+    resource = "cmk.intel.com/exclusive-cores" if cmk else "cpu"
+    containers = [{
+        "name": "container-{}".format(i),
+        "image": "fake-image",
+        "resources": {
+            "requests": {resource: "1"},
+            "limits": {resource: "1"}
+        }
+    } for i in range(n_containers)]
+    return {
+        "kind": "AdmissionReview",
+        "apiVersion": "admission.k8s.io/v1beta1",
+        "request": {
+            "uid": str(uuid.uuid4()),
+            "kind": {"group": "", "version": "v1", "kind": "Pod"},
+            "operation": "CREATE",
+            "object": {
+                "metadata": {"name": "load-test", "namespace": "default"},
+                "spec": {"containers": containers}
+            }
+        }
+    }
+
+
+def ssl_context(cafile=None, cert=None, key=None):
+    context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH,
+                                         cafile=cafile)
+    if cafile is None:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    if cert is not None:
+        context.load_cert_chain(cert, key)
+    return context
+
+
+# Sends n_requests admission reviews from 'concurrency' clients, of which
+# cmk_percent percent are for pods requesting CMK cores. Returns a dict
+# with the number of requests, errors and connections used, the elapsed
+# time in seconds and the request latencies in seconds, sorted.
+def run(host, port, n_requests, concurrency, context, n_containers=1,
+        cmk_percent=100):
+    lock = threading.Lock()
+    latencies = []
+    stats = {"errors": 0, "connections": 0}
+    remaining = [n_requests]
+
+    def client():
+        conn = None
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    break
+                remaining[0] -= 1
+            cmk = random.uniform(0, 100) < cmk_percent
+            body = json.dumps(admission_review(n_containers, cmk))
+            start = time.monotonic()
+            try:
+                if conn is None:
+                    conn = http.client.HTTPSConnection(host, port,
+                                                       context=context)
+                    with lock:
+                        stats["connections"] += 1
+                conn.request("POST", "/mutate", body,
+                             {"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+                if response.will_close:
+                    conn.close()
+                    conn = None
+            except (OSError, http.client.HTTPException):
+                ok = False
+                if conn is not None:
+                    conn.close()
+                conn = None
+            elapsed = time.monotonic() - start
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    stats["errors"] += 1
+        if conn is not None:
+            conn.close()
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats["elapsed"] = time.monotonic() - start
+    stats["requests"] = n_requests
+    stats["latencies"] = sorted(latencies)
+    return stats
+
+
+def percentile(latencies, p):
+    if not latencies:
+        return 0.0
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+
+
+def main():
+    args = docopt(__doc__)
+    context = ssl_context(args["--cafile"], args["--cert"], args["--key"])
+    stats = run(args["--host"], int(args["--port"]), int(args["--requests"]),
+                int(args["--concurrency"]), context,
+                int(args["--containers"]), float(args["--cmk-percent"]))
+    latencies = stats["latencies"]
+    print("requests:    {}".format(stats["requests"]))
+    print("errors:      {}".format(stats["errors"]))
+    print("connections: {}".format(stats["connections"]))
+    print("throughput:  {:.1f} requests/s".format(
+        stats["requests"] / stats["elapsed"]))
+    for p in [50, 90, 99]:
+        print("p{}:         {:.1f} ms".format(
+            p, percentile(latencies, p) * 1000))
+
+
+if __name__ == "__main__":
+    main()
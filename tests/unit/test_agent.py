@@ -0,0 +1,321 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import os
+import stat
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from intel import agent, config, isolate
+
+FAKE_CONFIG = {
+    "exclusive": {
+        "0": {
+            "0,11": [],
+            "1,12": [],
+            "2,13": []
+        },
+        "1": {
+            "3,14": []
+        }
+    },
+    "shared": {
+        "0": {
+            "4,15,5,16": []
+        },
+        "1": {}
+    },
+    "infra": {
+        "0": {
+            "6,17,7,18,8,19": []
+        },
+        "1": {}
+    }
+}
+
+
+class MockConfig(config.Config):
+
+    def __init__(self, conf):
+        self.cm_name = "fake-name"
+        self.cm_namespace = "fake-namespace"
+        self.owner = "fake-owner"
+        self.c_data = None
+        self.stored = conf
+        self.locks = 0
+        self.merged = []
+
+    def lock(self):
+        self.locks += 1
+        self.c_data = config.build_config(copy.deepcopy(self.stored))
+
+    def unlock(self, merged=1):
+        self.stored = config.build_configmap(self.c_data)
+        self.c_data = None
+        self.merged.append(merged)
+
+
+def return_state():
+    state = agent.AgentState(MockConfig(copy.deepcopy(FAKE_CONFIG)))
+    with patch('intel.config.get_config', stored_config(state)):
+        state.refresh()
+    return state
+
+
+def stored_config(state):
+    def get_config(name, namespace, cache=False):
+        return config.build_config(copy.deepcopy(state.config.stored))
+    return get_config
+
+
+def test_agent_state_allocate_release():
+    state = return_state()
+    allocation = state.allocate("exclusive", "1234", 2, None)
+    assert allocation["cpuLists"] == ["0,11", "1,12"]
+    assert allocation["advertised"] == {
+        "shared": ["4,15,5,16"],
+        "infra": ["6,17,7,18,8,19"]
+    }
+    allocation = state.allocate("exclusive", "1235", 1, None)
+    assert allocation["cpuLists"] == ["2,13"]
+    # Allocations are answered from memory.
+    assert state.config.locks == 0
+    assert state.config.stored["exclusive"]["0"]["0,11"] == []
+
+    # Released cpu lists are free right away.
+    state.release("exclusive", ["0,11", "1,12"], "1234")
+    allocation = state.allocate("exclusive", "1236", 1, None)
+    assert allocation["cpuLists"] == ["0,11"]
+    assert len(state.pending) == 4
+
+    state.flush()
+    assert state.pending == []
+    assert state.config.locks == 1
+    assert state.config.merged == [4]
+    stored = state.config.stored["exclusive"]["0"]
+    assert stored["0,11"] == ["1236"]
+    assert stored["1,12"] == []
+    assert stored["2,13"] == ["1235"]
+
+
+def test_agent_state_allocate_failure():
+    state = return_state()
+    with pytest.raises(SystemError) as err:
+        state.allocate("exclusive", "1234", 5, None)
+    assert err.value.args[0] == "Not enough free cpu lists in pool exclusive"
+    with pytest.raises(KeyError):
+        state.allocate("fake-pool", "1234", 1, None)
+    assert state.pending == []
+    state.flush()
+    assert state.config.locks == 0
+
+
+def test_agent_state_keeps_allocators():
+    state = return_state()
+    state.allocate("exclusive", "1234", 1, None)
+    allocators = dict(state.allocators)
+    with patch('intel.allocator.Allocator') as allocator_mock:
+        state.release("exclusive", ["0,11"], "1234")
+        assert state.allocate("exclusive", "1235", 1, None)["cpuLists"] == \
+            ["0,11"]
+        assert not allocator_mock.called
+    assert state.allocators == allocators
+
+    # The allocators of a re-read configuration are built again.
+    state.flush()
+    assert state.allocators == {}
+
+
+def test_agent_state_reused_pid():
+    state = return_state()
+    state.allocate("exclusive", "1234", 1, None, start_time=100)
+    state.allocate("exclusive", "1234", 1, None, start_time=200)
+    state.flush()
+    stored = state.config.stored
+    assert stored["exclusive"]["0"]["0,11"] == ["1234"]
+    assert stored["exclusive"]["0"]["1,12"] == []
+    assert stored.start_times == {"1234": 200}
+
+
+def test_agent_state_other_writers():
+    state = return_state()
+    state.allocate("exclusive", "1234", 1, None)
+    # reconcile reclaimed a cpu list, and an isolate without access to the
+    # agent took another one.
+    stored = state.config.stored["exclusive"]
+    stored["0"]["2,13"] = ["999"]
+    stored["1"]["3,14"] = ["998"]
+    state.flush()
+    state.config.stored["exclusive"]["1"]["3,14"] = []
+    with patch('intel.config.get_config', stored_config(state)):
+        state.refresh()
+
+    allocation = state.allocate("exclusive", "1235", 2, None)
+    assert allocation["cpuLists"] == ["1,12", "3,14"]
+    state.flush()
+    stored = state.config.stored["exclusive"]
+    assert stored["0"]["0,11"] == ["1234"]
+    assert stored["0"]["2,13"] == ["999"]
+    assert stored["1"]["3,14"] == ["1235"]
+
+
+def test_agent_state_write_failure():
+    state = return_state()
+    state.allocate("exclusive", "1234", 1, None)
+    # Another writer changed the configmap in the meantime.
+    state.config.stored["exclusive"]["0"]["1,12"] = ["999"]
+    with patch.object(MockConfig, "lock",
+                      MagicMock(side_effect=SystemExit(1))), \
+            patch('intel.config.get_config', stored_config(state)), \
+            patch('intel.k8s.reset_clients') as reset_mock:
+        state.flush()
+        assert reset_mock.called
+    # The configmap was re-read, and the allocation is kept and written
+    # with the next flush.
+    assert len(state.pending) == 1
+    assert state.conf.get_pool("exclusive").get_core_list("0,11").tasks == \
+        ["1234"]
+    assert state.allocate("exclusive", "1235", 1, None)["cpuLists"] == \
+        ["2,13"]
+    state.flush()
+    assert state.pending == []
+    stored = state.config.stored["exclusive"]["0"]
+    assert stored["0,11"] == ["1234"]
+    assert stored["1,12"] == ["999"]
+    assert stored["2,13"] == ["1235"]
+
+
+def test_agent_state_concurrent_allocations():
+    state = return_state()
+    results = []
+
+    def allocate(pid):
+        results.append(state.allocate("exclusive", pid, 1, None)["cpuLists"])
+
+    threads = [threading.Thread(target=allocate, args=(str(pid),))
+               for pid in range(1234, 1238)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == [["0,11"], ["1,12"], ["2,13"], ["3,14"]]
+    state.flush()
+    stored = state.config.stored["exclusive"]
+    assert sorted(stored["0"]["0,11"] + stored["0"]["1,12"] +
+                  stored["0"]["2,13"] + stored["1"]["3,14"]) == \
+        ["1234", "1235", "1236", "1237"]
+
+
+def test_agent_request_no_agent(tmpdir):
+    socket_path = os.path.join(str(tmpdir), "agent.sock")
+    with patch.dict(os.environ, {agent.ENV_AGENT_SOCKET: socket_path}):
+        assert agent.allocate("exclusive", "1234", 1, None) is None
+        assert not agent.release("exclusive", ["0,11"], "1234")
+
+
+def test_agent_server_round_trip(tmpdir):
+    socket_path = os.path.join(str(tmpdir), "agent.sock")
+    state = return_state()
+    server = agent.AgentServer(socket_path, state)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with patch.dict(os.environ, {agent.ENV_AGENT_SOCKET: socket_path}):
+            allocation = agent.allocate("exclusive", "1234", 1, "-1")
+            assert allocation["cpuLists"] == ["0,11"]
+            assert allocation["advertised"]["infra"] == ["6,17,7,18,8,19"]
+
+            with pytest.raises(KeyError) as err:
+                agent.allocate("fake-pool", "1234", 1, "-1")
+            assert err.value.args[0] == \
+                "Requested pool fake-pool does not exist"
+
+            assert agent.release("exclusive", ["0,11"], "1234")
+            state.flush()
+            assert state.config.stored["exclusive"]["0"]["0,11"] == []
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_agent_server_socket_mode(tmpdir):
+    socket_path = os.path.join(str(tmpdir), "agent.sock")
+    server = agent.AgentServer(socket_path, return_state())
+    assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+    server.server_close()
+    os.unlink(socket_path)
+
+    server = agent.AgentServer(socket_path, return_state(),
+                               str(os.getgid()))
+    assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o660
+    assert os.stat(socket_path).st_gid == os.getgid()
+    server.server_close()
+
+
+@patch('subprocess.Popen', MagicMock())
+@patch('signal.signal', MagicMock(return_value=None))
+@patch('intel.proc.getpid', MagicMock(return_value=1234))
+@patch('intel.proc.Process.start_time', MagicMock(return_value=4321))
+@patch.dict(os.environ, {"HOSTNAME": "fake-pod",
+                         "CMK_ALLOCATION_POLICY": "topology"})
+def test_isolate_uses_agent():
+    allocation = {
+        "cpuLists": ["1,12"],
+        "placement": "contiguous",
+        "advertised": {"shared": ["4,15,5,16"], "infra": ["6,17"]}
+    }
+    allocate = MagicMock(return_value=allocation)
+    release = MagicMock(return_value=True)
+    with patch('intel.agent.allocate', allocate), \
+            patch('intel.agent.release', release), \
+            patch('intel.config.Config') as config_mock:
+        isolate.isolate("exclusive", True, "fake-cmd", ["fake-args"],
+                        "fake-namespace", socket_id=None)
+        allocate.assert_called_once_with("exclusive", "1234", 1, None,
+                                         "topology", None, None, 4321)
+        assert os.environ[isolate.ENV_CPUS_ASSIGNED] == "1,12"
+        assert os.environ[isolate.ENV_CPUS_PLACEMENT] == "contiguous"
+        assert os.environ[isolate.ENV_CPUS_INFRA] == "6,17"
+        release.assert_called_once_with("exclusive", ["1,12"], "1234")
+        assert not config_mock.called
+
+
+@patch('subprocess.Popen', MagicMock())
+@patch('signal.signal', MagicMock(return_value=None))
+@patch('intel.proc.getpid', MagicMock(return_value=1234))
+@patch('intel.proc.Process.start_time', MagicMock(return_value=4321))
+@patch('intel.topology.device_locality',
+       MagicMock(return_value=(1, [3, 14])))
+@patch.dict(os.environ, {"HOSTNAME": "fake-pod",
+                         "CMK_DEVICE": "0000:18:00.1"})
+def test_isolate_device_locality(tmpdir):
+    socket_path = os.path.join(str(tmpdir), "agent.sock")
+    state = return_state()
+    server = agent.AgentServer(socket_path, state)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with patch.dict(os.environ, {agent.ENV_AGENT_SOCKET: socket_path,
+                                     isolate.ENV_NUM_CORES: "2"}):
+            isolate.isolate("exclusive", True, "fake-cmd", ["fake-args"],
+                            "fake-namespace")
+            assert os.environ[isolate.ENV_CPUS_ASSIGNED] == "3,14,0,11"
+            assert os.environ[isolate.ENV_CPUS_LOCALITY] == "partial"
+            assert os.environ[isolate.ENV_CPUS_REMOTE] == "0,11"
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,257 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import subprocess
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from intel import allocator, config
+
+FAKE_CONFIG = {
+    "exclusive": {
+        0: {
+            "10,22": [],
+            "2,14": [],
+            "1,13": ["1001"],
+            "0,12": []
+        },
+        1: {
+            "6,18": [],
+            "7,19": [],
+            "8,20": []
+        }
+    },
+    "shared": {
+        0: {
+            "3-5,15-17": []
+        },
+        1: {}
+    }
+}
+
+
+def return_conf():
+    return config.build_config(copy.deepcopy(FAKE_CONFIG))
+
+
+def test_core_list_key():
+    assert allocator.core_list_key("10,22") == 10
+    assert allocator.core_list_key("3-5,15-17") == 3
+
+
+def test_allocator_first_fit():
+    conf = return_conf()
+    pool = conf.get_pool("exclusive")
+    a = allocator.Allocator(pool)
+    assert a.allocate("1002", 2) == ["0,12", "2,14"]
+    assert a.allocate("1003", 3) == ["10,22", "6,18", "7,19"]
+    assert pool.get_core_list("10,22").tasks == ["1003"]
+    assert conf.get_task_core_lists("1002") == \
+        [("exclusive", "0,12"), ("exclusive", "2,14")]
+
+    with pytest.raises(SystemError) as err:
+        a.allocate("1004", 2)
+    assert err.value.args[0] == "Not enough free cpu lists in pool exclusive"
+
+    a.release("1002", ["2,14"])
+    assert a.allocate("1004", 1) == ["2,14"]
+
+
+def test_allocator_socket():
+    a = allocator.Allocator(return_conf().get_pool("exclusive"))
+    # Socket ids from the command line are strings.
+    assert a.allocate("1002", 1, "1") == ["6,18"]
+    with pytest.raises(SystemError):
+        a.allocate("1003", 3, 1)
+    with pytest.raises(KeyError):
+        a.allocate("1003", 1, "2")
+
+
+def test_allocator_invalid_request():
+    a = allocator.Allocator(return_conf().get_pool("exclusive"))
+    with pytest.raises(ValueError):
+        a.allocate("1002", 0)
+    with pytest.raises(ValueError):
+        allocator.Allocator(return_conf().get_pool("exclusive"),
+                            "fake-policy")
+
+
+def test_allocator_spread():
+    a = allocator.Allocator(return_conf().get_pool("exclusive"), "spread")
+    assert a.allocate("1002", 3) == ["0,12", "6,18", "2,14"]
+
+
+def test_allocator_custom_policy():
+    def last(allocator, n_cpus, sockets):
+        return list(allocator.free_core_lists(sockets[-1]))[-n_cpus:]
+
+    a = allocator.Allocator(return_conf().get_pool("exclusive"), last)
+    assert a.allocate("1002", 2) == ["7,19", "8,20"]
+
+
+def test_allocate_shared():
+    conf = return_conf()
+    allocation = allocator.allocate(conf, "shared", "1002")
+    assert allocation["cpuLists"] == ["3-5,15-17"]
+    assert allocation["placement"] is None
+    assert allocation["advertised"] == {"shared": ["3-5,15-17"]}
+    # Shared pools ignore the requested policy.
+    allocation = allocator.allocate(conf, "shared", "1003", policy="topology")
+    assert allocation["cpuLists"] == ["3-5,15-17"]
+    assert allocation["placement"] is None
+    assert conf.get_pool("shared").get_core_list("3-5,15-17").tasks == \
+        ["1002", "1003"]
+    with pytest.raises(SystemError) as err:
+        allocator.allocate(conf, "shared", "1004", socket_id="1")
+    assert err.value.args[0] == "No cpu lists in pool shared"
+    with pytest.raises(KeyError) as err:
+        allocator.allocate(conf, "fake-pool", "1004")
+    assert err.value.args[0] == "Requested pool fake-pool does not exist"
+
+
+def test_allocate_reused_pid():
+    conf = return_conf()
+    allocation = allocator.allocate(conf, "exclusive", "1002",
+                                    start_time=100)
+    assert allocation["cpuLists"] == ["0,12"]
+    assert conf.get_task_start_time("1002") == 100
+    # The same process is given more cpu lists.
+    allocator.allocate(conf, "exclusive", "1002", start_time=100)
+    assert conf.get_task_core_lists("1002") == [("exclusive", "0,12"),
+                                                ("exclusive", "2,14")]
+    # A new process with the same pid gets the cpu lists of the old one.
+    allocation = allocator.allocate(conf, "exclusive", "1002",
+                                    start_time=200)
+    assert allocation["cpuLists"] == ["0,12"]
+    assert conf.get_task_core_lists("1002") == [("exclusive", "0,12")]
+    assert conf.get_task_start_time("1002") == 200
+
+
+def test_allocate_kept_allocators():
+    conf = return_conf()
+    allocators = {}
+    allocator.allocate(conf, "exclusive", "1002", allocators=allocators)
+    a = allocators["exclusive"]
+    allocator.allocate(conf, "exclusive", "1003", start_time=100,
+                       allocators=allocators)
+    assert allocators == {"exclusive": a}
+    assert conf.get_task_core_lists("1003") == [("exclusive", "2,14")]
+
+    # Released cpu lists go back on the free lists of the kept allocator,
+    # including those of an earlier process with a reused pid.
+    allocator.release(conf, "exclusive", ["0,12"], "1002", allocators)
+    allocation = allocator.allocate(conf, "exclusive", "1003", 2,
+                                    start_time=200, allocators=allocators)
+    assert allocation["cpuLists"] == ["0,12", "2,14"]
+    assert allocators == {"exclusive": a}
+    with pytest.raises(KeyError):
+        allocator.release(conf, "fake-pool", ["0,12"], "1003", allocators)
+
+
+# One socket with eight cores, cpus 8-15 are the hyper-threads of cpus 0-7.
+# Cores 0-3 are one NUMA node and share one L3 cache, cores 4-7 are another
+# one. Pairs of adjacent cores share a L2 cache.
+CACHE_LSCPU = "# CPU,Core,Socket,Node,,L1d,L1i,L2,L3\n" + "\n".join(
+    "{0},{1},0,{3},,{1},{1},{2},{3}".format(cpu, cpu % 8, (cpu % 8) // 2,
+                                            (cpu % 8) // 4)
+    for cpu in range(16))
+
+
+def return_cache_conf():
+    return config.build_config({"exclusive": {0: {
+        "{},{}".format(core, core + 8): ["1001"] if core in [1, 5] else []
+        for core in range(8)}}})
+
+
+@patch('intel.topology.lscpu', MagicMock(return_value=CACHE_LSCPU))
+def test_allocator_topology():
+    a = allocator.Allocator(return_cache_conf().get_pool("exclusive"),
+                            "topology")
+    assert a.allocate("1002", 2) == ["2,10", "3,11"]
+    assert a.placement == "contiguous"
+    a.release("1002", ["2,10", "3,11"])
+
+    # No three adjacent free cores share a L3 cache.
+    assert a.allocate("1002", 3) == ["0,8", "2,10", "3,11"]
+    assert a.placement == "cache"
+    a.release("1002", ["0,8", "2,10", "3,11"])
+
+    assert a.allocate("1002", 5) == ["0,8", "2,10", "3,11", "4,12", "6,14"]
+    assert a.placement == "socket"
+
+
+@patch('intel.topology.lscpu',
+       MagicMock(side_effect=subprocess.CalledProcessError(1, "lscpu")))
+def test_allocator_topology_unknown():
+    a = allocator.Allocator(return_cache_conf().get_pool("exclusive"))
+    assert a.allocate("1002", 3, policy="topology") == \
+        ["2,10", "3,11", "4,12"]
+    assert a.placement == "contiguous"
+
+    with pytest.raises(SystemError):
+        a.allocate("1003", 1, numa_node=1)
+
+
+@patch('intel.topology.lscpu', MagicMock(return_value=CACHE_LSCPU))
+def test_allocator_numa_node():
+    conf = return_cache_conf()
+    a = allocator.Allocator(conf.get_pool("exclusive"))
+    assert a.allocate("1002", 2, numa_node=1) == ["4,12", "6,14"]
+    assert a.allocate("1003", 1, numa_node=1, policy="topology") == \
+        ["7,15"]
+    assert a.placement == "contiguous"
+    with pytest.raises(SystemError) as err:
+        a.allocate("1004", 1, numa_node=1)
+    assert err.value.args[0] == "Not enough free cpu lists in pool exclusive"
+
+    assert allocator.allocate(conf, "exclusive", "1004",
+                              numa_node="0")["cpuLists"] == ["0,8"]
+    assert allocator.allocate(conf, "exclusive", "1005",
+                              numa_node="-1")["cpuLists"] == ["2,10"]
+
+
+def test_allocator_local_cpus():
+    a = allocator.Allocator(return_conf().get_pool("exclusive"))
+    # Cpus of socket 1, e.g. the ones local to a NIC.
+    local_cpus = [6, 7, 8, 18, 19, 20]
+    assert a.allocate("1002", 2, local_cpus=local_cpus) == ["6,18", "7,19"]
+    assert a.locality == "local"
+    assert a.remote == []
+
+    # Falls back to other cpu lists once the local ones are exhausted.
+    assert a.allocate("1003", 3, local_cpus=local_cpus) == \
+        ["8,20", "0,12", "2,14"]
+    assert a.locality == "partial"
+    assert a.remote == ["0,12", "2,14"]
+
+    assert a.allocate("1004", 1, local_cpus=local_cpus) == ["10,22"]
+    assert a.locality == "remote"
+
+    a.release("1003", ["8,20"])
+    assert a.allocate("1005", 1) == ["8,20"]
+    assert a.locality is None
+
+
+def test_allocate_shared_local_cpus():
+    conf = return_conf()
+    allocation = allocator.allocate(conf, "shared", "1002",
+                                    local_cpus=[3, 4, 5, 15, 16, 17])
+    assert allocation["cpuLists"] == ["3-5,15-17"]
+    assert allocation["locality"] == "local"
+    allocation = allocator.allocate(conf, "shared", "1003", local_cpus=[6])
+    assert allocation["cpuLists"] == ["3-5,15-17"]
+    assert allocation["locality"] == "remote"
+    assert allocation["remoteCpuLists"] == ["3-5,15-17"]
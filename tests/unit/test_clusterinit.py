@@ -22,7 +22,7 @@ from kubernetes import client as k8sclient
 OPT_BIN = "/opt/bin"
 ETC_CMK = "/etc/cmk"
 ERR_MGS = "CMK command should be one of ['init', 'discover',"\
-    " 'install', 'reconcile', 'nodereport']"
+    " 'install', 'reconcile', 'nodereport', 'agent']"
 FAKE_REASON = "fake reason"
 FAKE_BODY = "fake body"
 CREATE_POD = 'intel.k8s.create_pod'
@@ -38,7 +38,7 @@ def test_clusterinit_invalid_cmd_list_failure1():
                                  "default", "-1", "fake-ca", "False")
     expected_err_msg = ("CMK command should be one of "
                         "['init', 'discover', 'install', 'reconcile', "
-                        "'nodereport']")
+                        "'nodereport', 'agent']")
     assert err.value.args[0] == expected_err_msg
 
 
@@ -50,7 +50,7 @@ def test_clusterinit_invalid_cmd_list_failure2():
                                  "default", "-1", "fake-ca", "False")
     expected_err_msg = ("CMK command should be one of "
                         "['init', 'discover', 'install', 'reconcile', "
-                        "'nodereport']")
+                        "'nodereport', 'agent']")
     assert err.value.args[0] == expected_err_msg
 
 
@@ -62,7 +62,7 @@ def test_clusterinit_invalid_cmd_list_failure3():
                                  "default", "-1", "fake-ca", "False")
     expected_err_msg = ("CMK command should be one of "
                         "['init', 'discover', 'install', 'reconcile', "
-                        "'nodereport']")
+                        "'nodereport', 'agent']")
     assert err.value.args[0] == expected_err_msg
 
 
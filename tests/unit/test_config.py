@@ -12,6 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from unittest.mock import MagicMock, patch
+
+import pytest
+import yaml
+from kubernetes import client as k8sclient
+from kubernetes.client.rest import ApiException as K8sApiException
+
 from intel import config, topology
 
 
@@ -198,6 +205,59 @@ def test_core_list_class():
     assert "1005" not in cl.get_tasks()
 
 
+def test_conf_indexes():
+    c = config.build_config(FAKE_CONFIG)
+    assert c.find_core_list("3,12") == ("exclusive", "1")
+    assert c.find_core_list("fake-core") is None
+    assert c.get_task_core_lists("1001") == [("exclusive", "0,9")]
+
+    p = c.get_pool("exclusive")
+    assert p.count_free_core_lists() == 0
+    p.remove_task("0,9", "1001")
+    assert p.count_free_core_lists() == 1
+    assert p.count_free_core_lists("0") == 1
+    assert p.count_free_core_lists("1") == 0
+    assert "1001" not in c.get_tasks()
+
+    p.update_clist("0,9", "1005")
+    c.get_pool("shared").update_clist("4,13,5,14", "1005")
+    assert p.count_free_core_lists() == 0
+    assert c.get_task_core_lists("1005") == \
+        [("exclusive", "0,9"), ("shared", "4,13,5,14")]
+
+    p.remove_task("0,9", "1005")
+    c.get_pool("shared").remove_task("4,13,5,14", "1005")
+    assert c.get_task_core_lists("1005") == []
+    assert p.get_core_list("0,9").is_free()
+
+    cl = p.get_core_list("1,10")
+    cl.tasks = ["1006", "1007"]
+    assert c.get_task_core_lists("1002") == []
+    assert c.get_task_core_lists("1007") == [("exclusive", "1,10")]
+
+    c.get_pool("shared").get_socket("1").add_core_list("20,21")
+    assert c.find_core_list("20,21") == ("shared", "1")
+    assert c.get_pool("shared").get_core_list("20,21") is not None
+    assert c.get_pool("shared").count_free_core_lists() == 1
+
+    # Sockets written by cmk init are integers.
+    c = config.build_config({"exclusive": {0: {"0,9": []}, 1: {}}})
+    assert c.get_pool("exclusive").count_free_core_lists(0) == 1
+    assert c.get_pool("exclusive").count_free_core_lists(1) == 0
+    assert [cl.core_id for cl in c.get_pool("exclusive").get_core_lists(0)] \
+        == ["0,9"]
+    assert c.get_pool("exclusive").get_core_lists(1) == []
+    assert c.get_pool("exclusive").get_core_list("0,9", 0) is not None
+
+
+def test_build_configmap_round_trip():
+    c = config.build_config(FAKE_CONFIG)
+    assert config.build_configmap(c) == FAKE_CONFIG
+    data = config.build_configmap(c)
+    data["exclusive"]["0"]["0,9"].append("1005")
+    assert c.get_pool("exclusive").get_core_list("0,9").tasks == ["1001"]
+
+
 def test_update_configmap_exclusive():
     c = dict()
 
@@ -256,3 +316,225 @@ def test_update_configmap_shared():
     mock.side_effect = configmap_mock
     with patch('intel.k8s.create_config_map', new=mock):
         config.set_config(c, "fake-name")"""
+
+
+def fake_configmap(owner="", resource_version="1"):
+    return k8sclient.V1ConfigMap(
+        metadata=k8sclient.V1ObjectMeta(
+            name="fake-name", annotations={"Owner": owner},
+            resource_version=resource_version),
+        data={"config": yaml.dump(FAKE_CONFIG)})
+
+
+def test_config_lock_cas():
+    patch_mock = MagicMock(return_value=fake_configmap("fake-pod", "2"))
+    with patch('intel.k8s.get_config_map',
+               MagicMock(return_value=fake_configmap())), \
+            patch('intel.k8s.patch_config_map', patch_mock):
+        c = config.Config("fake-name", "fake-pod", "default")
+        c.lock()
+        body = patch_mock.call_args[0][2]
+        assert body["metadata"]["resourceVersion"] == "1"
+        assert body["metadata"]["annotations"]["Owner"] == "fake-pod"
+        assert c.c.metadata.resource_version == "2"
+        assert c.lock_wait_time is not None
+
+        c.unlock()
+        body = patch_mock.call_args[0][2]
+        assert body["metadata"]["resourceVersion"] == "2"
+        assert body["metadata"]["annotations"]["Owner"] == ""
+        assert c.lock_hold_time is not None
+
+
+@patch.dict(config.write_stats, {"writes": 0, "writesSaved": 0,
+                                 "bytesSent": 0})
+def test_config_unlock_unchanged():
+    patch_mock = MagicMock(return_value=fake_configmap("fake-pod", "2"))
+    with patch('intel.k8s.get_config_map',
+               MagicMock(return_value=fake_configmap())), \
+            patch('intel.k8s.patch_config_map', patch_mock):
+        c = config.Config("fake-name", "fake-pod", "default")
+        c.lock()
+        c.unlock()
+        body = patch_mock.call_args[0][2]
+        assert "data" not in body
+        assert config.write_stats["writes"] == 1
+        assert config.write_stats["writesSaved"] == 0
+        assert config.write_stats["bytesSent"] > 0
+
+
+@patch.dict(config.write_stats, {"writes": 0, "writesSaved": 0,
+                                 "bytesSent": 0})
+def test_config_unlock_changed():
+    patch_mock = MagicMock(return_value=fake_configmap("fake-pod", "2"))
+    with patch('intel.k8s.get_config_map',
+               MagicMock(return_value=fake_configmap())), \
+            patch('intel.k8s.patch_config_map', patch_mock):
+        c = config.Config("fake-name", "fake-pod", "default")
+        c.lock()
+        c.get_pool("exclusive").update_clist("1,10", "1005")
+        c.unlock()
+        body = patch_mock.call_args[0][2]
+        data = config.decode_config(body["data"]["config"])
+        assert data["exclusive"]["0"]["1,10"] == ["1002", "1005"]
+        assert config.write_stats["writesSaved"] == 0
+
+        # Several mutations merged into one write.
+        c.lock()
+        c.get_pool("exclusive").update_clist("1,10", "1006")
+        with patch('logging.debug') as debug:
+            c.unlock(merged=3)
+        assert config.write_stats["writes"] == 2
+        assert config.write_stats["writesSaved"] == 2
+        debug.assert_any_call(
+            "Configmap fake-name writes: 2 sent, 2 saved, {} bytes"
+            .format(config.write_stats["bytesSent"]))
+
+
+def test_changed_cpu_lists():
+    new = {"exclusive": {"0": {"0,9": ["1"], "1,10": []}},
+           "shared": {"0": {}}}
+    assert config.changed_cpu_lists(FAKE_CONFIG, FAKE_CONFIG) == []
+    assert sorted(config.changed_cpu_lists(None, new)) == \
+        [("exclusive", "0", "0,9"), ("exclusive", "0", "1,10"),
+         ("shared", "0", None)]
+    old = {"exclusive": {"0": {"0,9": [], "1,10": []}},
+           "shared": {"0": {}}}
+    assert config.changed_cpu_lists(old, new) == \
+        [("exclusive", "0", "0,9")]
+
+
+@patch('time.sleep', MagicMock())
+def test_config_lock_conflict_retry():
+    conflict = K8sApiException(status=409, reason="Conflict")
+    patch_mock = MagicMock(
+        side_effect=[conflict, fake_configmap("fake-pod", "3")])
+    with patch('intel.k8s.get_config_map',
+               MagicMock(return_value=fake_configmap())), \
+            patch('intel.k8s.patch_config_map', patch_mock):
+        c = config.Config("fake-name", "fake-pod", "default")
+        c.lock()
+        assert patch_mock.call_count == 2
+        assert c.c.metadata.resource_version == "3"
+
+
+def test_config_lock_waits_on_watch():
+    events = [
+        {"type": "MODIFIED", "object": fake_configmap("other-pod", "2")},
+        {"type": "MODIFIED", "object": fake_configmap("", "3")},
+    ]
+    watch_mock = MagicMock(return_value=MagicMock(
+        __iter__=MagicMock(return_value=iter(events))))
+    get_mock = MagicMock(side_effect=[fake_configmap("other-pod", "1"),
+                                      fake_configmap("", "3")])
+    with patch('intel.k8s.get_config_map', get_mock), \
+            patch('intel.k8s.watch_config_map', watch_mock), \
+            patch('intel.k8s.patch_config_map',
+                  MagicMock(return_value=fake_configmap("fake-pod", "4"))):
+        c = config.Config("fake-name", "fake-pod", "default")
+        c.lock()
+        assert watch_mock.call_count == 1
+        assert watch_mock.call_args[0][3] == "1"
+        assert get_mock.call_count == 2
+        assert c.c.metadata.annotations["Owner"] == "fake-pod"
+
+
+def test_lock_backoff_bounds():
+    for attempt in range(20):
+        assert 0 <= config.lock_backoff(attempt) <= config.LOCK_BACKOFF_CAP
+
+
+@patch.dict(config._parsed_configs, clear=True)
+def test_get_config_cache():
+    with patch('intel.k8s.get_config_map',
+               MagicMock(return_value=fake_configmap())), \
+            patch('intel.config.decode_config',
+                  MagicMock(side_effect=config.decode_config)) as load_mock:
+        c = config.get_config("fake-name", "default", cache=True)
+        assert len(c.get_pools()) == 3
+        c.get_pool("exclusive").update_clist("0,9", "1005")
+        c = config.get_config("fake-name", "default", cache=True)
+        assert load_mock.call_count == 1
+        assert "1005" not in \
+            c.get_pool("exclusive").get_core_list("0,9").tasks
+
+    with patch('intel.k8s.get_config_map',
+               MagicMock(return_value=fake_configmap(resource_version="2"))), \
+            patch('intel.config.decode_config',
+                  MagicMock(side_effect=config.decode_config)) as load_mock:
+        config.get_config("fake-name", "default", cache=True)
+        assert load_mock.call_count == 1
+
+
+def test_encode_decode_config():
+    c = {"exclusive": {0: {"0,9": ["1001"]}, 1: {}},
+         "shared": {0: {"4,13": []}, 1: {}}}
+    data = config.encode_config(c)
+    assert " " not in data
+    assert config.decode_config(data) == c
+    # Configmaps written by older releases hold YAML.
+    assert config.decode_config(yaml.dump(c)) == c
+    assert config.decode_config(yaml.dump(c, default_flow_style=True)) == c
+    conf = config.build_config(data)
+    assert conf.get_pool("exclusive").get_core_list("0,9", 0).tasks == \
+        ["1001"]
+    assert config.build_configmap(conf) == c
+
+
+def test_encode_decode_start_times():
+    conf = config.build_config({"exclusive": {0: {"0,9": ["1001"],
+                                                  "1,10": []}}})
+    conf.set_task_start_time("1001", 4321)
+    # Only tasks holding cpu lists have a start time.
+    conf.set_task_start_time("1002", 8765)
+    data = config.encode_config(config.build_configmap(conf))
+    assert '"startTimes":{"1001":4321}' in data
+    conf = config.build_config(data)
+    assert conf.get_task_start_time("1001") == 4321
+    assert conf.release_stale_task("1001", 4321) == []
+
+    conf.get_pool("exclusive").remove_task("0,9", "1001")
+    assert conf.get_task_start_time("1001") is None
+    assert "startTimes" not in \
+        config.encode_config(config.build_configmap(conf))
+
+
+def test_decode_config_unsupported_version():
+    with pytest.raises(ValueError):
+        config.decode_config('{"version":99,"pools":{}}')
+
+
+def test_get_config_missing():
+    with patch('intel.k8s.get_config_map', MagicMock(return_value=None)):
+        with pytest.raises(KeyError):
+            config.get_config("fake-name", "default")
+
+
+def test_find_overlaps():
+    c = {"exclusive": {0: {"0,8": [], "1,9": ["1001"]}, 1: {"4,12": []}},
+         "shared": {0: {"2-3,10-11": []}},
+         "infra": {0: {"5,13": []}}}
+    assert config.find_overlaps(c) == []
+    config.check_overlaps(c)
+
+    c["exclusive"][0]["9,10"] = []
+    c["infra"][0]["12"] = []
+    overlaps = config.find_overlaps(config.build_config(c))
+    assert [(pool, cl, str(cpus)) for pool, cl, cpus in overlaps] == [
+        ("exclusive", "1,9", "9"),
+        ("exclusive", "9,10", "9-10"),
+        ("exclusive", "4,12", "12"),
+        ("shared", "2-3,10-11", "10"),
+        ("infra", "12", "12")
+    ]
+    with pytest.raises(SystemExit):
+        config.check_overlaps(c)
+
+
+def test_find_overlaps_many_cpu_lists():
+    c = {"exclusive": {0: {"{},{}".format(i, i + 4096): []
+                           for i in range(4096)}},
+         "infra": {0: {"100,5000": []}}}
+    assert [(pool, cl) for pool, cl, _ in config.find_overlaps(c)] == [
+        ("exclusive", "100,4196"), ("exclusive", "904,5000"),
+        ("infra", "100,5000")]
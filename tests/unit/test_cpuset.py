@@ -0,0 +1,70 @@
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pytest
+
+from intel.cpuset import as_cpuset, CpuSet
+
+
+def test_cpuset_parse_and_format():
+    cpus = CpuSet.parse("0-3,8,10-11")
+    assert list(cpus) == [0, 1, 2, 3, 8, 10, 11]
+    assert cpus.ranges() == "0-3,8,10-11"
+    assert str(cpus) == "0-3,8,10-11"
+    assert cpus.cpu_list() == "0,1,2,3,8,10,11"
+    assert cpus.hex_mask() == "D0F"
+    assert cpus.mask == 0xD0F
+    assert len(cpus) == 7
+    assert (cpus.min(), cpus.max()) == (0, 11)
+
+    assert CpuSet.parse("4,15,5,16\n") == CpuSet([4, 5, 15, 16])
+    assert CpuSet.parse_lists(["0,11", "1,12"]).ranges() == "0-1,11-12"
+    assert CpuSet.parse_mask("ff,00000001") == CpuSet.parse("0,32-39")
+    assert CpuSet.from_mask(0b110) == CpuSet([1, 2])
+
+    empty = CpuSet.parse("")
+    assert not empty
+    assert len(empty) == 0
+    assert empty.ranges() == ""
+    assert empty.hex_mask() == "0"
+    with pytest.raises(ValueError):
+        empty.min()
+
+
+@pytest.mark.parametrize("cpu_list", [",", "-", "0,", "0,-", "0,1-", "0,1-2,",
+                                      "3-1", "1-2-3", "a"])
+def test_cpuset_parse_invalid(cpu_list):
+    with pytest.raises(ValueError):
+        CpuSet.parse(cpu_list)
+
+
+def test_cpuset_algebra():
+    a = CpuSet.parse("0-3")
+    b = CpuSet.parse("2-5")
+    assert a | b == CpuSet.parse("0-5")
+    assert a & b == CpuSet.parse("2-3")
+    assert a - b == CpuSet.parse("0-1")
+    assert a ^ b == CpuSet.parse("0-1,4-5")
+    assert not a.isdisjoint(b)
+    assert a.isdisjoint("4-7")
+    assert CpuSet([1, 2]) <= a
+    assert a >= [1, 2]
+    assert not a <= b
+    assert 3 in a and 4 not in a and -1 not in a
+    assert as_cpuset({1, 2}) == CpuSet.parse("1-2")
+
+    assert len({CpuSet([1, 2]), CpuSet.parse("1-2")}) == 1
+    with pytest.raises(AttributeError):
+        a.mask = 1
@@ -17,7 +17,6 @@ from .. import helpers
 from intel import init, topology, proc, config
 from unittest.mock import patch, MagicMock
 import pytest
-import yaml
 
 
 TOPOLOGY_PARSE = 'intel.topology.parse'
@@ -101,8 +100,7 @@ def test_init_success1(monkeypatch):
     monkeypatch.setenv("HOSTNAME", "fake-pod")
 
     def configmap_mock(unused1, configmap, unused2):
-        c = yaml.safe_load(configmap.data["config"])
-        conf = config.build_config(c)
+        conf = config.build_config(configmap.data["config"])
         pools = conf.get_pools()
         assert len(pools) == 3
         assert "exclusive" in pools
@@ -140,8 +138,7 @@ def test_init_success1_isolcpus(monkeypatch):
     monkeypatch.setenv("HOSTNAME", "fake-pod")
 
     def configmap_mock(unused1, configmap, unused2):
-        c = yaml.load(configmap.data["config"], Loader=yaml.FullLoader)
-        conf = config.build_config(c)
+        conf = config.build_config(configmap.data["config"])
         pools = conf.get_pools()
         assert len(pools) == 3
         assert "exclusive" in pools
@@ -178,8 +175,7 @@ def test_init_success2(monkeypatch):
     monkeypatch.setenv("HOSTNAME", "fake-pod")
 
     def configmap_mock(unused1, configmap, unused2):
-        c = yaml.load(configmap.data["config"], Loader=yaml.FullLoader)
-        conf = config.build_config(c)
+        conf = config.build_config(configmap.data["config"])
         pools = conf.get_pools()
         assert len(pools) == 3
         assert "exclusive" in pools
@@ -215,8 +211,7 @@ def test_init_success_isolcpus2(monkeypatch):
     monkeypatch.setenv("HOSTNAME", "fake-pod")
 
     def configmap_mock(unused1, configmap, unused2):
-        c = yaml.load(configmap.data["config"], Loader=yaml.FullLoader)
-        conf = config.build_config(c)
+        conf = config.build_config(configmap.data["config"])
         pools = conf.get_pools()
         assert len(pools) == 3
         assert "exclusive" in pools
@@ -252,8 +247,7 @@ def test_init_success3(monkeypatch):
     monkeypatch.setenv("HOSTNAME", "fake-pod")
 
     def configmap_mock(unused1, configmap, unused2):
-        c = yaml.load(configmap.data["config"], Loader=yaml.FullLoader)
-        conf = config.build_config(c)
+        conf = config.build_config(configmap.data["config"])
         pools = conf.get_pools()
         assert len(pools) == 3
         assert "exclusive" in pools
@@ -289,8 +283,7 @@ def test_init_success_excl_non_isolcpus1(monkeypatch):
     monkeypatch.setenv("HOSTNAME", "fake-pod")
 
     def configmap_mock(unused1, configmap, unused2):
-        c = yaml.load(configmap.data["config"], Loader=yaml.FullLoader)
-        conf = config.build_config(c)
+        conf = config.build_config(configmap.data["config"])
         pools = conf.get_pools()
         assert len(pools) == 4
         assert "exclusive" in pools
@@ -331,8 +324,7 @@ def test_init_success_excl_non_isolcpus2(monkeypatch):
     monkeypatch.setenv("HOSTNAME", "fake-pod")
 
     def configmap_mock(unused1, configmap, unused2):
-        c = yaml.load(configmap.data["config"], Loader=yaml.FullLoader)
-        conf = config.build_config(c)
+        conf = config.build_config(configmap.data["config"])
         pools = conf.get_pools()
         assert len(pools) == 4
         assert "exclusive" in pools
@@ -129,6 +129,7 @@ class MockChild():
 
 @patch('subprocess.Popen', MagicMock(return_value=MockChild()))
 @patch('intel.proc.getpid', MagicMock(return_value=1234))
+@patch('intel.proc.Process.start_time', MagicMock(return_value=4321))
 @patch('signal.signal', MagicMock(return_value=None))
 @patch.dict(os.environ, {"HOSTNAME": "fake-pod"})
 @patch('intel.k8s.get_node_from_pod',
@@ -150,6 +151,7 @@ def test_isolate_exclusive1():
 
 @patch('subprocess.Popen', MagicMock(return_value=MockChild()))
 @patch('intel.proc.getpid', MagicMock(return_value=1234))
+@patch('intel.proc.Process.start_time', MagicMock(return_value=4321))
 @patch('signal.signal', MagicMock(return_value=None))
 @patch.dict(os.environ, {"HOSTNAME": "fake-pod"})
 @patch('intel.k8s.get_node_from_pod',
@@ -168,6 +170,7 @@ def test_isolate_exclusive2():
 
 @patch('subprocess.Popen', MagicMock(return_value=MockChild()))
 @patch('intel.proc.getpid', MagicMock(return_value=1234))
+@patch('intel.proc.Process.start_time', MagicMock(return_value=4321))
 @patch('signal.signal', MagicMock(return_value=None))
 @patch.dict(os.environ, {"HOSTNAME": "fake-pod"})
 @patch('intel.k8s.get_node_from_pod',
@@ -186,6 +189,7 @@ def test_isolate_exclusive3():
 
 @patch('subprocess.Popen', MagicMock(return_value=MockChild()))
 @patch('intel.proc.getpid', MagicMock(return_value=1234))
+@patch('intel.proc.Process.start_time', MagicMock(return_value=4321))
 @patch('signal.signal', MagicMock(return_value=None))
 @patch.dict(os.environ, {"HOSTNAME": "fake-pod"})
 @patch('intel.k8s.get_node_from_pod',
@@ -199,11 +203,12 @@ def test_isolate_shared1():
             isolate.isolate("shared", False, "fake-cmd",
                             ["fake-args"], "fake-namespace",
                             socket_id=None)
-            assert p.cpu_affinity() == [4, 15, 5, 16]
+            assert p.cpu_affinity() == [4, 5, 15, 16]
 
 
 @patch('subprocess.Popen', MagicMock(return_value=MockChild()))
 @patch('intel.proc.getpid', MagicMock(return_value=1234))
+@patch('intel.proc.Process.start_time', MagicMock(return_value=4321))
 @patch('signal.signal', MagicMock(return_value=None))
 @patch.dict(os.environ, {"HOSTNAME": "fake-pod"})
 @patch('intel.k8s.get_node_from_pod',
@@ -217,11 +222,12 @@ def test_isolate_shared2():
             isolate.isolate("shared", False, "fake-cmd",
                             ["fake-args"], "fake-namespace",
                             socket_id=None)
-            assert p.cpu_affinity() == [4, 15, 5, 16]
+            assert p.cpu_affinity() == [4, 5, 15, 16]
 
 
 @patch('subprocess.Popen', MagicMock(return_value=MockChild()))
 @patch('intel.proc.getpid', MagicMock(return_value=1234))
+@patch('intel.proc.Process.start_time', MagicMock(return_value=4321))
 @patch('signal.signal', MagicMock(return_value=None))
 @patch.dict(os.environ, {"HOSTNAME": "fake-pod"})
 @patch('intel.k8s.get_node_from_pod',
@@ -235,11 +241,12 @@ def test_isolate_infra1():
             isolate.isolate("infra", False, "fake-cmd",
                             ["fake-args"], "fake-namespace",
                             socket_id=None)
-            assert p.cpu_affinity() == [6, 17, 7, 18, 8, 19]
+            assert p.cpu_affinity() == [6, 7, 8, 17, 18, 19]
 
 
 @patch('subprocess.Popen', MagicMock(return_value=MockChild()))
 @patch('intel.proc.getpid', MagicMock(return_value=1234))
+@patch('intel.proc.Process.start_time', MagicMock(return_value=4321))
 @patch('signal.signal', MagicMock(return_value=None))
 @patch.dict(os.environ, {"HOSTNAME": "fake-pod"})
 @patch('intel.k8s.get_node_from_pod',
@@ -253,11 +260,12 @@ def test_isolate_infra2():
             isolate.isolate("infra", False, "fake-cmd",
                             ["fake-args"], "fake-namespace",
                             socket_id=None)
-            assert p.cpu_affinity() == [6, 17, 7, 18, 8, 19]
+            assert p.cpu_affinity() == [6, 7, 8, 17, 18, 19]
 
 
 @patch('subprocess.Popen', MagicMock(return_value=MockChild()))
 @patch('intel.proc.getpid', MagicMock(return_value=1234))
+@patch('intel.proc.Process.start_time', MagicMock(return_value=4321))
 @patch('signal.signal', MagicMock(return_value=None))
 @patch.dict(os.environ, {"HOSTNAME": "fake-pod"})
 @patch('intel.k8s.get_node_from_pod',
@@ -276,6 +284,7 @@ def test_isolate_exclusive_non_isolcpus2():
 
 @patch('subprocess.Popen', MagicMock(return_value=MockChild()))
 @patch('intel.proc.getpid', MagicMock(return_value=1234))
+@patch('intel.proc.Process.start_time', MagicMock(return_value=4321))
 @patch('signal.signal', MagicMock(return_value=None))
 @patch.dict(os.environ, {"HOSTNAME": "fake-pod"})
 @patch('intel.k8s.get_node_from_pod',
@@ -294,6 +303,7 @@ def test_pool_not_exist():
 
 @patch('subprocess.Popen', MagicMock(return_value=MockChild()))
 @patch('intel.proc.getpid', MagicMock(return_value=1234))
+@patch('intel.proc.Process.start_time', MagicMock(return_value=4321))
 @patch('signal.signal', MagicMock(return_value=None))
 @patch('os.getenv', MagicMock(return_value=0))
 @patch.dict(os.environ, {"HOSTNAME": "fake-pod"})
@@ -314,6 +324,7 @@ def test_n_cpus_lt_one():
 
 @patch('subprocess.Popen', MagicMock(return_value=MockChild()))
 @patch('intel.proc.getpid', MagicMock(return_value=1234))
+@patch('intel.proc.Process.start_time', MagicMock(return_value=4321))
 @patch('signal.signal', MagicMock(return_value=None))
 @patch('os.getenv', MagicMock(return_value=5))
 @patch.dict(os.environ, {"HOSTNAME": "fake-pod"})
@@ -334,6 +345,7 @@ def test_not_enough_cpus():
 
 @patch('subprocess.Popen', MagicMock(return_value=MockChild()))
 @patch('intel.proc.getpid', MagicMock(return_value=1234))
+@patch('intel.proc.Process.start_time', MagicMock(return_value=4321))
 @patch('signal.signal', MagicMock(return_value=None))
 @patch.dict(os.environ, {"HOSTNAME": "fake-pod"})
 @patch('intel.k8s.get_node_from_pod',
@@ -11,10 +11,12 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import os
 from unittest.mock import patch, MagicMock
 
 import pytest
 from kubernetes import client as k8sclient
+from kubernetes.client.rest import ApiException as K8sApiException
 from kubernetes.config import ConfigException
 from urllib3.util.retry import MaxRetryError
 
@@ -208,6 +210,36 @@ def test_k8s_core_client_from_config():
         assert err is not None
 
 
+def test_k8s_core_client_reused():
+    load = MagicMock()
+    with patch('kubernetes.config.load_incluster_config', load), \
+            patch('kubernetes.client.CoreV1Api', MagicMock(
+                side_effect=lambda: MagicMock())):
+        k8s.reset_clients()
+        client = k8s.client_from_config(None)
+        assert k8s.client_from_config(None) is client
+        assert load.call_count == 1
+
+        k8s.reset_clients()
+        assert k8s.client_from_config(None) is not client
+        assert load.call_count == 2
+        k8s.reset_clients()
+
+
+@pytest.mark.parametrize("err, reset", [
+    (K8sApiException(status=401), True),
+    (K8sApiException(status=403), True),
+    (K8sApiException(status=404), False),
+    (MaxRetryError(None, "fake-url"), True),
+    (ConnectionResetError(), True),
+    (ValueError(), False)
+])
+def test_k8s_reset_clients_after(err, reset):
+    with patch('intel.k8s.reset_clients') as reset_mock:
+        k8s.reset_clients_after(err)
+        assert reset_mock.called == reset
+
+
 def test_k8s_delete_ds():
     mock_core = MagicMock()
     mock_ext = MagicMock()
@@ -242,3 +274,74 @@ def test_k8s_create_ds_apps():
         called_methods = mock.method_calls
         assert len(called_methods) == 1
         assert called_methods[0][0] == "create_namespaced_daemon_set"
+
+
+@patch.dict(os.environ, {"NODE_NAME": "fake-node"})
+def test_k8s_get_node_from_pod_env():
+    mock = MagicMock()
+    with patch(CLIENT_CONFIG, MagicMock(return_value=mock)):
+        assert k8s.get_node_from_pod(None, "fake-pod") == "fake-node"
+        assert len(mock.method_calls) == 0
+
+
+@patch.dict(os.environ, {"POD_NAMESPACE": "fake-ns"})
+@patch.dict(k8s._node_names, clear=True)
+def test_k8s_get_node_from_pod_read_and_cache():
+    os.environ.pop("NODE_NAME", None)
+    mock = MagicMock()
+    mock.read_namespaced_pod.return_value.spec.node_name = "fake-node"
+    with patch(CLIENT_CONFIG, MagicMock(return_value=mock)):
+        assert k8s.get_node_from_pod(None, "fake-pod") == "fake-node"
+        assert k8s.get_node_from_pod(None, "fake-pod") == "fake-node"
+        called_methods = mock.method_calls
+        assert len(called_methods) == 1
+        assert called_methods[0][0] == "read_namespaced_pod"
+        assert called_methods[0][1] == ("fake-pod", "fake-ns")
+
+
+@patch.dict(os.environ, {"POD_NAMESPACE": "fake-ns"})
+@patch.dict(k8s._node_names, clear=True)
+def test_k8s_get_node_from_pod_not_found_fallback():
+    os.environ.pop("NODE_NAME", None)
+    mock = MagicMock()
+    mock.read_namespaced_pod.side_effect = \
+        K8sApiException(status=404, reason="Not Found")
+    mock.list_pod_for_all_namespaces.return_value.to_dict.return_value = {
+        "items": [
+            {"metadata": {"name": "other-pod"},
+             "spec": {"node_name": "other-node"}},
+            {"metadata": {"name": "fake-pod"},
+             "spec": {"node_name": "fake-node"}}
+        ]
+    }
+    with patch(CLIENT_CONFIG, MagicMock(return_value=mock)):
+        assert k8s.get_node_from_pod(None, "fake-pod") == "fake-node"
+
+
+def test_k8s_get_config_map():
+    mock = MagicMock()
+    mock.read_namespaced_config_map.return_value = "fake-configmap"
+    with patch(CLIENT_CONFIG, MagicMock(return_value=mock)):
+        assert k8s.get_config_map(None, "fake-name", "fake-ns") == \
+            "fake-configmap"
+        called_methods = mock.method_calls
+        assert len(called_methods) == 1
+        assert called_methods[0][0] == "read_namespaced_config_map"
+        assert called_methods[0][1] == ("fake-name", "fake-ns")
+
+
+def test_k8s_get_config_map_not_found():
+    mock = MagicMock()
+    mock.read_namespaced_config_map.side_effect = \
+        K8sApiException(status=404, reason="Not Found")
+    with patch(CLIENT_CONFIG, MagicMock(return_value=mock)):
+        assert k8s.get_config_map(None, "fake-name", "fake-ns") is None
+
+
+def test_k8s_get_config_map_failure():
+    mock = MagicMock()
+    mock.read_namespaced_config_map.side_effect = \
+        K8sApiException(status=500, reason="Internal Server Error")
+    with patch(CLIENT_CONFIG, MagicMock(return_value=mock)):
+        with pytest.raises(K8sApiException):
+            k8s.get_config_map(None, "fake-name", "fake-ns")
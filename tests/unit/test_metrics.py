@@ -0,0 +1,60 @@
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from intel import metrics
+
+
+def test_metrics_counter():
+    registry = metrics.Registry()
+    counter = registry.counter("fake_total", "Fake counter.", ["result"])
+    counter.inc(result="ok")
+    counter.inc(2, result="ok")
+    counter.inc(result='"bad"')
+    assert counter.get(result="ok") == 3
+    with pytest.raises(ValueError):
+        counter.inc(other="ok")
+
+    assert registry.render() == (
+        "# HELP fake_total Fake counter.\n"
+        "# TYPE fake_total counter\n"
+        'fake_total{result="\\"bad\\""} 1\n'
+        'fake_total{result="ok"} 3\n')
+
+
+def test_metrics_counter_without_labels():
+    registry = metrics.Registry()
+    registry.counter("fake_total", "Fake counter.")
+    assert registry.render().endswith("fake_total 0\n")
+
+
+def test_metrics_histogram():
+    registry = metrics.Registry()
+    histogram = registry.histogram("fake_seconds", "Fake histogram.",
+                                   buckets=[0.1, 1.0])
+    histogram.observe(0.05)
+    histogram.observe(0.1)
+    histogram.observe(0.5)
+    histogram.observe(2.0)
+    assert histogram.get_count() == 4
+
+    assert registry.render() == (
+        "# HELP fake_seconds Fake histogram.\n"
+        "# TYPE fake_seconds histogram\n"
+        'fake_seconds_bucket{le="0.1"} 2\n'
+        'fake_seconds_bucket{le="1.0"} 3\n'
+        'fake_seconds_bucket{le="+Inf"} 4\n'
+        "fake_seconds_sum 2.65\n"
+        "fake_seconds_count 4\n")
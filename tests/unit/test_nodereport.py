@@ -1,4 +1,7 @@
-from intel import nodereport, topology
+import os
+from unittest.mock import MagicMock, patch
+
+from intel import config, nodereport, topology
 
 
 def return_socket():
@@ -64,3 +67,22 @@ def test_nodereport_class():
     resp = nr.as_dict()
     assert resp["description"] == "fake_description"
     assert 0 in resp["topology"]["sockets"].keys()
+
+
+def test_check_cmk_config_overlap():
+    conf = config.build_config({
+        "exclusive": {0: {"0,4": [], "1,5": []}},
+        "shared": {0: {"2,6": []}},
+        "infra": {0: {"3,7,5": []}}})
+    report = nodereport.NodeReport()
+    with patch.dict(os.environ, {"HOSTNAME": "fake-pod"}), \
+            patch('intel.k8s.get_node_from_pod',
+                  MagicMock(return_value="fake-node")), \
+            patch('intel.config.get_config', MagicMock(return_value=conf)):
+        nodereport.check_cmk_config(report, "default")
+    check = report.checks[0]
+    assert check.errors == [
+        "CPU list overlap detected in exclusive:1,5 (shared with other cpu "
+        "lists: 5)",
+        "CPU list overlap detected in infra:3,7,5 (shared with other cpu "
+        "lists: 5)"]
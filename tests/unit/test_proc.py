@@ -55,35 +55,19 @@ def test_process_cpus_allowed_failure(monkeypatch):
         fake_process.cpus_allowed()
 
 
-def test_unfold_empty_cpu_list():
-    assert(proc.unfold_cpu_list("") == [])
-
-
-def test_unfold_valid_cpu_lists():
-    assert(proc.unfold_cpu_list("0") == [0])
-    assert(proc.unfold_cpu_list("0-1") == [0, 1])
-    assert(proc.unfold_cpu_list("0-1,4") == [0, 1, 4])
-    assert(proc.unfold_cpu_list("0-1,4-6") == [0, 1, 4, 5, 6])
-    assert(proc.unfold_cpu_list("0-1,4-6,9") == [0, 1, 4, 5, 6, 9])
-    assert(proc.unfold_cpu_list("0-1,4-6,9-10") == [0, 1, 4, 5, 6, 9, 10])
-    assert(proc.unfold_cpu_list("0,1,4,5,6,9,10") == [0, 1, 4, 5, 6, 9, 10])
-
-
-def test_unfold_invalid_cpu_lists():
-    with pytest.raises(ValueError):
-        proc.unfold_cpu_list(",")
-
-    with pytest.raises(ValueError):
-        proc.unfold_cpu_list("-")
-
-    with pytest.raises(ValueError):
-        proc.unfold_cpu_list("0,")
-
-    with pytest.raises(ValueError):
-        proc.unfold_cpu_list("0,-")
-
-    with pytest.raises(ValueError):
-        proc.unfold_cpu_list("0,1-")
-
-    with pytest.raises(ValueError):
-        proc.unfold_cpu_list("0,1-2,")
+def test_live_pids(monkeypatch, tmpdir):
+    for name in ["1", "1234", "self", "cpuinfo"]:
+        tmpdir.mkdir(name)
+    monkeypatch.setenv(proc.ENV_PROC_FS, str(tmpdir))
+    assert proc.live_pids() == {1, 1234}
+
+
+def test_process_start_time(monkeypatch, tmpdir):
+    # The command name may contain spaces and parentheses.
+    tmpdir.mkdir("1234").join("stat").write(
+        "1234 (a (b) c) S 1 1234 1234 0 -1 4194560 1 0 0 0 0 0 0 0 20 0 1 "
+        "0 987654 10000 100 18446744073709551615\n")
+    monkeypatch.setenv(proc.ENV_PROC_FS, str(tmpdir))
+    assert proc.Process(1234).start_time() == 987654
+    with pytest.raises(OSError):
+        proc.Process(1235).start_time()
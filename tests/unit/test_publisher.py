@@ -0,0 +1,120 @@
+# Copyright (c) 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+from kubernetes.client.rest import ApiException as K8sApiException
+
+from intel import publisher
+
+
+@patch('intel.publisher.k8sconfig', MagicMock())
+@patch('intel.publisher.k8sclient', MagicMock())
+@patch.dict(os.environ, {"NODE_NAME": "fake-node"})
+def test_report_publisher_reuses_resource():
+    resource = MagicMock(body={"spec": {}})
+    with patch('intel.k8s.get_kube_version',
+               MagicMock(return_value="v1.10.0")) as get_version, \
+            patch('intel.custom_resource.CustomResourceDefinitionType') \
+            as crd_type:
+        crd_type.return_value.create.return_value = resource
+        p = publisher.ReportPublisher("cmk-nodereport", ["cmk-nr"],
+                                      "Nodereport")
+        p.publish({"fake": 1})
+        p.publish({"fake": 2})
+
+        assert get_version.call_count == 1
+        crd_type.return_value.create.assert_called_once_with("fake-node")
+        assert resource.save.call_count == 2
+        assert resource.body["spec"]["report"] == {"fake": 2}
+
+
+@patch('intel.publisher.k8sconfig', MagicMock())
+@patch('intel.publisher.k8sclient', MagicMock())
+@patch('intel.k8s.get_kube_version', MagicMock(return_value="v1.6.0"))
+@patch.dict(os.environ, {"NODE_NAME": "fake-node"})
+def test_report_publisher_retries_after_error():
+    resource = MagicMock(body={})
+    resource.save.side_effect = [K8sApiException(status=500), True]
+    with patch('intel.third_party.ThirdPartyResourceType') as tpr_type:
+        tpr_type.return_value.create.return_value = resource
+        p = publisher.ReportPublisher("cmk-nodereport", ["cmk-nr"],
+                                      "Nodereport")
+        with pytest.raises(K8sApiException):
+            p.publish({"fake": 1})
+        p.publish({"fake": 2})
+
+        # The resource type is set up again after the error.
+        assert tpr_type.return_value.create.call_count == 2
+        assert resource.body["report"] == {"fake": 2}
+
+
+@patch('intel.publisher.k8sconfig', MagicMock())
+@patch('intel.publisher.k8sclient', MagicMock())
+@patch('intel.k8s.get_kube_version', MagicMock(return_value="v1.10.0"))
+@patch.dict(os.environ, {"NODE_NAME": "fake-node"})
+def test_report_publisher_resets_clients():
+    resource = MagicMock(body={"spec": {}})
+    resource.save.side_effect = K8sApiException(status=401)
+    with patch('intel.custom_resource.CustomResourceDefinitionType') \
+            as crd_type, \
+            patch('intel.k8s.reset_clients') as reset_mock:
+        crd_type.return_value.create.return_value = resource
+        p = publisher.ReportPublisher("cmk-nodereport", ["cmk-nr"],
+                                      "Nodereport")
+        with pytest.raises(K8sApiException):
+            p.publish({"fake": 1})
+        assert reset_mock.called
+
+
+@patch('intel.publisher.k8sconfig', MagicMock())
+@patch('intel.publisher.k8sclient', MagicMock())
+@patch('intel.k8s.get_kube_version', MagicMock(return_value="v1.10.0"))
+@patch.dict(os.environ, {"NODE_NAME": "fake-node"})
+def test_report_publisher_publishes_changes_and_heartbeats():
+    resource = MagicMock(body={"spec": {}})
+    with patch('intel.custom_resource.CustomResourceDefinitionType') \
+            as crd_type, \
+            patch('time.monotonic', MagicMock(return_value=100)) as now:
+        crd_type.return_value.create.return_value = resource
+        p = publisher.ReportPublisher("cmk-nodereport", ["cmk-nr"],
+                                      "Nodereport", heartbeat=60)
+        assert p.publish({"fake": 1})
+        now.return_value = 130
+        assert not p.publish({"fake": 1})
+        assert resource.save.call_count == 1
+
+        assert p.publish({"fake": 2})
+        assert resource.save.call_count == 2
+
+        # Unchanged, but published again after the heartbeat.
+        now.return_value = 190
+        assert p.publish({"fake": 2})
+        assert resource.save.call_count == 3
+
+        # Not saved by the resource, published again with the next report.
+        resource.save.return_value = False
+        assert not p.publish({"fake": 0})
+        resource.save.return_value = True
+        assert p.publish({"fake": 0})
+        assert resource.save.call_count == 5
+
+        # Published again after an error.
+        resource.save.side_effect = [K8sApiException(status=500), True]
+        now.return_value = 200
+        with pytest.raises(K8sApiException):
+            p.publish({"fake": 3})
+        assert p.publish({"fake": 3})
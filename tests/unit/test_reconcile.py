@@ -0,0 +1,72 @@
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+from unittest.mock import MagicMock, patch
+
+from intel import config, reconcile
+
+FAKE_CONFIG = {
+    "exclusive": {
+        0: {
+            "0,8": ["1001"],
+            "1,9": ["1002"],
+            "2,10": ["1002"],
+            "3,11": []
+        }
+    },
+    "shared": {
+        0: {
+            "4-7,12-15": ["1001", "1003"]
+        }
+    }
+}
+
+
+def return_conf():
+    return config.build_config(copy.deepcopy(FAKE_CONFIG))
+
+
+def reclaimed(report):
+    return sorted((r.pid(), r.pool(), r.cpus())
+                  for r in report.reclaimed_cpu_lists())
+
+
+@patch('intel.proc.live_pids', MagicMock(return_value={1001, 1003}))
+def test_generate_report_dead_tasks():
+    report = reconcile.generate_report(return_conf())
+    assert reclaimed(report) == [(1002, "exclusive", "1,9"),
+                                 (1002, "exclusive", "2,10")]
+
+
+@patch('intel.proc.live_pids', MagicMock(return_value={1001, 1002, 1003}))
+def test_generate_report_reused_pid():
+    conf = return_conf()
+    conf.set_task_start_time("1001", 100)
+    conf.set_task_start_time("1002", 200)
+    start_times = {1001: 100, 1002: 200, 1003: 300}
+
+    def start_time(process):
+        return start_times[process.pid]
+
+    with patch('intel.proc.Process.start_time', start_time):
+        assert reclaimed(reconcile.generate_report(conf, True)) == []
+
+        # Pid 1001 now belongs to a new process. Task 1003 has no recorded
+        # start time and is left alone.
+        start_times[1001] = 500
+        start_times[1003] = 600
+        assert reclaimed(reconcile.generate_report(conf)) == []
+        assert reclaimed(reconcile.generate_report(conf, True)) == [
+            (1001, "exclusive", "0,8"), (1001, "shared", "4-7,12-15")]
@@ -203,27 +203,91 @@ def test_third_party_resource_save_failure(caplog):
         assert mock_create.called
 
 
-def test_third_party_resource_save_recreate_failure(caplog):
-    fake_http_resp = FakeHTTPResponse(500, FAKE_REASON, FAKE_BODY)
-    fake_api_exception = K8sApiException(http_resp=fake_http_resp)
-    fake_http_conflict_resp = FakeHTTPResponse(client.CONFLICT, FAKE_REASON,
-                                               FAKE_BODY)
-    fake_api_conflict_exception = K8sApiException(
-                                            http_resp=fake_http_conflict_resp)
-    mock = MagicMock()
-    with patch(K8S_EXTENSIONS_CLIENT,
-               MagicMock(return_value=mock)):
-        fake_tpr = FakeTPR.generate_tpr()
-        mock_create = MagicMock(side_effect=fake_api_conflict_exception)
-        mock_remove = MagicMock(side_effect=fake_api_exception)
-        with patch(THIRD_PARTY_RESOURCE_CREATE,
-                   mock_create), \
-            patch('intel.third_party.ThirdPartyResource.remove',
-                  mock_remove):
-            with pytest.raises(K8sApiException):
-                fake_tpr.save()
-        exp_log_err = "Previous resource has been detected. Recreating..."
-        caplog_tuple = caplog.record_tuples
-        assert caplog_tuple[-1][2] == exp_log_err
-        assert mock_create.called
-        assert mock_remove.called
+def api_exception(status):
+    return K8sApiException(http_resp=FakeHTTPResponse(status, FAKE_REASON,
+                                                      FAKE_BODY))
+
+
+class FakeApi:
+    # Answers call_api with the next response for the HTTP method, either
+    # a result or an exception to raise, and records the calls.
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+        self.api_client = MagicMock()
+        self.api_client.call_api = self.call_api
+
+    def call_api(self, path, method, header_params, body=None, **kwargs):
+        self.calls.append((method, body))
+        response = self.responses[method].pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def methods(self):
+        methods = [method for method, _ in self.calls]
+        self.calls = []
+        return methods
+
+
+def version(resource_version):
+    return {"metadata": {"resourceVersion": resource_version}}
+
+
+def test_third_party_resource_save_update_existing():
+    api = FakeApi({
+        "POST": [api_exception(client.CONFLICT)],
+        "GET": [version("5")],
+        "PUT": [version("6"), version("7")]
+    })
+    with patch(K8S_EXTENSIONS_CLIENT, MagicMock(return_value=api)):
+        fake = FakeTPR.generate_tpr()
+        fake.save()
+        put_body = api.calls[-1][1]
+        assert api.methods() == ["POST", "GET", "PUT"]
+        assert put_body["metadata"]["resourceVersion"] == "5"
+        assert fake.resource_version == "6"
+
+        fake.body["fake"] = "changed"
+        fake.save()
+        put_body = api.calls[-1][1]
+        assert api.methods() == ["PUT"]
+        assert put_body["metadata"]["resourceVersion"] == "6"
+        assert "resourceVersion" not in fake.body["metadata"]
+
+
+def test_third_party_resource_save_replace_removed_or_changed():
+    api = FakeApi({
+        "POST": [version("1"), version("3")],
+        "GET": [version("4")],
+        "PUT": [api_exception(client.NOT_FOUND),
+                api_exception(client.CONFLICT), version("5")]
+    })
+    with patch(K8S_EXTENSIONS_CLIENT, MagicMock(return_value=api)):
+        fake = FakeTPR.generate_tpr()
+        fake.save()
+        assert api.methods() == ["POST"]
+
+        # Removed by somebody else.
+        fake.body["fake"] = 1
+        fake.save()
+        assert api.methods() == ["PUT", "POST"]
+        assert fake.resource_version == "3"
+
+        # Changed by somebody else.
+        fake.body["fake"] = 2
+        fake.save()
+        assert api.methods() == ["PUT", "GET", "PUT"]
+        assert fake.resource_version == "5"
+
+
+def test_third_party_resource_save_update_failure():
+    api = FakeApi({
+        "POST": [api_exception(client.CONFLICT)],
+        "GET": [api_exception(500)]
+    })
+    with patch(K8S_EXTENSIONS_CLIENT, MagicMock(return_value=api)):
+        fake = FakeTPR.generate_tpr()
+        with pytest.raises(K8sApiException):
+            fake.save()
+        assert api.methods() == ["POST", "GET"]
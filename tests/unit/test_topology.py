@@ -12,6 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+from tests import helpers
+
 from intel import topology
 
 
@@ -52,6 +58,199 @@ def test_init_topology_two_cores():
     assert cores[1].cpu_ids() == [1]
 
 
+def test_topology_cache_domains():
+    lscpu = """# CPU,Core,Socket,Node,,L1d,L1i,L2,L3
+0,0,0,0,,0,0,0,0
+1,1,0,0,,1,1,0,0
+2,2,1,1,,2,2,1,1
+"""
+    assert topology.parse(lscpu).cache_domains() == \
+        {0: (0, 0), 1: (0, 0), 2: (1, 1)}
+
+    lscpu = """# CPU,Core,Socket,Node,,L1d,L1i,L2
+0,0,0,,,0,0,0
+"""
+    assert topology.parse(lscpu).cache_domains() == {0: (0, None)}
+
+
+def test_topology_numa_nodes():
+    # Two NUMA nodes per socket.
+    lscpu = """# CPU,Core,Socket,Node,,L1d,L1i,L2,L3
+0,0,0,0,,0,0,0,0
+1,1,0,0,,1,1,1,0
+2,2,0,1,,2,2,2,1
+3,3,0,1,,3,3,3,1
+4,4,1,2,,4,4,4,2
+5,5,1,2,,5,5,5,2
+6,6,1,3,,6,6,6,3
+7,7,1,3,,7,7,7,3
+"""
+    platform = topology.parse(lscpu)
+    assert sorted(platform.numa_nodes) == [0, 1, 2, 3]
+    node = platform.get_numa_node(1)
+    assert node.socket_id == 0
+    assert [c.core_id for c in node.get_cores()] == [2, 3]
+    assert node.as_dict(include_pool=False)["id"] == 1
+    assert platform.get_numa_node(4) is None
+
+    cores = platform.get_cores(mode="spread")
+    assert [c.core_id for c in cores] == [0, 2, 4, 6, 1, 3, 5, 7]
+
+
+def write_sysfs(root, path, content):
+    path = os.path.join(root, "sys", path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def test_topology_cached_views():
+    lscpu = """# CPU,Core,Socket
+0,0,0
+1,1,0
+2,0,0
+3,1,0"""
+    socket = topology.parse(lscpu, [0, 2]).get_socket(0)
+    assert [c.core_id for c in socket.get_isolated_cores()] == [0]
+    # Callers get copies of the cached views.
+    socket.get_isolated_cores().clear()
+    assert [c.core_id for c in socket.get_isolated_cores()] == [0]
+
+    assert socket.get_cores_from_pool("exclusive") == []
+    socket.cores[0].pool = "exclusive"
+    assert socket.get_cores_from_pool("exclusive") == [socket.cores[0]]
+    assert [c.core_id for c in socket.get_cores_from_pool(None)] == [1]
+
+    socket.cores[2] = topology.Core(2, {4: topology.CPU(4)})
+    assert [c.core_id for c in socket.get_shared_cores()] == [1, 2]
+    assert [c.core_id for c in socket.get_cores_from_pool(None)] == [1, 2]
+
+    with pytest.raises(AttributeError):
+        socket.cores[2].cpus[4].fake = True
+
+
+def test_device_locality(tmpdir):
+    root = str(tmpdir)
+    pci = "bus/pci/devices/0000:18:00.1/"
+    write_sysfs(root, pci + "numa_node", "1\n")
+    write_sysfs(root, pci + "local_cpulist", "4-7,12-15\n")
+    write_sysfs(root, "class/net/ens1f1/address", "")
+    os.symlink(os.path.join(root, "sys", pci),
+               os.path.join(root, "sys", "class/net/ens1f1/device"))
+    write_sysfs(root, "bus/pci/devices/0000:19:00.0/numa_node", "-1\n")
+    write_sysfs(root, "bus/pci/devices/0000:1a:00.0/numa_node", "0\n")
+    write_sysfs(root, "devices/system/node/node0/cpulist", "0-3\n")
+
+    with patch.dict(os.environ, {topology.ENV_LSCPU_SYSFS: root}):
+        expected = (1, [4, 5, 6, 7, 12, 13, 14, 15])
+        assert topology.device_locality("0000:18:00.1") == expected
+        assert topology.device_locality("ens1f1") == expected
+        assert topology.device_locality("0000:19:00.0") == (None, [])
+        # Without local_cpulist, the cpus of the NUMA node.
+        assert topology.device_locality("0000:1a:00.0") == (0, [0, 1, 2, 3])
+        with pytest.raises(OSError):
+            topology.device_locality("eth9")
+
+
+def test_discover_cache(tmpdir):
+    root = str(tmpdir)
+    write_sysfs(root, "devices/system/cpu/online", "0-1\n")
+    proc_fs = os.path.join(root, "proc")
+    os.makedirs(os.path.join(proc_fs, "sys", "kernel", "random"))
+    with open(os.path.join(proc_fs, "cmdline"), "w") as f:
+        f.write("isolcpus=1\n")
+    with open(os.path.join(proc_fs, "sys/kernel/random/boot_id"), "w") as f:
+        f.write("fake-boot-id\n")
+
+    lscpu = MagicMock(return_value="# CPU,Core,Socket,Node\n0,0,0,0\n1,1,0,0")
+    with patch.dict(os.environ, {topology.ENV_LSCPU_SYSFS: root,
+                                 "CMK_PROC_FS": proc_fs}), \
+            patch('intel.topology.lscpu', lscpu), \
+            patch('intel.topology.topology_cache', topology.TopologyCache()):
+        first = topology.discover(False, cache=True)
+        second = topology.discover(False, cache=True)
+        assert lscpu.call_count == 1
+        assert first is not second
+        assert second.get_socket(0).cores[1].is_isolated()
+
+        topology.discover(False)
+        assert lscpu.call_count == 2
+
+        # A cpu went offline.
+        write_sysfs(root, "devices/system/cpu/online", "0\n")
+        topology.discover(False, cache=True)
+        topology.discover(False, cache=True)
+        assert lscpu.call_count == 3
+
+        # Without a fingerprint, nothing is cached.
+        os.remove(os.path.join(proc_fs, "sys/kernel/random/boot_id"))
+        topology.discover(False, cache=True)
+        topology.discover(False, cache=True)
+        assert lscpu.call_count == 5
+
+
+def test_read_sysfs_topology_xeon_d():
+    with patch.dict(os.environ, {topology.ENV_LSCPU_SYSFS:
+                                 helpers.sysfs_dir("xeon_d")}):
+        # Same as `lscpu -p -s tests/data/sysfs/xeon_d`.
+        assert topology.read_sysfs_topology() == \
+            "# CPU,Core,Socket,Node\n" + "".join(
+                "{},{},0,\n".format(cpu, cpu % 8) for cpu in range(16))
+
+
+def test_read_sysfs_topology_caches(tmpdir):
+    # Two sockets with two cores of two threads each, cpu ids alternate
+    # between the sockets. The ids of the L3 caches are in sysfs.
+    root = str(tmpdir)
+    for cpu in range(8):
+        siblings = "{},{}".format(cpu % 4, cpu % 4 + 4)
+        package = "{},{},{},{}".format(*range(cpu % 2, 8, 2))
+        path = "devices/system/cpu/cpu{}/".format(cpu)
+        write_sysfs(root, path + "topology/core_id", str(cpu % 4 // 2 * 4))
+        write_sysfs(root, path + "topology/thread_siblings_list", siblings)
+        write_sysfs(root, path + "topology/core_siblings_list", package)
+        caches = [("1", "Data", siblings), ("1", "Instruction", siblings),
+                  ("2", "Unified", siblings), ("3", "Unified", package)]
+        for index, (level, cache_type, shared) in enumerate(caches):
+            cache = path + "cache/index{}/".format(index)
+            write_sysfs(root, cache + "level", level)
+            write_sysfs(root, cache + "type", cache_type)
+            write_sysfs(root, cache + "shared_cpu_list", shared)
+        write_sysfs(root, path + "cache/index3/id", str(7 - cpu % 2))
+    write_sysfs(root, "devices/system/cpu/online", "0-7")
+    write_sysfs(root, "devices/system/node/node0/cpulist", "0,2,4,6")
+    write_sysfs(root, "devices/system/node/node1/cpulist", "1,3,5,7")
+
+    with patch.dict(os.environ, {topology.ENV_LSCPU_SYSFS: root}):
+        # Same as `lscpu -p -s` of this sysfs.
+        assert topology.read_sysfs_topology() == """\
+# CPU,Core,Socket,Node,,L1d,L1i,L2,L3
+0,0,0,0,,0,0,0,7
+1,1,1,1,,1,1,1,6
+2,2,0,0,,2,2,2,7
+3,3,1,1,,3,3,3,6
+4,0,0,0,,0,0,0,7
+5,1,1,1,,1,1,1,6
+6,2,0,0,,2,2,2,7
+7,3,1,1,,3,3,3,6
+"""
+        platform = topology.parse(topology.lscpu())
+        assert platform.get_numa_node(1).as_dict(False)["cores"] == [
+            {"id": 1, "cpus": [{"id": 1, "isolated": False},
+                               {"id": 5, "isolated": False}]},
+            {"id": 3, "cpus": [{"id": 3, "isolated": False},
+                               {"id": 7, "isolated": False}]}]
+
+
+def test_lscpu_fallback(tmpdir):
+    with patch.dict(os.environ, {topology.ENV_LSCPU_SYSFS: str(tmpdir)}), \
+            patch('subprocess.check_output',
+                  MagicMock(return_value=b"0,0,0")) as check_output:
+        assert topology.lscpu() == "0,0,0"
+        check_output.assert_called_once_with(
+            "lscpu -p -s %s" % str(tmpdir), shell=False)
+
+
 def test_init_topology_one_socket():
     lscpu = """#The following is the parsable format, which can be fed to other
 # programs. Each different item in every column has an unique ID
@@ -1,11 +1,18 @@
-from unittest.mock import patch, MagicMock
-import pytest
+import base64
+import copy
+import http.client
+import json
 import os
+import socket
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from tests.perf import webhook_load
 from yamlreader import YamlReaderError
-import json
-import base64
 
-from intel import webhook, util
+from intel import util, webhook
 
 MUTATIONS_YAML = "mutations.yaml"
 
@@ -95,14 +102,51 @@ def test_webhook_inject_env_exists(caplog):
 
 
 def test_webhook_generate_patch():
-    pod = MagicMock()
-    patch = webhook.generate_patch(pod)
-    assert patch[0]['op'] == "replace"
-    assert patch[0]['path'] == "/metadata"
-    assert patch[0]['value'] == pod["metadata"]
-    assert patch[1]['op'] == "replace"
-    assert patch[1]['path'] == "/spec"
-    assert patch[1]['value'] == pod["spec"]
+    original = {
+        "metadata": {"name": "fake-pod", "labels": {"app": "fake"}},
+        "spec": {
+            "containers": [{"name": "fake", "env": [{"name": "A"}]}],
+            "nodeName": "fake-node",
+            "volumes": [{"name": "a"}, {"name": "b"}, {"name": "c"}]
+        }
+    }
+    pod = {
+        "metadata": {
+            "name": "fake-pod",
+            "annotations": {"cmk.intel.com/resources-injected": "true"}
+        },
+        "spec": {
+            "containers": [
+                {"name": "fake", "env": [{"name": "A"}, {"name": "B"}]}
+            ],
+            "nodeName": "other-node",
+            "volumes": [{"name": "a"}],
+            "tolerations": [{"operator": "Exists"}]
+        }
+    }
+    patch = webhook.generate_patch(original, pod)
+    assert patch == [
+        {"op": "remove", "path": "/metadata/labels"},
+        {"op": "add", "path": "/metadata/annotations",
+         "value": {"cmk.intel.com/resources-injected": "true"}},
+        {"op": "add", "path": "/spec/containers/0/env/1",
+         "value": {"name": "B"}},
+        {"op": "replace", "path": "/spec/nodeName", "value": "other-node"},
+        {"op": "remove", "path": "/spec/volumes/2"},
+        {"op": "remove", "path": "/spec/volumes/1"},
+        {"op": "add", "path": "/spec/tolerations",
+         "value": [{"operator": "Exists"}]}
+    ]
+    assert webhook.generate_patch(pod, pod) == []
+
+
+def test_webhook_generate_patch_escape():
+    original = {"metadata": {"annotations": {"a/b~c": "1"}}}
+    pod = {"metadata": {"annotations": {"a/b~c": "2"}}}
+    assert webhook.generate_patch(original, pod) == [
+        {"op": "replace", "path": "/metadata/annotations/a~1b~0c",
+         "value": "2"}
+    ]
 
 
 def test_webhook_config_init():
@@ -273,7 +317,287 @@ def test_webhook_mutate_success_core_number_mismatch():
     assert "patch" in ar['response']
 
     patch = json.loads(base64.b64decode(ar['response']['patch']))
-    containers = patch[1]['value']['containers']
-    assert len(containers) == 2
-    assert containers[0]['env'][1]['value'] == "1"
-    assert containers[1]['env'][1]['value'] == "2"
+    env = {p['path']: p['value'] for p in patch
+           if p['path'].startswith("/spec/containers/")}
+    assert env["/spec/containers/0/env"][1]['value'] == "1"
+    assert env["/spec/containers/1/env"][1]['value'] == "2"
+    # Only what the mutations added is sent back.
+    assert all(p['op'] == "add" for p in patch)
+    assert "/spec/containers" not in [p['path'] for p in patch]
+
+
+def test_webhook_mutation_template_reload(tmpdir):
+    filepath = os.path.join(str(tmpdir), MUTATIONS_YAML)
+    with open(filepath, "w") as f:
+        f.write("mutations:\n  perPod: {}\n")
+    template = webhook.MutationTemplate(filepath)
+    mutations = template.get()
+    assert mutations == {"perPod": {}}
+
+    # Not read again while the file is unchanged.
+    with patch('intel.webhook.yaml_load') as yaml_load:
+        assert template.get() is mutations
+        assert not yaml_load.called
+
+    # Replaced like a ConfigMap volume update.
+    with open(filepath + ".new", "w") as f:
+        f.write("mutations:\n  perContainer: {}\n")
+    os.rename(filepath + ".new", filepath)
+    assert template.get() == {"perContainer": {}}
+
+    # Broken mutations keep the loaded ones.
+    with open(filepath + ".new", "w") as f:
+        f.write("mutations: [\n")
+    os.rename(filepath + ".new", filepath)
+    assert template.get() == {"perContainer": {}}
+
+
+def test_webhook_mutate_keeps_template():
+    conf_file = os.path.join(util.cmk_root(), "tests", "data",
+                             "webhook", MUTATIONS_YAML)
+    mutations = copy.deepcopy(webhook.get_mutations(conf_file))
+    for _ in range(2):
+        ar = get_admission_review()
+        ar['request']['object']['spec']['containers'].append(
+            get_cmk_container3())
+        webhook.mutate(ar, conf_file)
+        patch = json.loads(base64.b64decode(ar['response']['patch']))
+        env = [p['value'] for p in patch
+               if p['path'] == "/spec/containers/1/env"][0]
+        assert [e['name'] for e in env] == ["CMK_PROC_FS", "CMK_NUM_CORES"]
+    assert webhook.get_mutations(conf_file) == mutations
+
+
+def test_webhook_config_load_server_mode(tmpdir):
+    conf_file = os.path.join(util.cmk_root(), "tests", "data",
+                             "webhook", "server.yaml")
+    config = webhook.WebhookServerConfig()
+    config.load(conf_file)
+    assert config.mode == "threaded"
+    assert config.max_connections == webhook.DEFAULT_MAX_CONNECTIONS
+    assert config.keep_alive_timeout == webhook.DEFAULT_KEEP_ALIVE_TIMEOUT
+    assert config.request_timeout == webhook.DEFAULT_REQUEST_TIMEOUT
+    assert config.max_request_size == webhook.DEFAULT_MAX_REQUEST_SIZE
+
+    conf_file = os.path.join(str(tmpdir), "server.yaml")
+    with open(conf_file, "w") as f:
+        f.write("server:\n  binding-address: 0.0.0.0\n  port: 443\n"
+                "  cert: c\n  key: k\n  mutations: m\n  mode: forked\n")
+    with pytest.raises(SystemExit):
+        config.load(conf_file)
+
+
+def start_webhook_server(mode, max_connections=4, keep_alive_timeout=5,
+                         max_request_size=webhook.DEFAULT_MAX_REQUEST_SIZE):
+    data_dir = os.path.join(util.cmk_root(), "tests", "data", "webhook")
+    config = webhook.WebhookServerConfig()
+    config.address = "127.0.0.1"
+    config.port = 0
+    config.cert = os.path.join(data_dir, "cert.pem")
+    config.key = os.path.join(data_dir, "key.pem")
+    config.mutations = os.path.join(data_dir, MUTATIONS_YAML)
+    config.mode = mode
+    config.max_connections = max_connections
+    config.keep_alive_timeout = keep_alive_timeout
+    config.request_timeout = 5
+    config.max_request_size = max_request_size
+    server = webhook.WebhookServer(config, webhook.WebhookRequestHandler,
+                                   None, "True")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def stop_webhook_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+def test_webhook_server_threaded_keep_alive():
+    server = start_webhook_server("threaded")
+    try:
+        stats = webhook_load.run("127.0.0.1", server.server_address[1], 40,
+                                 4, webhook_load.ssl_context(), 2)
+    finally:
+        stop_webhook_server(server)
+    assert stats["errors"] == 0
+    assert len(stats["latencies"]) == 40
+    # Each client reused its connection.
+    assert stats["connections"] == 4
+
+
+def test_webhook_server_request_too_large():
+    review = json.dumps(webhook_load.admission_review()).encode('utf-8')
+    server = start_webhook_server("threaded",
+                                  max_request_size=len(review) - 1)
+    try:
+        connection = http.client.HTTPSConnection(
+            "127.0.0.1", server.server_address[1],
+            context=webhook_load.ssl_context())
+        connection.request("POST", "/mutate", review,
+                           {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+    finally:
+        stop_webhook_server(server)
+    assert response.status == 413
+
+
+# Opens n keep-alive connections and sends an admission review on each,
+# leaving them open.
+def open_connections(server, n):
+    connections = []
+    for _ in range(n):
+        connection = http.client.HTTPSConnection(
+            "127.0.0.1", server.server_address[1],
+            context=webhook_load.ssl_context())
+        connection.request("POST", "/mutate", json.dumps(
+            webhook_load.admission_review(cmk=False)),
+            {"Content-Type": "application/json"})
+        assert connection.getresponse().read()
+        connections.append(connection)
+    return connections
+
+
+def test_webhook_server_many_connections():
+    server = start_webhook_server("threaded", max_connections=16)
+    connections = open_connections(server, 8)
+    try:
+        # Idle connections don't hold up new ones.
+        start = time.monotonic()
+        stats = webhook_load.run("127.0.0.1", server.server_address[1], 4,
+                                 4, webhook_load.ssl_context())
+        assert stats["errors"] == 0
+        assert time.monotonic() - start < 2
+    finally:
+        for connection in connections:
+            connection.close()
+        stop_webhook_server(server)
+
+
+def test_webhook_server_max_connections():
+    server = start_webhook_server("threaded", max_connections=2,
+                                  keep_alive_timeout=0.5)
+    connections = open_connections(server, 2)
+    try:
+        # Accepted once an idle connection has timed out.
+        start = time.monotonic()
+        stats = webhook_load.run("127.0.0.1", server.server_address[1], 1,
+                                 1, webhook_load.ssl_context())
+        assert stats["errors"] == 0
+        assert time.monotonic() - start < 3
+    finally:
+        for connection in connections:
+            connection.close()
+        stop_webhook_server(server)
+
+
+def test_webhook_server_slow_client():
+    server = start_webhook_server("threaded")
+    # A client that connects but never starts the TLS handshake.
+    slow = socket.create_connection(("127.0.0.1", server.server_address[1]))
+    try:
+        stats = webhook_load.run("127.0.0.1", server.server_address[1], 1,
+                                 1, webhook_load.ssl_context())
+        assert stats["errors"] == 0
+    finally:
+        slow.close()
+        stop_webhook_server(server)
+
+
+def test_webhook_fast_path_response():
+    review = webhook_load.admission_review(2, cmk=False)
+    post_data = json.dumps(review).encode('utf-8')
+    response = json.loads(webhook.fast_path_response(post_data).decode())
+    assert response == {
+        "kind": "AdmissionReview",
+        "apiVersion": review["apiVersion"],
+        "response": {"allowed": True, "uid": review["request"]["uid"]}
+    }
+
+    # Pods mentioning CMK go through mutate.
+    review = webhook_load.admission_review(1, cmk=False)
+    review["request"]["object"]["metadata"]["annotations"] = {
+        webhook.CMK_MUTATE_ANNOTATION: "true"}
+    assert webhook.fast_path_response(
+        json.dumps(review).encode('utf-8')) is None
+    assert webhook.fast_path_response(json.dumps(
+        webhook_load.admission_review(1)).encode('utf-8')) is None
+
+    # So do reviews of other resources and unexpected layouts.
+    review = webhook_load.admission_review(1, cmk=False)
+    review["request"]["kind"]["kind"] = "Deployment"
+    assert webhook.fast_path_response(
+        json.dumps(review).encode('utf-8')) is None
+    review = webhook_load.admission_review(1, cmk=False)
+    review = {"request": review["request"], "kind": review["kind"],
+              "apiVersion": review["apiVersion"]}
+    assert webhook.fast_path_response(
+        json.dumps(review).encode('utf-8')) is None
+
+
+def test_webhook_server_admission_paths():
+    paths = ["fast", "skipped", "mutated", "failed"]
+    before = {p: webhook.request_duration.get_count(path=p) for p in paths}
+    server = start_webhook_server("threaded")
+    try:
+        stats = webhook_load.run("127.0.0.1", server.server_address[1], 20,
+                                 2, webhook_load.ssl_context(),
+                                 cmk_percent=50)
+    finally:
+        stop_webhook_server(server)
+    assert stats["errors"] == 0
+    counts = {p: webhook.request_duration.get_count(path=p) - before[p]
+              for p in paths}
+    assert counts["skipped"] == counts["failed"] == 0
+    assert counts["fast"] + counts["mutated"] == 20
+
+
+def test_webhook_server_metrics():
+    server = start_webhook_server("threaded")
+    port = server.server_address[1]
+    mutated = webhook.admissions.get(result="mutated")
+    skipped = webhook.admissions.get(result="skipped")
+    requests = webhook.request_duration.get_count(path="mutated")
+    failures = webhook.tls_handshake_failures.get()
+    try:
+        stats = webhook_load.run("127.0.0.1", port, 2, 1,
+                                 webhook_load.ssl_context(), cmk_percent=100)
+        assert stats["errors"] == 0
+        stats = webhook_load.run("127.0.0.1", port, 1, 1,
+                                 webhook_load.ssl_context(), cmk_percent=0)
+        assert stats["errors"] == 0
+
+        # Not a TLS client.
+        with socket.create_connection(("127.0.0.1", port)) as sock:
+            sock.sendall(b"GET /metrics HTTP/1.1\r\n\r\n")
+            sock.recv(1024)
+        for _ in range(50):
+            if webhook.tls_handshake_failures.get() > failures:
+                break
+            time.sleep(0.1)
+
+        conn = http.client.HTTPSConnection("127.0.0.1", port,
+                                           context=webhook_load.ssl_context())
+        conn.request("GET", "/metrics")
+        response = conn.getresponse()
+        body = response.read().decode('utf-8')
+        conn.close()
+    finally:
+        stop_webhook_server(server)
+
+    assert response.status == 200
+    assert response.getheader("Content-Type").startswith("text/plain")
+    samples = dict(line.rsplit(" ", 1) for line in body.splitlines()
+                   if not line.startswith("#"))
+    assert int(samples['cmk_webhook_admissions_total{result="mutated"}']) \
+        == mutated + 2
+    assert int(samples['cmk_webhook_admissions_total{result="skipped"}']) \
+        == skipped + 1
+    assert int(samples['cmk_webhook_request_duration_seconds_count'
+                       '{path="mutated"}']) == requests + 2
+    assert int(samples['cmk_webhook_mutation_duration_seconds_count']) >= 2
+    assert int(samples['cmk_webhook_patch_duration_seconds_count']) >= 2
+    assert int(samples['cmk_webhook_tls_handshake_failures_total']) == \
+        failures + 1